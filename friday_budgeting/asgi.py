@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'friday_budgeting.settings')
 
 application = get_asgi_application()
+
+# Charts of users are drawn in the background by the server processes
+from sms_app.visualizations.prerender import start_prerenderer
+start_prerenderer()
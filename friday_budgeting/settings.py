@@ -145,3 +145,109 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Conversation compaction
+# Messages older than the window are folded into summaries and archived
+
+CONV_COMPACTION_WINDOW_DAYS = int(os.getenv('CONV_COMPACTION_WINDOW_DAYS', '30'))
+
+# Latest messages of each user that are never compacted, whatever their age
+CONV_COMPACTION_KEEP_MESSAGES = int(os.getenv('CONV_COMPACTION_KEEP_MESSAGES', '20'))
+
+
+# Inbound sms processing
+# Received messages are queued and processed by the process_sms_queue worker,
+# set SMS_PROCESS_INLINE to process them inside the webhook instead
+
+SMS_PROCESS_INLINE = os.getenv('SMS_PROCESS_INLINE', 'False') == 'True'
+
+# Number of users the worker processes messages for at the same time
+SMS_WORKER_THREADS = int(os.getenv('SMS_WORKER_THREADS', '8'))
+
+# Seconds the worker waits before checking an empty queue again
+SMS_WORKER_POLL_INTERVAL = float(os.getenv('SMS_WORKER_POLL_INTERVAL', '0.5'))
+
+# Seconds a worker may take to process a message before it is taken for dead and the
+# message is queued again, must be longer than the slowest message
+SMS_WORKER_LEASE_SECONDS = float(os.getenv('SMS_WORKER_LEASE_SECONDS', '300'))
+
+
+# Outbound sms
+
+# Class that sends the messages, MemoryTransport keeps them in memory instead
+SMS_TRANSPORT = os.getenv('SMS_TRANSPORT', 'sms_app.sms_utilities.messaging.TwilioTransport')
+
+# Point this at a fake server (see the run_fake_twilio command) to test without Twilio
+TWILIO_API_BASE_URL = os.getenv('TWILIO_API_BASE_URL', 'https://api.twilio.com')
+
+# Number of recipients sent to at the same time, also the http connection pool size
+SMS_SENDER_THREADS = int(os.getenv('SMS_SENDER_THREADS', '8'))
+
+# Times a failed send is retried, waiting SMS_SEND_BACKOFF seconds doubled each attempt
+SMS_SEND_RETRIES = int(os.getenv('SMS_SEND_RETRIES', '3'))
+SMS_SEND_BACKOFF = float(os.getenv('SMS_SEND_BACKOFF', '0.5'))
+
+
+# Intent classification cache
+
+# Number of intents kept in the memory of each process
+INTENT_CACHE_SIZE = int(os.getenv('INTENT_CACHE_SIZE', '1024'))
+
+# Seconds a cached intent stays valid, in memory and in the database
+INTENT_CACHE_TTL = int(os.getenv('INTENT_CACHE_TTL', '604800'))
+
+# Share the cached intents between workers through the database
+INTENT_CACHE_USE_DB = os.getenv('INTENT_CACHE_USE_DB', 'True') == 'True'
+
+
+# Local intent classification
+# Messages the local classifier is at least this confident about skip the remote classifier,
+# set above 1 to always use the remote classifier
+
+INTENT_LOCAL_THRESHOLD = float(os.getenv('INTENT_LOCAL_THRESHOLD', '0.8'))
+
+
+# Language model calls
+
+# Most calls made at the same time for one message, like classifying the items of a transaction
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '5'))
+
+# Language model backend used by gpt3_utilities.response_utilities
+# LocalBackend answers offline with OPTIONS {'latency': seconds},
+# RecordReplayBackend serves answers captured to disk with OPTIONS
+# {'path': directory, 'mode': 'record' or 'replay', 'backend': backend to record}
+LLM_BACKEND = {
+    'BACKEND': os.getenv('LLM_BACKEND', 'sms_app.gpt3_utilities.backends.OpenAIBackend'),
+    'OPTIONS': {},
+}
+
+# Most tokens a prompt may use, older transactions and messages are summarized to fit.
+# Inquiry reply is the transaction list sent back as an sms
+PROMPT_TOKEN_BUDGETS = {
+    'Inquiry': int(os.getenv('INQUIRY_PROMPT_TOKENS', '1500')),
+    'Inquiry reply': int(os.getenv('INQUIRY_REPLY_TOKENS', '600')),
+    'Discussion': int(os.getenv('DISCUSSION_PROMPT_TOKENS', '1200')),
+}
+
+
+# Latency metrics
+
+# Messages that take at least this many seconds are logged with the time of each stage
+SLOW_MESSAGE_SECONDS = float(os.getenv('SLOW_MESSAGE_SECONDS', '5'))
+
+# Addresses allowed to read the metrics/ endpoint
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Port the process_sms_queue worker serves its metrics on locally, 0 to disable
+SMS_WORKER_METRICS_PORT = int(os.getenv('SMS_WORKER_METRICS_PORT', '0'))
+
+
+# Charts
+
+# Address Twilio reaches this server at, used to build the media url of charts
+PUBLIC_BASE_URL = os.getenv('PUBLIC_BASE_URL', 'http://localhost:8000')
+
+# Processes the server and process_sms_queue draw the charts of users with in the
+# background after their data changes, 0 to draw them when they are asked for
+CHART_PRERENDER_PROCESSES = int(os.getenv('CHART_PRERENDER_PROCESSES', '2'))
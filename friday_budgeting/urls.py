@@ -20,5 +20,7 @@ import sms_app.views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('sms/', sms_app.views.receive_msg)
+    path('sms/', sms_app.views.receive_msg),
+    path('metrics/', sms_app.views.metrics_view),
+    path('charts/<str:key>.png', sms_app.views.chart_view, name='chart')
 ]
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'friday_budgeting.settings')
 
 application = get_wsgi_application()
+
+# Charts of users are drawn in the background by the server processes
+from sms_app.visualizations.prerender import start_prerenderer
+start_prerenderer()
@@ -0,0 +1,201 @@
+# Django imports
+from django.db import connections
+from django.utils import timezone
+
+# System imports
+import datetime
+import decimal
+
+import numpy as np
+
+EPOCH = datetime.date(1970, 1, 1)
+SECONDS_PER_DAY = 86400
+
+
+def to_epoch_day(date):
+    return (date - EPOCH).days
+
+def from_epoch_day(day):
+    return EPOCH + datetime.timedelta(days=int(day))
+
+def to_month_index(year, month):
+    """
+    Months since January 1970, the labels of monthly series
+    """
+    return (year - 1970) * 12 + month - 1
+
+def from_month_index(month_index):
+    """
+    Returns the (year, month) of a month index
+    """
+    return 1970 + int(month_index) // 12, int(month_index) % 12 + 1
+
+def to_dollars(cents):
+    return np.asarray(cents) / 100
+
+
+class SpendingSeries(object):
+    """
+    Transactions of a user over a range of days held as arrays, one entry per transaction
+    days are days since 1970-01-01 in the current timezone (int32), cents the amounts
+    in cents (int64) and codes the index of their category in categories
+    Series are grids of cents with a row per category and a column per day, week or month
+    """
+    def __init__(self, start_date, end_date, days, cents, codes, categories):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.start_day = to_epoch_day(start_date)
+        self.end_day = to_epoch_day(end_date)
+        self.days = days
+        self.cents = cents
+        self.codes = codes
+        self.categories = categories
+
+    # -----------------------
+    # Static Public functions
+    # -----------------------
+
+    def load(user, start_date, end_date, category='All'):
+        """
+        Loads the transactions of the user from start_date to end_date (exclusive)
+        """
+        start = timezone.make_aware(datetime.datetime.combine(start_date, datetime.time()))
+        end = timezone.make_aware(datetime.datetime.combine(end_date, datetime.time()))
+
+        query_set = (user.get_transactions_in_range(start, end, category)
+                         .values_list('timestamp', 'amount', 'transaction_cat'))
+
+        # Fetched without the ORM's per value conversions, the arrays are converted at once
+        sql, params = query_set.query.sql_with_params()
+        with connections[query_set.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        return SpendingSeries.from_rows(start_date, end_date, rows)
+
+    def load_month(user, year, month):
+        start_date = datetime.date(year, month, 1)
+        if month == 12:
+            end_date = datetime.date(year + 1, 1, 1)
+        else:
+            end_date = datetime.date(year, month + 1, 1)
+        return SpendingSeries.load(user, start_date, end_date)
+
+    def from_rows(start_date, end_date, rows):
+        """
+        Makes the arrays from (timestamp, amount, category) rows
+        Timestamps without a timezone are in utc like the database stores them
+        """
+        if not rows:
+            return SpendingSeries(start_date, end_date,
+                                  np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64),
+                                  np.zeros(0, dtype=np.int32), [])
+
+        timestamps, amounts, category_names = zip(*rows)
+
+        days = SpendingSeries._get_local_days(timestamps)
+        cents = np.rint(np.array(amounts, dtype=np.float64) * 100).astype(np.int64)
+        # Codes in order of appearance, then renumbered so categories are sorted
+        code_dict = dict()
+        codes = np.fromiter((code_dict.setdefault(name, len(code_dict)) for name in category_names),
+                            dtype=np.int32, count=len(category_names))
+        categories = sorted(code_dict)
+        sorted_codes = np.array([categories.index(name) for name in code_dict], dtype=np.int32)
+
+        return SpendingSeries(start_date, end_date, days, cents, sorted_codes[codes], categories)
+
+    # -----------------------
+    # Public Instance Methods
+    # -----------------------
+
+    def get_num_days(self):
+        return self.end_day - self.start_day
+
+    def get_daily(self, cumulative=False):
+        """
+        Returns the epoch day of each column and the cents spent per category each day
+        """
+        labels = np.arange(self.start_day, self.end_day, dtype=np.int32)
+        grid = self._get_grid(self.days - self.start_day, len(labels))
+        if cumulative:
+            grid = np.cumsum(grid, axis=1)
+        return labels, grid
+
+    def get_weekly(self, cumulative=False):
+        """
+        Returns the epoch day of the monday of each column and the cents spent
+        per category each week
+        """
+        # 1970-01-01 was a thursday
+        first_week = (self.start_day + 3) // 7
+        last_week = (self.end_day - 1 + 3) // 7
+        labels = (np.arange(first_week, last_week + 1, dtype=np.int32) * 7 - 3)
+        grid = self._get_grid((self.days + 3) // 7 - first_week, len(labels))
+        if cumulative:
+            grid = np.cumsum(grid, axis=1)
+        return labels, grid
+
+    def get_monthly(self, cumulative=False):
+        """
+        Returns the month index of each column and the cents spent per category each month
+        """
+        first_month = to_month_index(self.start_date.year, self.start_date.month)
+        last_date = self.end_date - datetime.timedelta(days=1)
+        last_month = to_month_index(last_date.year, last_date.month)
+
+        labels = np.arange(first_month, last_month + 1, dtype=np.int32)
+        months = self.days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int32)
+        grid = self._get_grid(months - first_month, len(labels))
+        if cumulative:
+            grid = np.cumsum(grid, axis=1)
+        return labels, grid
+
+    def get_category_totals(self):
+        """
+        Returns a dict of category name to the total spent
+        """
+        totals = np.bincount(self.codes, weights=self.cents, minlength=len(self.categories))
+        return dict((name, decimal.Decimal(int(round(total))) / 100)
+                    for name, total in zip(self.categories, totals))
+
+    def get_total(self):
+        return decimal.Decimal(int(self.cents.sum())) / 100
+
+    # ------------------------
+    # Private helper functions
+    # ------------------------
+
+    def _get_grid(self, buckets, num_buckets):
+        """
+        Sums the cents of the transactions by category and bucket
+        """
+        grid_size = len(self.categories) * num_buckets
+        if grid_size == 0:
+            return np.zeros((len(self.categories), num_buckets), dtype=np.int64)
+
+        index = self.codes.astype(np.int64) * num_buckets + buckets
+        # Sums of whole cents are exact in float64 well past any budget
+        grid = np.bincount(index, weights=self.cents, minlength=grid_size)
+        return np.rint(grid).astype(np.int64).reshape(len(self.categories), num_buckets)
+
+    def _get_local_days(timestamps):
+        """
+        Converts utc datetimes to days since the epoch in the current timezone
+        The utc offset is looked up once per distinct hour instead of per transaction
+        """
+        if timezone.is_aware(timestamps[0]):
+            timestamps = [timezone.make_naive(timestamp, datetime.timezone.utc) for timestamp in timestamps]
+        # Much faster than letting numpy convert the datetimes
+        epoch_ordinal = EPOCH.toordinal()
+        seconds = np.fromiter(((timestamp.toordinal() - epoch_ordinal) * SECONDS_PER_DAY +
+                               timestamp.hour * 3600 + timestamp.minute * 60 + timestamp.second
+                               for timestamp in timestamps),
+                              dtype=np.int64, count=len(timestamps))
+
+        hours, inverse = np.unique(seconds // 3600, return_inverse=True)
+        current_timezone = timezone.get_current_timezone()
+        offsets = np.array([datetime.datetime.fromtimestamp(hour * 3600, current_timezone)
+                                             .utcoffset().total_seconds()
+                            for hour in hours.tolist()], dtype=np.int64)
+
+        return ((seconds + offsets[inverse]) // SECONDS_PER_DAY).astype(np.int32)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SmsAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sms_app'
+
+    def ready(self):
+        # Connects the receiver rerendering charts when the data of a user changes
+        import sms_app.visualizations.prerender
@@ -0,0 +1,217 @@
+# Django imports
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import django
+
+# System imports
+import datetime
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+
+# local imports
+import sms_app.sms_utilities.messaging as msgutil
+from sms_app.models import User, Transaction, ConvMsg
+from sms_app.gpt3_utilities.backends import LocalBackend, set_backend
+from sms_app.views import process_msg
+from sms_app.visualizations.prerender import ChartPrerenderer, set_prerenderer
+
+# Items of the synthetic transactions by category
+ITEMS = {
+    'Housing': ['Rent', 'Electricity', 'Internet', 'Water'],
+    'Transportation': ['Gas', 'Bus pass', 'Uber', 'Parking'],
+    'Food': ['Coffee', 'Groceries', 'Pizza', 'Sushi', 'Bagel'],
+    'Entertainment': ['Movie', 'Concert', 'Netflix', 'Games'],
+    'Supplies': ['Paper towels', 'Soap', 'Batteries'],
+    'Clothing': ['Shoes', 'Jacket', 'Socks'],
+    'Health': ['Vitamins', 'Dentist', 'Gym'],
+}
+LOCATIONS = ['Walmart', 'Starbucks', 'Costco', 'Amazon', 'Target', 'Shell']
+
+# Messages of the synthetic conversations
+CONVERSATION_MSGS = [
+    'I spent $12 at Starbucks on coffee',
+    'How much do I have left?',
+    'Any tips on saving for a trip?',
+    'Set my food budget to 400 dollars',
+    'Thanks Friday!',
+]
+
+# Messages of the process_msg benchmark, one of each kind of request
+TURN_MSGS = [
+    'I spent $23 at Walmart on groceries',
+    'How much have I spent this month?',
+    'Can you give me some advice on saving money?',
+    'Set my budget for Food to 500 dollars',
+]
+
+# Budgets modify_categories_from_dict switches between so every run changes something
+BUDGETS = [
+    {'Housing': '1500', 'Transportation': '200', 'Food': '400', 'Entertainment': 'N/A',
+     'Supplies': 'N/A', 'Clothing': '100', 'Health': 'N/A'},
+    {'Housing': '1500', 'Transportation': '250', 'Food': '450', 'Entertainment': '80',
+     'Supplies': 'N/A', 'Clothing': '100', 'Travel': '300'},
+]
+
+
+############################
+# Synthetic data
+############################
+def make_user(phone_number, num_transactions, num_messages, seed=0, chunk_size=5000):
+    """
+    Makes a user with default categories, num_transactions transactions over
+    the past year and a conversation num_messages long
+    """
+    rand = random.Random(seed)
+
+    user = User(phone_number=phone_number, name='Bench', state=User.DIS)
+    user.save()
+    user.setup_default_categories()
+
+    today = timezone.localdate()
+    categories = list(ITEMS.keys())
+    chunk = list()
+    for i in range(num_transactions):
+        category = rand.choice(categories)
+        date = today - datetime.timedelta(days=rand.randrange(365))
+        chunk.append(Transaction.build_transaction(phone_number,
+                                                   rand.choice(ITEMS[category]),
+                                                   category,
+                                                   round(rand.uniform(1, 200), 2),
+                                                   rand.choice(LOCATIONS),
+                                                   date.strftime('%m-%d-%Y')))
+        if len(chunk) >= chunk_size:
+            user.add_transactions(chunk)
+            chunk = list()
+    if chunk:
+        user.add_transactions(chunk)
+
+    for start in range(0, num_messages, chunk_size):
+        msgs = list()
+        for i in range(start, min(start + chunk_size, num_messages)):
+            if i % 2 == 0:
+                msgs.append(ConvMsg(user=user, message=rand.choice(CONVERSATION_MSGS), author=user.name,
+                                    phone_number=phone_number))
+            else:
+                msgs.append(ConvMsg(user=user, message='Sounds good!', author=ConvMsg.FRIDAY,
+                                    phone_number=phone_number))
+        ConvMsg.objects.bulk_create(msgs)
+
+    return user
+
+
+############################
+# Measuring
+############################
+def measure(func, repeat=5):
+    """
+    Times func over repeat runs, then runs it once more to count its queries
+    and its peak memory, which would slow down the timed runs
+    """
+    seconds = list()
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as context:
+            func()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {'Seconds median': statistics.median(seconds),
+            'Seconds min': min(seconds),
+            'Queries': len(context.captured_queries),
+            'Peak memory': peak_memory}
+
+def run_benchmarks(sizes=(1000, 10000, 100000), num_messages=5000, repeat=5, log=None):
+    """
+    Benchmarks the ledger and message pipeline for a user of each size,
+    the language model and sms are answered in memory
+    Returns the results as a json serializable dict
+    """
+    set_backend(LocalBackend())
+    transport = msgutil.MemoryTransport()
+    msgutil.set_sender(msgutil.OutboundSender(transport, max_workers=1, retries=0))
+    # Charts are drawn when asked for so background renders don't skew the timings
+    set_prerenderer(ChartPrerenderer(0))
+
+    month = timezone.localdate().month
+    results = list()
+
+    for size in sizes:
+        phone_number = '+1999%07d' % size
+        start = time.perf_counter()
+        user = make_user(phone_number, size, num_messages, seed=size)
+        if log is not None:
+            log('Made user with %s transactions and %s messages in %.1fs' %
+                (size, num_messages, time.perf_counter() - start))
+
+        budgets = iter(BUDGETS * (repeat + 1))
+
+        def process_turns():
+            # Every kind of request in each run so runs are comparable
+            for msg in TURN_MSGS:
+                process_msg(msg, phone_number)
+            msgutil.flush_messages()
+
+        cases = [
+            ('get_category_info_list', lambda: user.get_category_info_list(month)),
+            ('get_recent_transactions_dict', lambda: user.get_recent_transactions_dict(month, 'All')),
+            ('get_conversation limit 20', lambda: user.get_conversation(limit=20)),
+            ('get_conversation', lambda: user.get_conversation()),
+            ('modify_categories_from_dict', lambda: user.modify_categories_from_dict(next(budgets))),
+            ('process_msg %s turns' % len(TURN_MSGS), process_turns),
+        ]
+
+        for name, func in cases:
+            result = {'Name': name, 'Transactions': size, 'Messages': num_messages}
+            result.update(measure(func, repeat))
+            results.append(result)
+            if log is not None:
+                log(format_result(result))
+
+        # Leave the database as it was for the next size, the user's rows are deleted with it
+        user.delete()
+
+    return {'Info': {'Date': timezone.now().isoformat(),
+                     'Python': platform.python_version(),
+                     'Django': django.get_version(),
+                     'Database': connection.vendor,
+                     'Repeat': repeat},
+            'Results': results}
+
+
+############################
+# Reporting
+############################
+def format_result(result):
+    return ('%-30s %7s transactions  %9.2fms  %5s queries  %9.1fKB' %
+            (result['Name'], result['Transactions'], result['Seconds median'] * 1000,
+             result['Queries'], result['Peak memory'] / 1024))
+
+def compare_results(old_results, new_results):
+    """
+    Lines comparing the median time and queries of two runs, for the benchmarks in both
+    """
+    old_dict = dict(((result['Name'], result['Transactions']), result)
+                    for result in old_results['Results'])
+
+    lines = list()
+    for result in new_results['Results']:
+        old = old_dict.get((result['Name'], result['Transactions']))
+        if old is None:
+            continue
+
+        ratio = result['Seconds median'] / old['Seconds median'] if old['Seconds median'] else 0
+        lines.append('%-30s %7s transactions  %9.2fms -> %9.2fms (x%.2f)  %5s -> %5s queries' %
+                     (result['Name'], result['Transactions'],
+                      old['Seconds median'] * 1000, result['Seconds median'] * 1000, ratio,
+                      old['Queries'], result['Queries']))
+    return lines
@@ -0,0 +1,84 @@
+# Django imports
+from django.utils import timezone
+
+# System imports
+import calendar
+import decimal
+
+import numpy as np
+
+# local imports
+from sms_app.analytics import to_month_index
+from sms_app.models import SpendingCurve
+
+
+def get_month_forecast(curve, date):
+    """
+    Projects the spending of each category at the end of the month of date
+    What is usually spent after this day of the month, from the history of the curve,
+    is added to what was spent so far. Categories without history keep their pace
+    Returns a dict of category name to a dict of the 'Spent' and 'Projected' dollars
+    """
+    month = to_month_index(date.year, date.month)
+    if curve.month < month:
+        # Not saved, the next transaction moves the month for good
+        curve.start_month(month)
+
+    categories = sorted(set(curve.history) | set(curve.current))
+    if not categories:
+        return dict()
+
+    empty_list = [0] * SpendingCurve.DAYS
+    history = np.array([curve.history.get(name, empty_list) for name in categories], dtype=np.float64)
+    current = np.array([curve.current.get(name, empty_list) for name in categories], dtype=np.float64)
+
+    num_days = calendar.monthrange(date.year, date.month)[1]
+    # Months of history of each category, from its first transaction
+    num_months = np.array([curve.month - curve.first_months.get(name, curve.first_month)
+                           for name in categories], dtype=np.float64)
+
+    spent = current.sum(axis=1)
+    history_total = history.sum(axis=1)
+    has_history = (history_total > 0) & (num_months > 0)
+
+    # Share of a month's spending that comes after today
+    rest_share = np.divide(history[:, date.day:num_days].sum(axis=1), history_total,
+                           out=np.zeros(len(categories)), where=has_history)
+    monthly_average = history_total / np.maximum(num_months, 1)
+
+    projected = np.where(has_history,
+                         spent + monthly_average * rest_share,
+                         spent * num_days / date.day)
+
+    return dict((name, {'Spent': _to_dollars(spent_cents), 'Projected': _to_dollars(projected_cents)})
+                for name, spent_cents, projected_cents in zip(categories, spent.tolist(), projected.tolist()))
+
+def add_pacing(user, budget_list, date=None):
+    """
+    Adds the projected month end spending and the pacing status, like
+    'On track to overspend Food by $80.00', to the budgeted categories of a list
+    from User.get_category_info_list of the month of date
+    """
+    if date is None:
+        date = timezone.localdate()
+
+    forecast_dict = get_month_forecast(SpendingCurve.get_for_user(user), date)
+
+    for info_dict in budget_list:
+        if 'Allocated Budget' not in info_dict:
+            continue
+
+        name = info_dict['Category']
+        budget = decimal.Decimal(str(info_dict['Allocated Budget']))
+        projected = forecast_dict.get(name, {'Projected': decimal.Decimal(0)})['Projected']
+
+        info_dict['Projected at month end'] = float(projected)
+        if projected > budget:
+            info_dict['Pacing'] = 'On track to overspend %s by $%.2f' % (name, projected - budget)
+        else:
+            info_dict['Pacing'] = 'On track to stay $%.2f under budget' % (budget - projected)
+
+    return budget_list
+
+def _to_dollars(cents):
+    return decimal.Decimal(int(round(cents))) / 100
@@ -0,0 +1,228 @@
+# Django imports
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# System imports
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+# local imports
+import sms_app.metrics as metrics
+
+# Backend shared by the whole process, made on first use
+_BACKEND = None
+_BACKEND_LOCK = threading.Lock()
+
+
+class LLMBackendError(Exception):
+    """
+    Raised when a backend can't answer a call
+    """
+    pass
+
+
+class LLMBackend(object):
+    """
+    Interface of the language model used by response_utilities
+    complete takes the arguments of a completion and returns its text,
+    classify takes the arguments of a classification and returns its label
+    """
+    def complete(self, **params):
+        raise NotImplementedError
+
+    def classify(self, **params):
+        raise NotImplementedError
+
+
+class OpenAIBackend(LLMBackend):
+    """
+    Calls the OpenAI API
+    """
+    def __init__(self, api_key=None):
+        import openai
+
+        self.openai = openai
+        self.openai.api_key = api_key or os.getenv('OPENAI_API_KEY')
+
+    def complete(self, **params):
+        response = self.openai.Completion.create(**params)
+        return response['choices'][0]['text']
+
+    def classify(self, **params):
+        response = self.openai.Classification.create(**params)
+        return response['label']
+
+
+class LocalBackend(LLMBackend):
+    """
+    Deterministic offline backend for load tests and benchmarks
+    Answers are made from the prompt alone, after sleeping latency seconds
+    Completions that get parsed by response_utilities get an answer in the right format
+    """
+    def __init__(self, latency=0.0, completion_text="I'm here to help you reach your budgeting goals!"):
+        self.latency = latency
+        self.completion_text = completion_text
+
+    def complete(self, **params):
+        self._wait()
+
+        prompt = params['prompt'].rstrip()
+        last_input = self._get_last_value(prompt, 'Sentence:')
+
+        if prompt.endswith('List:'):
+            return self._complete_transaction_list(last_input)
+        elif prompt.endswith('Name:'):
+            return self._complete_name(last_input)
+        elif prompt.endswith('Output:'):
+            return self._complete_budget(self._get_last_value(prompt, 'Categories:'))
+
+        return self.completion_text
+
+    def classify(self, **params):
+        """
+        Picks the label whose examples share the most words with the query
+        """
+        self._wait()
+
+        labels = params['labels']
+        query_words = set(LocalBackend._get_words(params['query']))
+
+        scores = dict((label, 0) for label in labels)
+        for text, label in params.get('examples', []):
+            if label in scores:
+                scores[label] += len(query_words & set(LocalBackend._get_words(text)))
+        for label in labels:
+            # A label named in the query counts as well
+            scores[label] += 2 * len(query_words & set(LocalBackend._get_words(label)))
+
+        # Ties go to the first label
+        return max(labels, key=lambda label: scores[label])
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _get_last_value(self, prompt, key):
+        value = None
+        for line in prompt.split('\n'):
+            if line.startswith(key):
+                value = line[len(key):].strip()
+        return value or ''
+
+    def _complete_transaction_list(self, sentence):
+        today = datetime.date.today().strftime('%m-%d-%Y')
+        amounts = re.findall(r'\d+(?:\.\d+)?', sentence)
+        item = re.search(r'\b(?:bought|got|on|for)\s+(?:a |an |some )?([A-Za-z]+)', sentence)
+        location = re.search(r'\bat\s+([A-Za-z]+)', sentence)
+
+        transaction = {'Item': item.group(1).capitalize() if item else '?',
+                       'Amount': float(amounts[0]) if amounts else '?',
+                       'Location': location.group(1) if location else 'Store',
+                       'Date': today}
+        return ' %s' % [transaction]
+
+    def _complete_name(self, sentence):
+        words = LocalBackend._get_words(sentence)
+        if not words:
+            return ' None'
+        return ' %s' % words[-1].capitalize()
+
+    def _complete_budget(self, categories):
+        try:
+            category_dict = json.loads(categories)
+        except ValueError:
+            category_dict = dict()
+        return ' %s' % json.dumps({'Categories': category_dict,
+                                   'Response': 'Your budget has been updated!'})
+
+    def _get_words(text):
+        return re.findall(r'[a-z0-9]+', str(text).lower())
+
+
+class RecordReplayBackend(LLMBackend):
+    """
+    Saves the answers of another backend to disk and serves them back
+    In record mode calls go to backend and the answers are saved under path,
+    in replay mode answers are read from path and a missing one is an error
+    Prompts that contain the date only replay on the day they were recorded
+    """
+    RECORD = 'record'
+    REPLAY = 'replay'
+
+    def __init__(self, path, mode=REPLAY, backend=None, backend_options=None):
+        self.path = path
+        self.mode = mode
+        self.backend = None
+
+        if mode == RecordReplayBackend.RECORD:
+            if backend is None:
+                raise LLMBackendError('Recording needs a backend to record')
+            self.backend = import_string(backend)(**(backend_options or {}))
+            os.makedirs(path, exist_ok=True)
+
+    def complete(self, **params):
+        return self._call('complete', params)
+
+    def classify(self, **params):
+        return self._call('classify', params)
+
+    def _call(self, kind, params):
+        key = self._get_key(kind, params)
+        file_path = os.path.join(self.path, '%s.json' % key)
+
+        if self.mode == RecordReplayBackend.REPLAY:
+            try:
+                with open(file_path) as record_file:
+                    return json.load(record_file)['result']
+            except FileNotFoundError:
+                raise LLMBackendError('No recorded %s for %s' % (kind, key))
+
+        result = getattr(self.backend, kind)(**params)
+        with open(file_path, 'w') as record_file:
+            json.dump({'kind': kind, 'params': params, 'result': result}, record_file, indent=2)
+        return result
+
+    def _get_key(self, kind, params):
+        data = json.dumps({'kind': kind, 'params': params}, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class TimedBackend(LLMBackend):
+    """
+    Times the calls of another backend as llm_complete and llm_classify stages
+    """
+    def __init__(self, backend):
+        self.backend = backend
+
+    def complete(self, **params):
+        with metrics.span('llm_complete'):
+            return self.backend.complete(**params)
+
+    def classify(self, **params):
+        with metrics.span('llm_classify'):
+            return self.backend.classify(**params)
+
+
+def get_backend():
+    """
+    Gets the backend of the process, made from LLM_BACKEND on first use
+    """
+    global _BACKEND
+    with _BACKEND_LOCK:
+        if _BACKEND is None:
+            backend_class = import_string(settings.LLM_BACKEND['BACKEND'])
+            _BACKEND = TimedBackend(backend_class(**settings.LLM_BACKEND.get('OPTIONS', {})))
+        return _BACKEND
+
+def set_backend(backend):
+    """
+    Replaces the backend of the process, used by benchmarks
+    """
+    global _BACKEND
+    with _BACKEND_LOCK:
+        _BACKEND = TimedBackend(backend)
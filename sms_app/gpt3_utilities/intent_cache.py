@@ -0,0 +1,153 @@
+# Django imports
+from django.conf import settings
+from django.utils import timezone
+
+# System imports
+import collections
+import datetime
+import hashlib
+import logging
+import re
+import threading
+import time
+
+# local imports
+from sms_app.models import IntentCacheEntry
+
+LOGGER = logging.getLogger('friday_logger')
+
+# Amounts like $1,200.50 and plain numbers
+NUMBER_PATTERN = re.compile(r'\$?\d[\d,]*(\.\d+)?')
+NUMBER_MASK = '<num>'
+# Anything that isn't a word or the number mask
+PUNCTUATION_PATTERN = re.compile(r'[^\w<>]+')
+
+# Cache shared by the whole process, made on first use
+_INTENT_CACHE = None
+_INTENT_CACHE_LOCK = threading.Lock()
+
+
+def normalize_text(text):
+    """
+    Folds case, punctuation and whitespace and masks numbers
+    so that rephrasings that classify the same share a key
+    """
+    text = text.casefold()
+    text = NUMBER_PATTERN.sub(' %s ' % NUMBER_MASK, text)
+    text = PUNCTUATION_PATTERN.sub(' ', text)
+    return ' '.join(text.split())
+
+
+class IntentCache(object):
+    """
+    Two tier cache of message intents
+    An in process LRU with a ttl in front of the IntentCacheEntry table
+    """
+    def __init__(self, max_size=1024, ttl=86400, use_db=True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.use_db = use_db
+
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        # key to (label, expiry time)
+        self._lru = collections.OrderedDict()
+
+    def get_or_classify(self, text, classify):
+        """
+        Returns the cached intent of text, calls classify(text) and caches it on a miss
+        """
+        normalized_text = normalize_text(text)
+        key = hashlib.sha256(normalized_text.encode('utf-8')).hexdigest()
+
+        label = self._get_local(key)
+        if label is not None:
+            return label
+
+        label = self._get_db(key)
+        if label is not None:
+            with self._lock:
+                self.db_hits += 1
+            self._set_local(key, label)
+            return label
+
+        with self._lock:
+            self.misses += 1
+
+        label = classify(text)
+        self._set_local(key, label)
+        self._set_db(key, normalized_text, label)
+        return label
+
+    def get_stats(self):
+        with self._lock:
+            return {'Hits': self.hits,
+                    'DB hits': self.db_hits,
+                    'Misses': self.misses,
+                    'Size': len(self._lru)}
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+
+    def _get_local(self, key):
+        with self._lock:
+            item = self._lru.get(key)
+            if item is None:
+                return None
+
+            label, expiry = item
+            if expiry < time.monotonic():
+                del self._lru[key]
+                return None
+
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return label
+
+    def _set_local(self, key, label):
+        with self._lock:
+            self._lru[key] = (label, time.monotonic() + self.ttl)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_size:
+                self._lru.popitem(last=False)
+
+    def _get_db(self, key):
+        if not self.use_db:
+            return None
+
+        oldest = timezone.now() - datetime.timedelta(seconds=self.ttl)
+        try:
+            entry = IntentCacheEntry.objects.get(key=key, updated_timestamp__gte=oldest)
+        except IntentCacheEntry.DoesNotExist:
+            return None
+
+        return entry.label
+
+    def _set_db(self, key, normalized_text, label):
+        if not self.use_db:
+            return
+
+        # The cache is only an optimization, never fail the message because of it
+        try:
+            IntentCacheEntry.objects.update_or_create(key=key,
+                                                      defaults={'normalized_text': normalized_text,
+                                                                'label': label})
+        except Exception as e:
+            LOGGER.warning('Could not save intent cache entry: %s' % e)
+
+
+def get_intent_cache():
+    """
+    Gets the intent cache of the process, made from the settings on first use
+    """
+    global _INTENT_CACHE
+    with _INTENT_CACHE_LOCK:
+        if _INTENT_CACHE is None:
+            _INTENT_CACHE = IntentCache(max_size=settings.INTENT_CACHE_SIZE,
+                                        ttl=settings.INTENT_CACHE_TTL,
+                                        use_db=settings.INTENT_CACHE_USE_DB)
+        return _INTENT_CACHE
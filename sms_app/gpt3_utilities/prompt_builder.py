@@ -0,0 +1,112 @@
+# System imports
+import math
+import re
+
+# Words, numbers and single punctuation marks, roughly what the tokenizer splits on
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+
+def estimate_tokens(text):
+    """
+    Estimates the number of tokens of text without calling the API
+    Long words count as one token every 4 characters like the GPT tokenizer
+    """
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in TOKEN_PATTERN.findall(text))
+
+
+class PromptBuilder(object):
+    """
+    Assembles a prompt that fits in a token budget
+    Text sections are always kept, item sections are trimmed from their oldest
+    items and the dropped items replaced by a summary when they don't fit
+    """
+    def __init__(self, max_tokens):
+        self.max_tokens = max_tokens
+        # List of ('Text', text) and ('Items', (items, render, summarize))
+        self.sections = list()
+
+    def add_text(self, text):
+        """
+        Adds text that is always kept
+        """
+        self.sections.append(('Text', text))
+
+    def add_items(self, items, render, summarize=None):
+        """
+        Adds items, oldest first, that are trimmed if the prompt is too long
+        render(item) gives the text of an item and summarize(dropped_items)
+        the text that stands in for the dropped ones
+        """
+        self.sections.append(('Items', (list(items), render, summarize)))
+
+    def build(self):
+        """
+        Returns the prompt and a report of what was trimmed
+        Item sections get the budget left by the text sections in the order they were added
+        """
+        tokens_left = self.max_tokens
+        for kind, content in self.sections:
+            if kind == 'Text':
+                tokens_left -= estimate_tokens(content)
+
+        report = {'Budget': self.max_tokens,
+                  'Items kept': 0,
+                  'Items dropped': 0,
+                  'Tokens trimmed': 0}
+
+        prompt = ''
+        for kind, content in self.sections:
+            if kind == 'Text':
+                prompt += content
+                continue
+
+            items, render, summarize = content
+            text, tokens_used = self._fit_items(items, render, summarize, tokens_left, report)
+            prompt += text
+            tokens_left -= tokens_used
+
+        report['Tokens'] = estimate_tokens(prompt)
+        return prompt, report
+
+    def _fit_items(self, items, render, summarize, tokens_left, report):
+        """
+        Keeps the newest items that fit with the summary of the rest
+        """
+        texts = [render(item) for item in items]
+        tokens = [estimate_tokens(text) for text in texts]
+
+        if sum(tokens) <= tokens_left:
+            report['Items kept'] += len(items)
+            return ''.join(texts), sum(tokens)
+
+        # Drop the oldest items until the rest fits with room for the summary,
+        # the summary can grow as items are dropped so repeat until it fits
+        num_dropped = 0
+        kept_tokens = sum(tokens)
+        summary = ''
+        summary_tokens = 0
+        while True:
+            while num_dropped < len(items) and kept_tokens + summary_tokens > tokens_left:
+                kept_tokens -= tokens[num_dropped]
+                num_dropped += 1
+
+            if summarize is None:
+                break
+
+            summary = summarize(items[:num_dropped])
+            needed_tokens = estimate_tokens(summary)
+            if needed_tokens <= summary_tokens or num_dropped == len(items):
+                summary_tokens = needed_tokens
+                break
+            summary_tokens = needed_tokens
+
+        # Not even the summary fits
+        if kept_tokens + summary_tokens > tokens_left:
+            summary = ''
+            summary_tokens = 0
+
+        report['Items kept'] += len(items) - num_dropped
+        report['Items dropped'] += num_dropped
+        report['Tokens trimmed'] += sum(tokens[:num_dropped]) - summary_tokens
+
+        return summary + ''.join(texts[num_dropped:]), kept_tokens + summary_tokens
@@ -0,0 +1,83 @@
+# System imports
+import datetime
+import threading
+
+
+class PromptTemplate(object):
+    """
+    A prompt with %s placeholders split into its pieces once when it is made
+    The first placeholders can be filled from the date by date_args(date), that
+    prefix is rendered once per day so a request only adds its own arguments
+    """
+    def __init__(self, text, date_args=None, num_date_args=0):
+        self.pieces = text.split('%s')
+        self.date_args = date_args
+        self.num_date_args = num_date_args
+        self.num_args = len(self.pieces) - 1 - num_date_args
+
+        self._lock = threading.Lock()
+        self._prefix_date = None
+        self._prefix = None
+
+    def get_prefix(self, date=None):
+        """
+        Gets the part of the prompt before the first request argument
+        """
+        if self.num_date_args == 0:
+            return self.pieces[0]
+
+        if date is None:
+            date = datetime.date.today()
+
+        with self._lock:
+            if date != self._prefix_date:
+                values = self.date_args(date)
+                prefix = self.pieces[0]
+                for i in range(self.num_date_args):
+                    prefix += str(values[i]) + self.pieces[i + 1]
+                self._prefix = prefix
+                self._prefix_date = date
+            return self._prefix
+
+    def render(self, *args, date=None):
+        """
+        Fills the request arguments into the prompt
+        """
+        return self._render(self.get_prefix(date), args)
+
+    def render_many(self, arg_list, date=None):
+        """
+        Renders a prompt for each tuple of request arguments sharing one prefix,
+        for batched calls
+        """
+        prefix = self.get_prefix(date)
+        return [self._render(prefix, args) for args in arg_list]
+
+    def _render(self, prefix, args):
+        if len(args) != self.num_args:
+            raise ValueError('Prompt takes %s arguments, got %s' % (self.num_args, len(args)))
+
+        parts = [prefix]
+        for arg, piece in zip(args, self.pieces[self.num_date_args + 1:]):
+            parts.append(str(arg))
+            parts.append(piece)
+        return ''.join(parts)
+
+
+class PromptTemplateRegistry(object):
+    """
+    Prompt templates by name, each compiled once when registered
+    """
+    def __init__(self):
+        self._template_dict = dict()
+
+    def register(self, name, text, date_args=None, num_date_args=0):
+        template = PromptTemplate(text, date_args, num_date_args)
+        self._template_dict[name] = template
+        return template
+
+    def get(self, name):
+        return self._template_dict[name]
+
+
+PROMPT_TEMPLATES = PromptTemplateRegistry()
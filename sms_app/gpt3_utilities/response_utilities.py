@@ -1,15 +1,55 @@
 import ast
-import os
-import openai
 import logging
 import json
 import datetime
 
+from django.conf import settings
+
 from sms_app.models import User
+from sms_app.gpt3_utilities.intent_cache import get_intent_cache
+from sms_app.gpt3_utilities.backends import get_backend
+from sms_app.gpt3_utilities.prompt_builder import PromptBuilder
+from sms_app.gpt3_utilities.prompt_templates import PROMPT_TEMPLATES
 
 LOGGER = logging.getLogger('friday_logger')
 
-openai.apikey = os.getenv("OPENAI_API_KEY")
+# Examples the conversation category classifiers learn from
+CONVERSATION_CATEGORY_EXAMPLES = [
+    # More Info needed examples
+    #["I'd like to set up my budget", User.ASK],
+    #["I want to setup my budget", User.ASK],
+    #["Can I setup my budget?", User.ASK],
+    #["Can I set up my budget?", User.ASK],
+    #["Track a transaction", User.ASK],
+    #["Budget for me", User.ASK],
+    #["Make a budget", User.ASK],
+    #["I'm going to record a transaction", User.ASK],
+    #["Track some spending for me", User.ASK],
+    # Setup examples
+    ["Add a budget of 100 dollars for Transportation items", User.SET],
+    ["Make a new category for me called Health", User.SET],
+    ["Change my budget category Health to allow me to spend 56 dollars", User.SET],
+    # Transaction examples
+    ["I spent 10 dollars at McDonalds today", User.TRA],
+    ["I bought a brand new TV at BestBuy yesterday", User.TRA],
+    ["I got some sneakers for a friend yesterday, it cost about $200", User.TRA],
+    # Expense inquiry examples
+    ["What is my spending breakdown?", User.INQ],
+    ["What are my budget categories?", User.INQ],
+    ["How much have I spent for the past 30 days", User.INQ],
+    ["How much money do I have remaining in my total budget", User.INQ],
+    # Discussion
+    ["Tell me about yourself", User.DIS],
+    ["What does this app do?", User.DIS],
+    ["What are you?", User.DIS],
+    ["I love you so much", User.DIS],
+    ["How are you doing?", User.DIS],
+    ["I need someone to talk to", User.DIS],
+    ["Hey so I need some inspiration to start my day", User.DIS],
+    ["Do you have any advice for me to improve my spending habits?", User.DIS]
+]
+
+CONVERSATION_CATEGORY_LABELS = [User.DIS, User.SET, User.TRA, User.INQ]
 
 ################
 # Top Classifier
@@ -18,49 +58,23 @@ def determine_conversation_category(text):
     """
     Takes an input text and categorizes the intent of the query.
     Classes: Chat, Info, Setup, Transaction, & Expense inquiry.
+    Repeated phrasings are answered from the intent cache.
+    """
+    return get_intent_cache().get_or_classify(text, _classify_conversation_category)
+
+def _classify_conversation_category(text):
+    """
+    Asks the classifier for the intent of the text
     """
-    response = openai.Classification.create(
+    label = get_backend().classify(
         search_model="davinci",
         model="davinci",
         query=text,
-        examples=[
-            # More Info needed examples
-            #["I'd like to set up my budget", User.ASK],
-            #["I want to setup my budget", User.ASK],
-            #["Can I setup my budget?", User.ASK],
-            #["Can I set up my budget?", User.ASK],
-            #["Track a transaction", User.ASK],
-            #["Budget for me", User.ASK],
-            #["Make a budget", User.ASK],
-            #["I'm going to record a transaction", User.ASK],
-            #["Track some spending for me", User.ASK],
-            # Setup examples
-            ["Add a budget of 100 dollars for Transportation items", User.SET],
-            ["Make a new category for me called Health", User.SET],
-            ["Change my budget category Health to allow me to spend 56 dollars", User.SET],
-            # Transaction examples
-            ["I spent 10 dollars at McDonalds today", User.TRA],
-            ["I bought a brand new TV at BestBuy yesterday", User.TRA],
-            ["I got some sneakers for a friend yesterday, it cost about $200", User.TRA],
-            # Expense inquiry examples
-            ["What is my spending breakdown?", User.INQ],
-            ["What are my budget categories?", User.INQ],
-            ["How much have I spent for the past 30 days", User.INQ],
-            ["How much money do I have remaining in my total budget", User.INQ],
-            # Discussion
-            ["Tell me about yourself", User.DIS],
-            ["What does this app do?", User.DIS],
-            ["What are you?", User.DIS],
-            ["I love you so much", User.DIS],
-            ["How are you doing?", User.DIS],
-            ["I need someone to talk to", User.DIS],
-            ["Hey so I need some inspiration to start my day", User.DIS],
-            ["Do you have any advice for me to improve my spending habits?", User.DIS]
-        ],
-        labels=[User.DIS, User.SET, User.TRA, User.INQ]
+        examples=CONVERSATION_CATEGORY_EXAMPLES,
+        labels=CONVERSATION_CATEGORY_LABELS
     )
     
-    return response["label"]
+    return label
 
 
 #################
@@ -90,7 +104,7 @@ The AI assistant has the functionality to help %s with these actions:
     prompt += '%s: %s\n' % (user, question)
     prompt += 'Friday:'
 
-    response = openai.Completion.create(
+    text = get_backend().complete(
         engine="text-davinci-002",
         prompt=prompt,
         temperature=0.6,
@@ -100,16 +114,17 @@ The AI assistant has the functionality to help %s with these actions:
         presence_penalty=1.7,
         stop="%s:" % user
     )
-    return response.choices[0].text.strip()
+    return text.strip()
 
 
 ######################
 # Discussion functions
 ######################
-def get_discussion_response(conv_history, user):
+def get_discussion_response(conv_history, user, summary=None):
     """
     Takes a list of dictionaries containing the Author and Msg
     in order and generates a response
+    summary describes the older, compacted part of the conversation
     """
 
     # Create a String prompt
@@ -133,14 +148,24 @@ The AI assistant has the functionality to help %s with these actions:
 
 """ % (user, user, user, user, user)
 
-    # Populate with conversation
-    for message in conv_history:
-        prompt += '%s:%s\n' % (message['Author'], message['Message'])
+    builder = PromptBuilder(settings.PROMPT_TOKEN_BUDGETS['Discussion'])
+    builder.add_text(prompt)
 
-    prompt += 'Friday:'
+    # Add what happened before the recent messages
+    if summary is not None:
+        builder.add_text('Summary of the earlier conversation:\n%s\n\n' % summary)
+
+    # Populate with conversation, the oldest messages go first if it's too long
+    builder.add_items(conv_history,
+                      lambda message: '%s:%s\n' % (message['Author'], message['Message']),
+                      lambda messages: '(%s earlier messages not shown)\n' % len(messages))
+
+    builder.add_text('Friday:')
+    prompt, report = builder.build()
+    LOGGER.info('Discussion prompt: %s' % report)
 
     # Send to API
-    response_dict = openai.Completion.create(
+    text = get_backend().complete(
         engine="text-davinci-002",
         prompt=prompt,
         temperature=1.0,
@@ -152,7 +177,7 @@ The AI assistant has the functionality to help %s with these actions:
     )
 
     # Clip any enters off the ends of the string
-    response = response_dict['choices'][0]['text'].strip()
+    response = text.strip()
 
     return response
 
@@ -160,35 +185,33 @@ The AI assistant has the functionality to help %s with these actions:
 ######################
 # User setup functions
 ######################
+# Examples of the setup intent classifier
+SETUP_INTENT_EXAMPLES = [
+    # Info examples
+    ["Delete the Housing category", "Change budget"],
+    ["I want to setup my budget", "Change budget"],
+    ["Can I setup my budget?", "Change budget"],
+    # Unknown examples
+    ["Change my phone number", "Unclear"],
+    ["Make my budget bigger", "Unclear"],
+    ["Change my name to something cool", "Unclear"],
+]
+
 def determine_user_setup_intent(text):
     """
     Determines what type of setup the user would like to do
     """
-    response = openai.Classification.create(
+    label = get_backend().classify(
         search_model="davinci",
         model="davinci",
         query=text,
-        examples=[
-            # Info examples
-            ["Delete the Housing category", "Change budget"],
-            ["I want to setup my budget", "Change budget"],
-            ["Can I setup my budget?", "Change budget"],
-            # Unknown examples
-            ["Change my phone number", "Unclear"],
-            ["Make my budget bigger", "Unclear"],
-            ["Change my name to something cool", "Unclear"],
-        ],
+        examples=SETUP_INTENT_EXAMPLES,
         labels=["Change name", "Change budget", "Unclear"]
     )
     
-    return response["label"]
+    return label
 
-def get_budget_response(msg, budget_dict, user):
-    """
-    Determines how to edit the users budget categories based on a msg
-    """
-    budget_dict = str(budget_dict).replace("'", '"')
-    prompt = \
+BUDGET_PROMPT = PROMPT_TEMPLATES.register('Budget',
 """
 Below is a program that modify the data of %s's budgeting categories based on his request.
 Please modify the dictionary according to the request.
@@ -222,9 +245,16 @@ Output: {"Categories" : { "Education": "N/A", "Holiday": "200", "Donation": "200
 Categories: %s
 Prompt: %s
 Output:
-""" % (user, user, budget_dict, msg)
+""")
 
-    response = openai.Completion.create(
+def get_budget_response(msg, budget_dict, user):
+    """
+    Determines how to edit the users budget categories based on a msg
+    """
+    budget_dict = str(budget_dict).replace("'", '"')
+    prompt = BUDGET_PROMPT.render(user, user, budget_dict, msg)
+
+    text = get_backend().complete(
         engine="text-davinci-002",
         prompt=prompt,
         temperature=0,
@@ -235,19 +265,31 @@ Output:
         stop='Output:'
     )
 
-    data = json.loads(response.choices[0].text.strip())
+    data = json.loads(text.strip())
     return data
 
 
 ######################
 # Transaction functions
 ######################
-def determine_transaction_info(text):
-    today = datetime.date.today()
+def _get_transaction_info_dates(today):
+    """
+    Gets the month, day and year of each date in the transaction info prompt
+    """
     yesterday = today - datetime.timedelta(days=1)
     three_days_ago = today - datetime.timedelta(days=3)
     a_week_ago = today - datetime.timedelta(days=7)
-    prompt = \
+
+    dates = [today, today, today, today, today, yesterday, today, today,
+             yesterday, three_days_ago, a_week_ago]
+
+    date_args = list()
+    for date in dates:
+        date_args += [date.month, date.day, date.year]
+    return date_args
+
+# The examples only change with the date so the prefix is made once a day
+TRANSACTION_INFO_PROMPT = PROMPT_TEMPLATES.register('Transaction info',
         """A classifier that can indicate the item, location, date, and amount for a transaction in a list format. If you 
     don't know what the value for a category is, simple use '?' as it's value. Program should return a list 
     containing a dictionary for each transaction. The program should be able to determine the date relative to today from a sentence.
@@ -276,19 +318,11 @@ List: [{'Item': 'Shirt', 'Amount': 15, 'Location': 'Walmart', 'Date' : '%s-%s-%s
 
 Sentence: %s
 List:
-    """ % (today.month, today.day, today.year,
-           today.month, today.day, today.year,
-           today.month, today.day, today.year,
-           today.month, today.day, today.year,
-           today.month, today.day, today.year,
-           yesterday.month, yesterday.day, yesterday.year,
-           today.month, today.day, today.year,
-           today.month, today.day, today.year,
-           yesterday.month, yesterday.day, yesterday.year,
-           three_days_ago.month, three_days_ago.day, three_days_ago.year,
-           a_week_ago.month, a_week_ago.day, a_week_ago.year,
-           text)
-    response = openai.Completion.create(
+    """, _get_transaction_info_dates, 33)
+
+def determine_transaction_info(text):
+    prompt = TRANSACTION_INFO_PROMPT.render(text)
+    response_text = get_backend().complete(
         engine="text-davinci-002",
         prompt=prompt,
         temperature=0,
@@ -299,63 +333,65 @@ List:
         stop='Sentence:'
     )
     try:
-        print(response.choices[0].text.strip())
-        transactionList = ast.literal_eval(response.choices[0].text.strip())
+        LOGGER.debug('Transaction info: %s' % response_text.strip())
+        transactionList = ast.literal_eval(response_text.strip())
         return transactionList
     except:
         return None
 
+# Examples of the transaction category classifier
+TRANSACTION_TYPE_EXAMPLES = [
+    # Housing
+    ["house", "Housing"],
+    ["electric bill", "Housing"],
+    ["utility bill", "Housing"],
+
+    # Household Supplies
+    ["couch", "Household"],
+    ["shelf", "Houshold"],
+    ["curtain rod", "Household"],
+
+    # Clothing
+    ["dress", "Clothing"],
+    ["shoes", "Clothing"],
+    ["rain jacket", "Clothing"],
+
+    # Education
+    ["textbook", "Education"],
+    ["tuition", "Education"],
+    ["iclicker", "Education"],
+
+    # Groceries
+    ["milk", "Groceries"],
+    ["water", "Groceries"],
+    ["doritos", "Groceries"],
+
+    # Transportation
+    ["car", "Transportation"],
+    ["bus", "Transportation"],
+    ["drive", "Transportation"],
+
+    # Personal Care
+    ["gel", "Health"],
+    ["shampoo", "Health"],
+    ["deoderant", "Health"],
+    ["gym equipment", "Health"],
+    ["Bike", "Health"],
+]
+
 def determine_transaction_type(text, categories):
     """
     Categorizes reason for transaction
     """
-    response = openai.Classification.create(
+    label = get_backend().classify(
         search_model="davinci",
         model="davinci",
         query=text,
-        examples=[
-            # Housing
-            ["house", "Housing"],
-            ["electric bill", "Housing"],
-            ["utility bill", "Housing"],
-
-            # Household Supplies
-            ["couch", "Household"],
-            ["shelf", "Houshold"],
-            ["curtain rod", "Household"],
-
-                # Clothing
-            ["dress", "Clothing"],
-            ["shoes", "Clothing"],
-            ["rain jacket", "Clothing"],
-
-                # Education
-            ["textbook", "Education"],
-            ["tuition", "Education"],
-            ["iclicker", "Education"],
-
-                # Groceries
-            ["milk", "Groceries"],
-            ["water", "Groceries"],
-            ["doritos", "Groceries"],
-
-            # Transportation
-            ["car", "Transportation"],
-            ["bus", "Transportation"],
-            ["drive", "Transportation"],
-
-            # Personal Care
-            ["gel", "Health"],
-            ["shampoo", "Health"],
-            ["deoderant", "Health"],
-            ["gym equipment", "Health"],
-            ["Bike", "Health"],
-
-        ],
+        examples=TRANSACTION_TYPE_EXAMPLES,
         labels=categories
     )
 
-    return response["label"]
+    return label
 
 #####################
 # Elaborate functions
@@ -377,7 +413,7 @@ AI: I can do that for you! Can you tell me a little more about what you would li
     prompt += 'AI:'
     LOGGER.info(prompt)
 
-    response = openai.Completion.create(
+    text = get_backend().complete(
         engine="text-davinci-002",
         prompt=prompt,
         temperature=0.6,
@@ -387,42 +423,55 @@ AI: I can do that for you! Can you tell me a little more about what you would li
         presence_penalty=1.7,
         stop="%s:" % user
     )
-    return response.choices[0].text.strip()
+    return text.strip()
 
 ######################
 # Inquiry functions
 ######################
+# Examples of the inquiry type classifier
+INQUIRY_TYPE_EXAMPLES = [
+    # Visual
+    ["Can I see some visuals regarding my expenses", "Visual"],
+    ["I'd like to see a pie chart of my budget", "Visual"],
+    ["I'd like to see a scatter plot of my spendings for the past month", "Visual"],
+    ["I'd like to see a plot of my expenses", "Visual"],
+    ["I'd like to see a graph of my spendings", "Visual"],
+
+    # Text
+    ["How much have spent for the past week", "Text"],
+    ["How much did I spend yesterday", "Text"],
+    ["Let me see an expenditure log of my recent transactions", "Text"],
+]
+
 def determine_inquiry_type(msg):
     """
     Categorizes whether the inquiry is looking for a visual or text response
     """
-    response = openai.Classification.create(
+    label = get_backend().classify(
         search_model="davinci",
         model="davinci",
         query=msg,
-        examples=[
-            # Visual
-            ["Can I see some visuals regarding my expenses", "Visual"],
-            ["I'd like to see a pie chart of my budget", "Visual"],
-            ["I'd like to see a scatter plot of my spendings for the past month", "Visual"],
-            ["I'd like to see a plot of my expenses", "Visual"],
-            ["I'd like to see a graph of my spendings", "Visual"]
-
-            # Text
-            ["How much have spent for the past week", "Text"],
-            ["How much did I spend yesterday", "Text"],
-            ["Let me see an expenditure log of my recent transactions", "Text"],
-
-        ],
+        examples=INQUIRY_TYPE_EXAMPLES,
         labels= [" Visual", "Text"]
     )
 
-    return response["label"]
+    return label
 
 def get_visuals():
     pie_chart = "visualizations.piechart_visualization(example_dict)"
     pass
 
+# Examples of the inquiry reply classifier
+INQUIRY_REPLY_EXAMPLES = [
+    # Text
+    ["Show me my spending", "Transactions"],
+    ["How much did I spend yesterday?", "Transactions"],
+    ["Let me see an expenditure log of my recent transactions", "Transactions"],
+    ["What are my budgets this week?", "Budgets"],
+    ["Show me my budget categories", "Budgets"],
+    ["How much do I have left in my budget?", "Budgets"]
+]
+
 def get_inquiry_response_alt(user, msg, budget_list, total_spent, total_left, total_budget, trans_hist, overall_status):
     """
     Gets a response about the spending of the user when prompted
@@ -449,47 +498,41 @@ Totals this month
 """
     budgets += 'Money from budget left to spend: %s\nTotal Money Spent: %s\nStatus: %s' % (total_left, total_spent, overall_status)
     
-    transactions = \
+    builder = PromptBuilder(settings.PROMPT_TOKEN_BUDGETS['Inquiry reply'])
+    builder.add_text(
 """
 
 Transactions this month
 ------------------------
-"""
+""")
     if trans_hist is None:
-        transactions += 'There is no transaction history'
+        builder.add_text('There is no transaction history')
 
-    for trans in trans_hist:
-        for name, value in trans.items():
-            if name != 'DateTime':
-                transactions += '%s : %s\n' % (name, value)
-        transactions += '\n'
-    
-    transactions += \
+    # Older transactions are grouped by category if there are too many to list
+    builder.add_items(trans_hist,
+                      lambda trans: _render_transaction(trans, '%s : %s\n') + '\n',
+                      lambda trans_list: _summarize_transactions(
+                          trans_list, 'Category : %s\nTransactions : %s\nAmount : %s\n\n'))
+
+    builder.add_text(
 """
 
 Totals this month
 ------------------------
-"""
-    transactions += 'Money from budget left to spend: %s\nTotal Money Spent: %s\nStatus: %s' % (total_left, total_spent, overall_status)
+""")
+    builder.add_text('Money from budget left to spend: %s\nTotal Money Spent: %s\nStatus: %s' % (total_left, total_spent, overall_status))
+    transactions, report = builder.build()
+    LOGGER.info('Inquiry reply prompt: %s' % report)
     
-    response = openai.Classification.create(
+    label = get_backend().classify(
         search_model="davinci",
         model="davinci",
         query=msg,
-        examples=[
-            # Text
-            ["Show me my spending", "Transactions"],
-            ["How much did I spend yesterday?", "Transactions"],
-            ["Let me see an expenditure log of my recent transactions", "Transactions"],
-            ["What are my budgets this week?", "Budgets"],
-            ["Show me my budget categories", "Budgets"],
-            ["How much do I have left in my budget?", "Budgets"]
-
-        ],
+        examples=INQUIRY_REPLY_EXAMPLES,
         labels= ["Budgets", "Transactions"]
     )
 
-    if response['label'] == 'Budgets':
+    if label == 'Budgets':
         return budgets
     else:
         return transactions
@@ -533,13 +576,16 @@ Transactions this month
     if trans_hist is None:
         prompt += 'There is no transaction history'
 
-    for trans in trans_hist:
-        for name, value in trans.items():
-            if name != 'DateTime':
-                prompt += '| %s : %s' % (name, value)
-        prompt += '\n'
-    
-    prompt += \
+    builder = PromptBuilder(settings.PROMPT_TOKEN_BUDGETS['Inquiry'])
+    builder.add_text(prompt)
+
+    # Older transactions are grouped by category if there are too many to list
+    builder.add_items(trans_hist,
+                      lambda trans: _render_transaction(trans, '| %s : %s') + '\n',
+                      lambda trans_list: _summarize_transactions(
+                          trans_list, '| Category : %s | Transactions : %s | Amount : %s\n'))
+
+    prompt = \
 """
 
 Totals this month
@@ -556,8 +602,12 @@ Conversation
     prompt += '\n%s : %s\n' % (user, msg)
     prompt += 'Friday :'
 
+    builder.add_text(prompt)
+    prompt, report = builder.build()
+    LOGGER.info('Inquiry prompt: %s' % report)
+
     LOGGER.info(prompt)
-    response = openai.Completion.create(
+    text = get_backend().complete(
         engine="text-davinci-002",
         prompt=prompt,
         temperature=0.5,
@@ -568,16 +618,38 @@ Conversation
         stop=["%s" % user]
     )
 
-    return response.choices[0].text.strip() 
+    return text.strip() 
+
+def _render_transaction(trans, line_format):
+    """
+    Writes the fields of a transaction dict with line_format
+    """
+    text = ''
+    for name, value in trans.items():
+        if name != 'DateTime':
+            text += line_format % (name, value)
+    return text
+
+def _summarize_transactions(trans_list, line_format):
+    """
+    Summarizes transactions with a line per category for the ones trimmed from a prompt
+    line_format takes the category, the number of transactions and their total
+    """
+    category_dict = dict()
+    for trans in trans_list:
+        count, total = category_dict.get(trans['Category'], (0, 0))
+        category_dict[trans['Category']] = (count + 1, total + trans['Amount'])
+
+    summary = 'Earlier transactions from %s to %s\n' % (trans_list[0]['Date'], trans_list[-1]['Date'])
+    for category, (count, total) in category_dict.items():
+        summary += line_format % (category, count, total)
+
+    return summary
 
 ########################
 # Other useful funcitons
 ########################
-def find_name_from_msg(msg):
-    """
-    Decifer message to find name, if not found return None
-    """
-    prompt = \
+NAME_PROMPT = PROMPT_TEMPLATES.register('Name',
 """
 Only return the name from the sentence below, if name not found return None
 Also, if the name is Friday, return None
@@ -604,9 +676,15 @@ Sentence: hello
 Name: Hello
 Sentence: %s
 Name:
-""" % msg
+""")
+
+def find_name_from_msg(msg):
+    """
+    Decifer message to find name, if not found return None
+    """
+    prompt = NAME_PROMPT.render(msg)
 
-    response = openai.Completion.create(
+    text = get_backend().complete(
         engine="text-davinci-002",
         prompt=prompt,
         temperature=0,
@@ -616,7 +694,7 @@ Name:
         presence_penalty=0,
         stop="Sentence:"
     )
-    name = response.choices[0].text.strip()
+    name = text.strip()
     if name == 'None':
         return None
     return name
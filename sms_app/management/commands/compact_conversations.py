@@ -0,0 +1,43 @@
+# Django imports
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+# System imports
+import datetime
+
+# local imports
+from sms_app.models import User
+
+
+class Command(BaseCommand):
+    help = ('Folds conversation messages older than the compaction window into '
+            'summaries and moves them to the archive')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CONV_COMPACTION_WINDOW_DAYS,
+                            help='Messages older than this many days are compacted')
+        parser.add_argument('--keep', type=int, default=settings.CONV_COMPACTION_KEEP_MESSAGES,
+                            help='Latest messages of each user that are always kept')
+        parser.add_argument('--phone', help='Only compact the user with this phone number')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - datetime.timedelta(days=options['days'])
+
+        if options['phone'] is not None:
+            user = User.find_user_from_phone(options['phone'])
+            if user is None:
+                raise CommandError('No user with phone number %s' % options['phone'])
+            users = [user]
+        else:
+            users = User.objects.all().iterator()
+
+        num_users = 0
+        num_msgs = 0
+        for user in users:
+            num_compacted = user.compact_history(before, keep=options['keep'])
+            if num_compacted != 0:
+                num_users += 1
+                num_msgs += num_compacted
+
+        self.stdout.write('Compacted %s messages of %s users' % (num_msgs, num_users))
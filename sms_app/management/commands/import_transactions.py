@@ -0,0 +1,95 @@
+# Django imports
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+# System imports
+import csv
+import datetime
+import decimal
+
+# local imports
+from sms_app.models import User, Transaction
+
+
+class Command(BaseCommand):
+    help = ('Imports the transactions of a CSV or bank statement export into a user\'s '
+            'expense records, in chunks so that large files use bounded memory')
+
+    def add_arguments(self, parser):
+        parser.add_argument('phone', help='Phone number of the user to import into')
+        parser.add_argument('path', help='Path of the CSV file')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of rows saved per batch')
+        parser.add_argument('--date-column', default='Date')
+        parser.add_argument('--date-format', default='%Y-%m-%d')
+        parser.add_argument('--title-column', default='Description')
+        parser.add_argument('--amount-column', default='Amount')
+        parser.add_argument('--category-column', default='Category',
+                            help='Column of the category, rows without one use --default-category')
+        parser.add_argument('--default-category', default='Uncategorized')
+        parser.add_argument('--debits-negative', action='store_true',
+                            help='Statement lists spending as negative amounts, positive rows are skipped')
+
+    def handle(self, *args, **options):
+        user = User.find_user_from_phone(options['phone'])
+        if user is None:
+            raise CommandError('No user with phone number %s' % options['phone'])
+
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size must be positive')
+
+        num_imported = 0
+        num_skipped = 0
+        chunk = list()
+
+        with open(options['path'], newline='', encoding='utf-8-sig') as csv_file:
+            reader = csv.DictReader(csv_file)
+            for line_num, row in enumerate(reader, start=2):
+                try:
+                    transaction = self._build_transaction(user, row, options)
+                except (KeyError, ValueError, decimal.InvalidOperation) as e:
+                    raise CommandError('Could not read line %s: %s' % (line_num, e))
+
+                if transaction is None:
+                    num_skipped += 1
+                    continue
+
+                chunk.append(transaction)
+                if len(chunk) >= options['chunk_size']:
+                    user.add_transactions(chunk)
+                    num_imported += len(chunk)
+                    chunk = list()
+
+        if chunk:
+            user.add_transactions(chunk)
+            num_imported += len(chunk)
+
+        self.stdout.write('Imported %s transactions, skipped %s rows' % (num_imported, num_skipped))
+
+    def _build_transaction(self, user, row, options):
+        """
+        Builds an unsaved transaction from a csv row, returns None for rows to skip
+        """
+        amount_str = row[options['amount_column']].strip().replace('$', '').replace(',', '')
+        if amount_str == '':
+            return None
+        amount = decimal.Decimal(amount_str)
+
+        if options['debits_negative']:
+            if amount >= 0:
+                return None
+            amount = -amount
+
+        date = datetime.datetime.strptime(row[options['date_column']].strip(), options['date_format'])
+
+        category = (row.get(options['category_column']) or '').strip()
+        if category == '':
+            category = options['default_category']
+
+        title = row[options['title_column']].strip()[:100]
+
+        return Transaction(phone_number=user.phone_number,
+                           title=title,
+                           transaction_cat=category,
+                           amount=amount,
+                           timestamp=timezone.make_aware(date))
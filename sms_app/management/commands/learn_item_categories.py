@@ -0,0 +1,30 @@
+# Django imports
+from django.core.management.base import BaseCommand, CommandError
+
+# local imports
+from sms_app.models import User
+
+
+class Command(BaseCommand):
+    help = ('Remembers the category of the items in the past transactions of the users '
+            'so they are not classified again')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--phone', help='Only learn for the user with this phone number')
+
+    def handle(self, *args, **options):
+        if options['phone'] is not None:
+            user = User.find_user_from_phone(options['phone'])
+            if user is None:
+                raise CommandError('No user with phone number %s' % options['phone'])
+            users = [user]
+        else:
+            users = User.objects.all().iterator()
+
+        num_users = 0
+        num_transactions = 0
+        for user in users:
+            num_transactions += user.learn_item_categories()
+            num_users += 1
+
+        self.stdout.write('Learned from %s transactions of %s users' % (num_transactions, num_users))
@@ -0,0 +1,112 @@
+# Django imports
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+# System imports
+import concurrent.futures
+import logging
+import time
+import traceback
+
+# local imports
+import sms_app.sms_utilities.messaging as msgutil
+import sms_app.metrics as metrics
+from sms_app.models import InboundMsg
+from sms_app.views import process_msg
+from sms_app.visualizations.prerender import start_prerenderer
+
+LOGGER = logging.getLogger('friday_logger')
+
+
+class Command(BaseCommand):
+    help = ('Processes the queued sms messages. Users are processed in parallel '
+            'while the messages of one phone number are processed in order')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=settings.SMS_WORKER_THREADS,
+                            help='Number of phone numbers processed at the same time')
+        parser.add_argument('--poll-interval', type=float, default=settings.SMS_WORKER_POLL_INTERVAL,
+                            help='Seconds to wait before checking an empty queue again')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of waiting for messages')
+        parser.add_argument('--metrics-port', type=int, default=settings.SMS_WORKER_METRICS_PORT,
+                            help='Local port to serve the latency metrics of the worker on, 0 to disable')
+
+    def handle(self, *args, **options):
+        num_threads = options['threads']
+
+        # The worker processes the messages so its metrics aren't in the web server's
+        if options['metrics_port']:
+            metrics.start_metrics_server(options['metrics_port'])
+
+        # The charts of the users the worker changes are drawn in the background
+        prerenderer = start_prerenderer()
+        try:
+            self._process_queue(num_threads, options)
+        finally:
+            prerenderer.shutdown()
+
+    def _process_queue(self, num_threads, options):
+        """
+        Processes the queue until it is empty with --once, or forever
+        """
+        # Phone number to the future draining its messages
+        active_dict = dict()
+        last_requeue_time = None
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
+            while True:
+                # Other workers may run, so only messages claimed longer than the lease ago
+                # were interrupted. Checked again now and then for workers that stop later
+                now = time.monotonic()
+                if last_requeue_time is None or now - last_requeue_time > settings.SMS_WORKER_LEASE_SECONDS / 2:
+                    last_requeue_time = now
+                    num_requeued = InboundMsg.requeue_interrupted(settings.SMS_WORKER_LEASE_SECONDS)
+                    if num_requeued != 0:
+                        LOGGER.info('Requeued %s interrupted messages' % num_requeued)
+
+                for phone_num, future in list(active_dict.items()):
+                    if future.done():
+                        del active_dict[phone_num]
+
+                # A phone number is only ever drained by one thread to keep its order
+                free_threads = num_threads - len(active_dict)
+                if free_threads > 0:
+                    phone_nums = InboundMsg.get_pending_phone_numbers(exclude=active_dict.keys(),
+                                                                      limit=free_threads)
+                    for phone_num in phone_nums:
+                        active_dict[phone_num] = executor.submit(self._drain_phone_number, phone_num)
+
+                if not active_dict:
+                    if options['once']:
+                        # Replies are sent in the background, let them go out first
+                        msgutil.flush_messages()
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                concurrent.futures.wait(list(active_dict.values()),
+                                        timeout=options['poll_interval'],
+                                        return_when=concurrent.futures.FIRST_COMPLETED)
+
+    def _drain_phone_number(self, phone_num):
+        """
+        Processes the pending messages of one phone number in the order they arrived
+        """
+        try:
+            while True:
+                inbound_msg = InboundMsg.claim_next(phone_num)
+                if inbound_msg is None:
+                    return
+
+                try:
+                    process_msg(inbound_msg.message, phone_num)
+                except Exception:
+                    LOGGER.error('Failed to process message %s' % inbound_msg.msg_id)
+                    inbound_msg.mark_failed(traceback.format_exc())
+                else:
+                    inbound_msg.mark_done()
+        finally:
+            # Every thread gets its own db connection
+            connection.close()
@@ -0,0 +1,19 @@
+# Django imports
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# local imports
+from sms_app.models import IntentCacheEntry
+
+
+class Command(BaseCommand):
+    help = 'Deletes the cached intents that expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, default=settings.INTENT_CACHE_TTL,
+                            help='Intents not written in this many seconds are deleted')
+
+    def handle(self, *args, **options):
+        num_deleted = IntentCacheEntry.delete_expired(options['ttl'])
+
+        self.stdout.write('Deleted %s expired intents' % num_deleted)
@@ -0,0 +1,29 @@
+# Django imports
+from django.core.management.base import BaseCommand, CommandError
+
+# local imports
+from sms_app.models import User, MonthlyCategoryTotal
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the monthly category totals rollup from the transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--phone', help='Only rebuild the user with this phone number')
+
+    def handle(self, *args, **options):
+        if options['phone'] is not None:
+            user = User.find_user_from_phone(options['phone'])
+            if user is None:
+                raise CommandError('No user with phone number %s' % options['phone'])
+            users = [user]
+        else:
+            users = User.objects.all().iterator()
+
+        num_users = 0
+        num_rows = 0
+        for user in users:
+            num_rows += MonthlyCategoryTotal.rebuild_for_user(user)
+            num_users += 1
+
+        self.stdout.write('Rebuilt %s monthly totals for %s users' % (num_rows, num_users))
@@ -0,0 +1,51 @@
+# Django imports
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+# System imports
+import json
+
+# local imports
+from sms_app.benchmarks import run_benchmarks, compare_results
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks the ledger queries and full message turns with synthetic users, '
+            'in a throwaway test database with the language model and sms answered in memory')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='Number of transactions of each synthetic user')
+        parser.add_argument('--messages', type=int, default=5000,
+                            help='Number of conversation messages of each synthetic user')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Number of timed runs of each benchmark')
+        parser.add_argument('--output', help='Path to save the results to as json')
+        parser.add_argument('--compare', help='Path of saved results to compare this run with')
+
+    def handle(self, *args, **options):
+        if options['repeat'] <= 0:
+            raise CommandError('--repeat must be positive')
+
+        old_results = None
+        if options['compare']:
+            with open(options['compare']) as results_file:
+                old_results = json.load(results_file)
+
+        # Never touch the real data
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = run_benchmarks(options['sizes'], options['messages'], options['repeat'],
+                                     log=self.stdout.write)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['output']:
+            with open(options['output'], 'w') as results_file:
+                json.dump(results, results_file, indent=2)
+            self.stdout.write('Saved results to %s' % options['output'])
+
+        if old_results is not None:
+            self.stdout.write('Compared with %s' % options['compare'])
+            for line in compare_results(old_results, results):
+                self.stdout.write(line)
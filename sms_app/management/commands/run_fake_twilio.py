@@ -0,0 +1,27 @@
+# Django imports
+from django.core.management.base import BaseCommand
+
+# local imports
+from sms_app.sms_utilities.fake_twilio import FakeTwilioServer
+
+
+class Command(BaseCommand):
+    help = ('Runs a local server that stands in for the Twilio messages API, '
+            'point TWILIO_API_BASE_URL at it')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help='Seconds every request takes')
+
+    def handle(self, *args, **options):
+        server = FakeTwilioServer(options['host'], options['port'], options['latency'])
+        self.stdout.write('Fake Twilio listening on %s' % server.url)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+        self.stdout.write('Received %s messages' % len(server.messages))
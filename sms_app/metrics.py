@@ -0,0 +1,197 @@
+# Django imports
+from django.conf import settings
+
+# System imports
+import contextlib
+import hashlib
+import hmac
+import http.server
+import json
+import logging
+import threading
+import time
+
+LOGGER = logging.getLogger('friday_logger')
+
+# Upper bounds in seconds of the latency buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Trace of the message being processed by the current thread
+_LOCAL = threading.local()
+
+
+class Histogram(object):
+    """
+    Latency histogram with a set of labels, kept in the memory of the process
+    """
+    def __init__(self, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+
+        self._lock = threading.Lock()
+        # Label values to [bucket counts, sum, count]
+        self._series_dict = dict()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series_dict.get(key)
+            if series is None:
+                series = [[0] * len(self.buckets), 0.0, 0]
+                self._series_dict[key] = series
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def get_text(self):
+        """
+        Writes the histogram in the Prometheus text format
+        """
+        lines = ['# HELP %s %s' % (self.name, self.documentation),
+                 '# TYPE %s histogram' % self.name]
+
+        with self._lock:
+            for key, (bucket_counts, total, count) in sorted(self._series_dict.items()):
+                labels = ','.join('%s="%s"' % (name, _escape(value))
+                                  for name, value in zip(self.labelnames, key))
+                separator = ',' if labels else ''
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    lines.append('%s_bucket{%s%sle="%s"} %s' % (self.name, labels, separator, bound, bucket_count))
+                lines.append('%s_bucket{%s%sle="+Inf"} %s' % (self.name, labels, separator, count))
+                lines.append('%s_sum{%s} %s' % (self.name, labels, total))
+                lines.append('%s_count{%s} %s' % (self.name, labels, count))
+
+        return '\n'.join(lines) + '\n'
+
+
+STAGE_SECONDS = Histogram('friday_stage_seconds',
+                          'Time spent in each stage of processing a message',
+                          ('stage', 'state'))
+MESSAGE_SECONDS = Histogram('friday_message_seconds',
+                            'Time spent processing a whole message',
+                            ('state',))
+
+HISTOGRAMS = [MESSAGE_SECONDS, STAGE_SECONDS]
+
+
+############################
+# Tracing a message
+############################
+class Trace(object):
+    """
+    Stage timings of one message, observed once the state of the user is known
+    """
+    def __init__(self, name):
+        self.name = name
+        self.state = ''
+        self.start = time.perf_counter()
+        # List of (stage, seconds)
+        self.spans = list()
+
+
+def start_trace(name):
+    _LOCAL.trace = Trace(name)
+
+def set_state(state):
+    """
+    Tags the current trace with the state of the user
+    """
+    trace = getattr(_LOCAL, 'trace', None)
+    if trace is not None:
+        trace.state = state
+
+def hash_id(value):
+    """
+    Short keyed hash of a phone number or other personal id for the logs,
+    tells the messages of one user apart without showing who they are
+    """
+    digest = hmac.new(settings.SECRET_KEY.encode('utf-8'), str(value).encode('utf-8'), hashlib.sha256)
+    return digest.hexdigest()[:12]
+
+def finish_trace(**info):
+    """
+    Observes the stages of the current trace into the histograms,
+    logs the stage breakdown if the message was slow
+    """
+    trace = getattr(_LOCAL, 'trace', None)
+    if trace is None:
+        return
+    _LOCAL.trace = None
+
+    total = time.perf_counter() - trace.start
+    for stage, seconds in trace.spans:
+        STAGE_SECONDS.observe(seconds, stage=stage, state=trace.state)
+    MESSAGE_SECONDS.observe(total, state=trace.state)
+
+    if total >= settings.SLOW_MESSAGE_SECONDS:
+        stage_dict = dict()
+        for stage, seconds in trace.spans:
+            stage_dict[stage] = round(stage_dict.get(stage, 0) + seconds, 4)
+
+        log_dict = {'Event': 'Slow message',
+                    'Name': trace.name,
+                    'State': trace.state,
+                    'Seconds': round(total, 4),
+                    'Stages': stage_dict}
+        log_dict.update(info)
+        LOGGER.warning(json.dumps(log_dict))
+
+@contextlib.contextmanager
+def trace(name, **info):
+    start_trace(name)
+    try:
+        yield
+    finally:
+        finish_trace(**info)
+
+@contextlib.contextmanager
+def span(stage):
+    """
+    Times a stage, added to the current trace or observed right away without one
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        trace = getattr(_LOCAL, 'trace', None)
+        if trace is not None:
+            trace.spans.append((stage, seconds))
+        else:
+            STAGE_SECONDS.observe(seconds, stage=stage, state='')
+
+
+############################
+# Exposing the metrics
+############################
+def get_metrics_text():
+    return ''.join(histogram.get_text() for histogram in HISTOGRAMS)
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """
+    Serves the metrics of this process on a local port, for processes without django views
+    """
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = get_metrics_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,58 @@
+# Generated by Django 4.0.1 on 2026-10-18 13:40
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BudgetCategory',
+            fields=[
+                ('category_name', models.CharField(max_length=100)),
+                ('budget_amount', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('cat_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ConvMsg',
+            fields=[
+                ('message', models.TextField()),
+                ('msg_type', models.CharField(default='Message', max_length=20)),
+                ('author', models.CharField(max_length=50)),
+                ('phone_number', models.CharField(max_length=12)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('conv_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Transaction',
+            fields=[
+                ('phone_number', models.CharField(max_length=12)),
+                ('title', models.CharField(max_length=100)),
+                ('transaction_cat', models.CharField(max_length=100)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('timestamp', models.DateTimeField()),
+                ('trans_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('name', models.CharField(blank=True, max_length=50)),
+                ('phone_number', models.CharField(max_length=12)),
+                ('user_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('state', models.CharField(default='Registration', max_length=30)),
+                ('budget_categories', models.ManyToManyField(related_name='budget_categories', to='sms_app.BudgetCategory')),
+                ('conv_history', models.ManyToManyField(related_name='conversation_history', to='sms_app.ConvMsg')),
+                ('discuss_history', models.ManyToManyField(related_name='discussion_history', to='sms_app.ConvMsg')),
+                ('transactions', models.ManyToManyField(related_name='transactions', to='sms_app.Transaction')),
+            ],
+        ),
+    ]
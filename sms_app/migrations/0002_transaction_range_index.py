@@ -0,0 +1,17 @@
+# Generated by Django 4.0.1 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['phone_number', 'timestamp', 'transaction_cat'], name='transaction_phone_time_cat'),
+        ),
+    ]
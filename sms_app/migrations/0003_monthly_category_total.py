@@ -0,0 +1,57 @@
+# Generated by Django 4.0.1 on 2026-10-18 13:41
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+import django.db.models.deletion
+
+
+def fill_monthly_totals(apps, schema_editor):
+    """
+    Sums the existing transactions of every user by month and category
+    """
+    User = apps.get_model('sms_app', 'User')
+    MonthlyCategoryTotal = apps.get_model('sms_app', 'MonthlyCategoryTotal')
+
+    # Transactions belong to users through the many to many table
+    totals_query_set = (User.transactions.through.objects
+                            .annotate(year=ExtractYear('transaction__timestamp'),
+                                      month=ExtractMonth('transaction__timestamp'),
+                                      category=F('transaction__transaction_cat'))
+                            .values('user_id', 'year', 'month', 'category')
+                            .annotate(total=Sum('transaction__amount'))
+                            .order_by())
+
+    MonthlyCategoryTotal.objects.bulk_create([MonthlyCategoryTotal(user_id=row['user_id'],
+                                                                   year=row['year'],
+                                                                   month=row['month'],
+                                                                   category=row['category'],
+                                                                   total=row['total'])
+                                              for row in totals_query_set.iterator()],
+                                             batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0002_transaction_range_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyCategoryTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('month', models.IntegerField()),
+                ('category', models.CharField(max_length=100)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_totals', to='sms_app.user')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='monthlycategorytotal',
+            constraint=models.UniqueConstraint(fields=('user', 'year', 'month', 'category'), name='monthly_total_per_category'),
+        ),
+        migrations.RunPython(fill_monthly_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.1 on 2026-10-18 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0003_monthly_category_total'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='convmsg',
+            name='timestamp',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
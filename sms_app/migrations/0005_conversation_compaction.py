@@ -0,0 +1,43 @@
+# Generated by Django 4.0.1 on 2026-10-18 13:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0004_convmsg_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConvSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('history', models.CharField(default='Conversation', max_length=20)),
+                ('summary', models.TextField()),
+                ('num_messages', models.IntegerField()),
+                ('start_timestamp', models.DateTimeField()),
+                ('end_timestamp', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conv_summaries', to='sms_app.user')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedConvMsg',
+            fields=[
+                ('history', models.CharField(default='Conversation', max_length=20)),
+                ('message', models.TextField()),
+                ('msg_type', models.CharField(default='Message', max_length=20)),
+                ('author', models.CharField(max_length=50)),
+                ('phone_number', models.CharField(max_length=12)),
+                ('timestamp', models.DateTimeField()),
+                ('conv_id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_msgs', to='sms_app.user')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='convsummary',
+            index=models.Index(fields=['user', 'history', 'end_timestamp'], name='conv_summary_user_hist_end'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.0.1 on 2026-10-18 13:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0005_conversation_compaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboundMsg',
+            fields=[
+                ('msg_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('phone_number', models.CharField(max_length=12)),
+                ('message', models.TextField()),
+                ('status', models.CharField(default='Pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('received_timestamp', models.DateTimeField(auto_now_add=True)),
+                ('processed_timestamp', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='inboundmsg',
+            index=models.Index(fields=['status', 'phone_number', 'msg_id'], name='inbound_status_phone_id'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.0.1 on 2026-10-18 13:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0006_inbound_msg_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntentCacheEntry',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('normalized_text', models.TextField()),
+                ('label', models.CharField(max_length=100)),
+                ('updated_timestamp', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.0.1 on 2026-10-18 13:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0007_intent_cache_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemCategoryMemo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('item_key', models.CharField(max_length=100)),
+                ('location_key', models.CharField(max_length=100)),
+                ('category', models.CharField(max_length=100)),
+                ('updated_timestamp', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_memos', to='sms_app.user')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='itemcategorymemo',
+            constraint=models.UniqueConstraint(fields=('user', 'item_key', 'location_key'), name='category_memo_per_item'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def merge_duplicate_users(apps, schema_editor):
+    """
+    Merges users registered twice with one phone number into the one that
+    finished registering, so the phone number can be made unique
+    """
+    User = apps.get_model('sms_app', 'User')
+    MonthlyCategoryTotal = apps.get_model('sms_app', 'MonthlyCategoryTotal')
+    ConvSummary = apps.get_model('sms_app', 'ConvSummary')
+    ArchivedConvMsg = apps.get_model('sms_app', 'ArchivedConvMsg')
+
+    duplicate_query_set = (User.objects.values('phone_number')
+                                       .annotate(num_users=Count('pk'))
+                                       .filter(num_users__gt=1))
+
+    for row in duplicate_query_set:
+        users = list(User.objects.filter(phone_number=row['phone_number']))
+        # Registered users first, then the one with the most transactions
+        users.sort(key=lambda user: (user.state != 'Registration',
+                                     user.name != '',
+                                     user.transactions.count()),
+                   reverse=True)
+        kept_user = users[0]
+
+        for user in users[1:]:
+            kept_user.transactions.add(*user.transactions.all())
+            kept_user.conv_history.add(*user.conv_history.all())
+            kept_user.discuss_history.add(*user.discuss_history.all())
+
+            # Categories are only moved if the kept user has none
+            if kept_user.budget_categories.exists():
+                user.budget_categories.all().delete()
+            else:
+                kept_user.budget_categories.add(*user.budget_categories.all())
+
+            ConvSummary.objects.filter(user=user).update(user=kept_user)
+            ArchivedConvMsg.objects.filter(user=user).update(user=kept_user)
+
+            # Monthly totals and item category memos are rebuilt or relearned
+            user.delete()
+
+        totals_query_set = (kept_user.transactions.annotate(year=ExtractYear('timestamp'),
+                                                            month=ExtractMonth('timestamp'))
+                                                  .values('year', 'month', 'transaction_cat')
+                                                  .annotate(total=Sum('amount'))
+                                                  .order_by())
+        MonthlyCategoryTotal.objects.filter(user=kept_user).delete()
+        MonthlyCategoryTotal.objects.bulk_create([MonthlyCategoryTotal(user=kept_user,
+                                                                       year=total_row['year'],
+                                                                       month=total_row['month'],
+                                                                       category=total_row['transaction_cat'],
+                                                                       total=total_row['total'])
+                                                  for total_row in totals_query_set])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0008_item_category_memo'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_users, migrations.RunPython.noop),
+    ]
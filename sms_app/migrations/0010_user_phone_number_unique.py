@@ -0,0 +1,18 @@
+# Generated by Django 4.0.1 on 2026-10-18 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0009_merge_duplicate_users'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='phone_number',
+            field=models.CharField(max_length=12, unique=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.0.1 on 2026-10-18 13:57
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0010_user_phone_number_unique'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='convmsg',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0011_convmsg_timestamp_default'),
+    ]
+
+    # The foreign keys are nullable and have no reverse accessor until the
+    # many to many fields they replace are removed in 0014
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sms_app.user'),
+        ),
+        migrations.AddField(
+            model_name='budgetcategory',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sms_app.user'),
+        ),
+        migrations.AddField(
+            model_name='convmsg',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sms_app.user'),
+        ),
+        migrations.AddField(
+            model_name='convmsg',
+            name='history',
+            field=models.CharField(default='Conversation', max_length=20),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def copy_user_links(apps, schema_editor):
+    """
+    Copies the links of the many to many fields of User into the foreign keys
+    Rows no user links to can't be reached and are deleted
+    """
+    User = apps.get_model('sms_app', 'User')
+    Transaction = apps.get_model('sms_app', 'Transaction')
+    BudgetCategory = apps.get_model('sms_app', 'BudgetCategory')
+    ConvMsg = apps.get_model('sms_app', 'ConvMsg')
+
+    for model, field_name, link_field_name in ((Transaction, 'transactions', 'transaction_id'),
+                                               (BudgetCategory, 'budget_categories', 'budgetcategory_id'),
+                                               (ConvMsg, 'conv_history', 'convmsg_id')):
+        link_model = User._meta.get_field(field_name).remote_field.through
+        link_query_set = link_model.objects.filter(**{link_field_name: OuterRef('pk')}).values('user_id')[:1]
+        model.objects.update(user_id=Subquery(link_query_set))
+
+    # Discussion messages were never in the conversation history
+    link_model = User._meta.get_field('discuss_history').remote_field.through
+    link_query_set = link_model.objects.filter(convmsg_id=OuterRef('pk')).values('user_id')[:1]
+    (ConvMsg.objects.filter(pk__in=link_model.objects.values('convmsg_id'))
+                    .update(user_id=Subquery(link_query_set), history='Discussion'))
+
+    for model in (Transaction, BudgetCategory, ConvMsg):
+        model.objects.filter(user__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0012_add_user_foreign_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_user_links, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0013_copy_user_links'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='budget_categories',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='conv_history',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='discuss_history',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='transactions',
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='sms_app.user'),
+        ),
+        migrations.AlterField(
+            model_name='budgetcategory',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='budget_categories', to='sms_app.user'),
+        ),
+        migrations.AlterField(
+            model_name='convmsg',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conv_msgs', to='sms_app.user'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'timestamp'], name='transaction_user_time'),
+        ),
+        migrations.AddIndex(
+            model_name='convmsg',
+            index=models.Index(fields=['user', 'history', 'timestamp'], name='convmsg_user_hist_time'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.1 on 2026-10-18 14:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0014_remove_user_many_to_many'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenderedChart',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('kind', models.CharField(max_length=20)),
+                ('image', models.BinaryField()),
+                ('content_type', models.CharField(default='image/png', max_length=50)),
+                ('created_timestamp', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.0.1 on 2026-10-18 14:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0015_rendered_chart'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='UserChart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_version', models.PositiveIntegerField()),
+                ('year', models.IntegerField()),
+                ('month', models.IntegerField()),
+                ('kind', models.CharField(max_length=20)),
+                ('chart', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='sms_app.renderedchart')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='charts', to='sms_app.user')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='userchart',
+            constraint=models.UniqueConstraint(fields=('user', 'data_version', 'year', 'month', 'kind'), name='user_chart_per_version'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.1 on 2026-10-18 14:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0016_user_data_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpendingCurve',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_month', models.IntegerField()),
+                ('month', models.IntegerField()),
+                ('history', models.JSONField(default=dict)),
+                ('current', models.JSONField(default=dict)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='spending_curve', to='sms_app.user')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.1 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0017_spending_curve'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inboundmsg',
+            name='claimed_timestamp',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
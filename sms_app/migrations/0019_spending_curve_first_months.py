@@ -0,0 +1,28 @@
+# Generated by Django 4.0.1 on 2026-10-18 14:36
+
+from django.db import migrations, models
+
+
+def delete_spending_curves(apps, schema_editor):
+    """
+    Deletes the curves made without the first month of each category,
+    they are fit again from the transactions when next used
+    """
+    SpendingCurve = apps.get_model('sms_app', 'SpendingCurve')
+    SpendingCurve.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0018_inbound_msg_claimed_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spendingcurve',
+            name='first_months',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.RunPython(delete_spending_curves, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.1 on 2026-10-18 14:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sms_app', '0019_spending_curve_first_months'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='intentcacheentry',
+            name='updated_timestamp',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
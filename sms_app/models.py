@@ -1,6 +1,10 @@
 # django imports
 from unicodedata import category
-from django.db import models
+from django.db import models, transaction as db_transaction
+from django.db.models import Exists, F, Max, Min, OuterRef, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.dispatch import Signal
+from django.utils import timezone
 
 # system imports 
 import uuid
@@ -8,13 +12,25 @@ import json
 import logging
 import time
 import datetime
+import decimal
+
+import numpy as np
+
+# local imports
+from sms_app.analytics import SpendingSeries, to_month_index
 
 LOGGER = logging.getLogger('friday_logger')
 
+# Sent with the user once the transactions or budget categories of a user changed
+# and the change was committed, see User.data_version
+user_data_changed = Signal()
+
+
 class Transaction(models.Model):
     """
     Class to save a single transaction
     """
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='transactions')
     phone_number = models.CharField(max_length=12)
     title = models.CharField(max_length=100)
     transaction_cat = models.CharField(max_length=100)
@@ -22,7 +38,28 @@ class Transaction(models.Model):
     timestamp = models.DateTimeField()
     trans_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
 
-    def make_transaction(phone_number, item, category, amount, location, timestamp):
+    class Meta:
+        indexes = [
+            # Serves the date range queries of a user
+            models.Index(fields=['user', 'timestamp'], name='transaction_user_time'),
+            # Serves the date range queries of a phone number, optionally for one category
+            models.Index(fields=['phone_number', 'timestamp', 'transaction_cat'],
+                         name='transaction_phone_time_cat'),
+        ]
+
+    def make_transaction(user, item, category, amount, location, timestamp):
+        """
+        Builds a transaction and adds it to the user
+        """
+        transaction = Transaction.build_transaction(user.phone_number, item, category,
+                                                    amount, location, timestamp)
+        user.add_transaction(transaction)
+        return transaction
+
+    def build_transaction(phone_number, item, category, amount, location, timestamp):
+        """
+        Builds a transaction without saving it, used for batch ingestion
+        """
         if item == '?':
             title = location
         elif location == '?':
@@ -33,12 +70,12 @@ class Transaction(models.Model):
         try:
             date = datetime.datetime.strptime(timestamp, '%m-%d-%Y')
 
-            if date.date() == datetime.date.today():
-                timestamp = datetime.datetime.now()
+            if date.date() == timezone.localdate():
+                timestamp = timezone.now()
             else:
-                timestamp = datetime.datetime(date.year, date.month, date.day)
+                timestamp = timezone.make_aware(datetime.datetime(date.year, date.month, date.day))
         except:
-            timestamp = datetime.datetime.now()
+            timestamp = timezone.now()
 
         transaction = Transaction(phone_number=phone_number,
                                   title=title,
@@ -46,14 +83,42 @@ class Transaction(models.Model):
                                   amount=amount,
                                   timestamp=timestamp)
 
-        transaction.save()
         return transaction
+
+    def get_transactions_in_range(phone_number, start, end, category='All'):
+        """
+        Gets the transactions of a phone number from start (inclusive) to end (exclusive)
+        If category is 'All', transactions of every category are returned
+        """
+        transaction_query_set = Transaction.objects.filter(phone_number=phone_number,
+                                                           timestamp__gte=start,
+                                                           timestamp__lt=end)
+        if category != 'All':
+            transaction_query_set = transaction_query_set.filter(transaction_cat=category)
+
+        return transaction_query_set
+
+    def get_month_range(month, year=None):
+        """
+        Gets the start and end datetimes of a month, defaults to the current year
+        """
+        if year is None:
+            year = timezone.localdate().year
+
+        start = timezone.make_aware(datetime.datetime(year, month, 1))
+        if month == 12:
+            end = timezone.make_aware(datetime.datetime(year + 1, 1, 1))
+        else:
+            end = timezone.make_aware(datetime.datetime(year, month + 1, 1))
+
+        return start, end
         
 
 class BudgetCategory(models.Model):
     """
     Class to save one budget category
     """
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='budget_categories')
     category_name = models.CharField(max_length=100)
     budget_amount = models.DecimalField(max_digits=20, decimal_places=2, default=0)
     cat_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -66,14 +131,27 @@ class ConvMsg(models.Model):
     MESSAGE = 'Message'
     MEDIA = 'Media'
 
+    # Histories a message can be in
+    CONVERSATION = 'Conversation'
+    DISCUSSION = 'Discussion'
+
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='conv_msgs')
+    history = models.CharField(max_length=20, default=CONVERSATION)
     # History is list stored as json, default empty list
     message = models.TextField()
     msg_type = models.CharField(max_length=20, default=MESSAGE)
     author = models.CharField(max_length=50)
     phone_number = models.CharField(max_length=12)
-    timestamp = models.DateTimeField(auto_now_add=True, editable=False)
+    # Set when the message is made so buffered messages keep their order
+    timestamp = models.DateTimeField(default=timezone.now, editable=False, db_index=True)
     conv_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
 
+    class Meta:
+        indexes = [
+            # Serves the latest messages of a history of a user
+            models.Index(fields=['user', 'history', 'timestamp'], name='convmsg_user_hist_time'),
+        ]
+
 
 class User(models.Model):
     REG = 'Registration'
@@ -87,24 +165,37 @@ class User(models.Model):
     # Identification info
     name = models.CharField(max_length=50, blank=True)
 
-    phone_number = models.CharField(max_length=12)
+    # One user per phone number, looked up on every message
+    phone_number = models.CharField(max_length=12, unique=True)
 
     user_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
 
     # State of the conversation at that moment
     state = models.CharField(max_length=30, default=REG)
 
-    # Conversation history for discussion only
-    discuss_history = models.ManyToManyField(ConvMsg, related_name='discussion_history')
+    # Counts the changes to the transactions and budget categories,
+    # what was computed from them is kept under the version it was computed at
+    data_version = models.PositiveIntegerField(default=0)
 
-    # Complete conversation history
-    conv_history = models.ManyToManyField(ConvMsg, related_name='conversation_history')
+    # Messages of the conversation and discussion histories are in conv_msgs,
+    # budget categories in budget_categories and transactions in transactions
 
-    # Budget Categories the user has
-    budget_categories = models.ManyToManyField(BudgetCategory, related_name='budget_categories')
+    # Unit of work buffering the writes of the turn being processed, see sms_app.unit_of_work
+    _unit_of_work = None
+
+    @property
+    def discuss_history(self):
+        """
+        Conversation history for discussion only
+        """
+        return self.conv_msgs.filter(history=ConvMsg.DISCUSSION)
 
-    # Transactions the user has
-    transactions = models.ManyToManyField(Transaction, related_name='transactions')
+    @property
+    def conv_history(self):
+        """
+        Complete conversation history
+        """
+        return self.conv_msgs.filter(history=ConvMsg.CONVERSATION)
 
     # -----------------------
     # Public Instance Methods
@@ -115,72 +206,113 @@ class User(models.Model):
     ####################################
     def add_discussion_msg(self, msg, sender):
         conv = ConvMsg(message=msg, author=sender, phone_number=self.phone_number)
-        conv.save()
-        self.discuss_history.add(conv)
-        self.save()
+        self._add_history_msg(ConvMsg.DISCUSSION, conv)
 
     def add_discussion_media(self, media, sender):
         conv = ConvMsg(message=media,
                        msg_type=ConvMsg.MEDIA,
                        author=sender,
                        phone_number=self.phone_number)
-        conv.save()
+        self._add_history_msg(ConvMsg.DISCUSSION, conv)
 
-        self.discuss_history.add(conv)
-        self.save()
-
-    def get_discussion(self):
-        in_discussion_set = set(self.discuss_history.all())
-        curated_discussion_list = list()
-
-        # Create list for the discussion
-        for conv_item in in_discussion_set:
-            msg = conv_item.message
-            author = conv_item.author
-            timestamp = conv_item.timestamp
-            curated_discussion_list.append({'Timestamp': timestamp,
-                                            'Author': author, 'Message': msg})
-        
-        # sort the curated discussion list by time
-        curated_discussion_list.sort(key=lambda x:x['Timestamp'])
+    def get_discussion(self, limit=None):
+        """
+        Gets the discussion in chronological order, only the last limit messages if given
+        """
+        return self._get_history_list(ConvMsg.DISCUSSION, limit)
 
-        return curated_discussion_list
+    def iter_discussion(self):
+        """
+        Streams the whole discussion in chronological order
+        """
+        return self._iter_history(ConvMsg.DISCUSSION)
 
     ##############################################
     # For modifying the conversation history stack
     ##############################################
     def add_conversation_msg(self, msg, sender):
         conv = ConvMsg(message=msg, author=sender, phone_number=self.phone_number)
-        conv.save()
-        self.conv_history.add(conv)
-        self.save()
+        self._add_history_msg(ConvMsg.CONVERSATION, conv)
 
     def add_conversation_media(self, media, sender):
         conv = ConvMsg(message=media,
                        msg_type=ConvMsg.MEDIA,
                        author=sender,
                        phone_number=self.phone_number)
-        conv.save()
+        self._add_history_msg(ConvMsg.CONVERSATION, conv)
+
+    def get_conversation(self, limit=None):
+        """
+        Gets the conversation in chronological order, only the last limit messages if given
+        """
+        return self._get_history_list(ConvMsg.CONVERSATION, limit)
 
-        self.conv_history.add(conv)
-        self.save()
+    def iter_conversation(self):
+        """
+        Streams the whole conversation in chronological order
+        """
+        return self._iter_history(ConvMsg.CONVERSATION)
 
-    def get_conversation(self):
-        in_conversation_set = set(self.conv_history.all())
-        curated_conversation_list = list()
+    def get_conversation_summary(self, limit=3):
+        """
+        Gets the summaries of the latest compacted conversation as one string
+        Returns None if nothing has been compacted yet
+        """
+        summary_query_set = (self.conv_summaries.filter(history=ConvSummary.CONVERSATION)
+                                                .order_by('-end_timestamp')[:limit])
+        summaries = [item.summary for item in summary_query_set]
+        if not summaries:
+            return None
 
-        # Create list for the discussion
-        for conv_item in in_conversation_set:
-            msg = conv_item.message
-            author = conv_item.author
-            timestamp = conv_item.timestamp
-            curated_conversation_list.append({'Timestamp': timestamp,
-                                            'Author': author, 'Message': msg})
-        
-        # sort the curated discussion list by time
-        curated_conversation_list.sort(key=lambda x:x['Timestamp'])
+        summaries.reverse()
+        return '\n'.join(summaries)
+
+    ##################################
+    # For compacting the message stacks
+    ##################################
+    def compact_history(self, before, keep=0, chunk_size=500):
+        """
+        Folds the messages older than before into summaries and moves them to the archive
+        The latest keep messages of each history are never compacted
+        Returns the number of messages compacted
+        """
+        num_compacted = 0
 
-        return curated_conversation_list
+        for history_name, history in ((ConvSummary.CONVERSATION, self.conv_history),
+                                      (ConvSummary.DISCUSSION, self.discuss_history)):
+            kept_ids = list(history.order_by('-timestamp').values_list('conv_id', flat=True)[:keep])
+
+            while True:
+                old_msgs = list(history.filter(timestamp__lt=before)
+                                       .exclude(conv_id__in=kept_ids)
+                                       .order_by('timestamp')[:chunk_size])
+                if not old_msgs:
+                    break
+
+                archived_msgs = list()
+                for conv_item in old_msgs:
+                    archived_msgs.append(ArchivedConvMsg(conv_id=conv_item.conv_id,
+                                                         user=self,
+                                                         history=history_name,
+                                                         message=conv_item.message,
+                                                         msg_type=conv_item.msg_type,
+                                                         author=conv_item.author,
+                                                         phone_number=conv_item.phone_number,
+                                                         timestamp=conv_item.timestamp))
+
+                with db_transaction.atomic():
+                    ConvSummary.objects.create(user=self,
+                                               history=history_name,
+                                               summary=ConvSummary.summarize(old_msgs, self.name),
+                                               num_messages=len(old_msgs),
+                                               start_timestamp=old_msgs[0].timestamp,
+                                               end_timestamp=old_msgs[-1].timestamp)
+                    ArchivedConvMsg.objects.bulk_create(archived_msgs)
+                    ConvMsg.objects.filter(conv_id__in=[item.conv_id for item in old_msgs]).delete()
+
+                num_compacted += len(old_msgs)
+
+        return num_compacted
 
     #####################################
     # For modifying the budget categories
@@ -196,10 +328,7 @@ class User(models.Model):
         categories.append(BudgetCategory(category_name="Clothing"))
         categories.append(BudgetCategory(category_name="Health"))
 
-        for item in categories:
-            item.save()
-            self.budget_categories.add(item)
-            self.save()
+        self._add_budget_categories(categories)
 
     def get_category_amount_dict(self):
         categories = set(self.budget_categories.all())
@@ -214,11 +343,14 @@ class User(models.Model):
         
         return out_category_dict
 
-    def get_category_info_list(self, month):
+    def get_category_info_list(self, month, year=None):
         categories = set(self.budget_categories.all())
         # Set of categories to return
         out_category_list = list()
 
+        # Spent amount of every category in one grouped query
+        spent_dict = self.get_transactions_total_by_category(month, year)
+
         total_spent = 0
         total_left = 0
         total_budget = 0
@@ -227,7 +359,7 @@ class User(models.Model):
             info_dict = dict()
             amount = float(category.budget_amount)
             category_name = category.category_name
-            spent = float(self.get_transactions_total(month, category_name))
+            spent = float(spent_dict.get(category_name, 0))
             info_dict['Category'] = category_name
             info_dict['Spent'] = spent
             if amount != 0:
@@ -280,18 +412,146 @@ class User(models.Model):
         return out_category_list
     
     def modify_categories_from_dict(self, category_dict):
-        for cat in self.budget_categories.all():
-            cat.delete()
-        self.budget_categories.clear()
+        """
+        Changes the categories of the user to the ones in the dict of name to amount
+        Returns the change set of reconcile_categories
+        """
+        change_set = self.reconcile_categories(category_dict)
+
+        old_names = (set(category_dict.keys()) - set(change_set['Added'])) | set(change_set['Removed'])
+        ItemCategoryMemo.invalidate_for_categories(self, old_names, set(category_dict.keys()))
+
+        return change_set
+
+    def reconcile_categories(self, category_dict):
+        """
+        Makes the stored categories match the dict of name to amount, 'N/A' for no budget
+        Only the categories that changed are written, with one bulk insert, update and
+        delete in one db transaction
+        Returns a dict of the 'Added', 'Updated' and 'Removed' category names
+        """
+        new_amount_dict = dict()
         for name, amount in category_dict.items():
             if amount == 'N/A':
-                category = BudgetCategory(category_name=name)
-            else:
-                amount = float(amount)
-                category = BudgetCategory(category_name=name, budget_amount=amount)
-            category.save()
-            self.budget_categories.add(category)
-            self.save()
+                amount = 0
+            new_amount_dict[name] = decimal.Decimal(str(float(amount))).quantize(decimal.Decimal('0.01'))
+
+        added_categories = list()
+        updated_categories = list()
+        removed_ids = list()
+        removed_names = list()
+
+        with db_transaction.atomic():
+            stored_dict = dict()
+            for category in self.budget_categories.select_for_update():
+                name = category.category_name
+                if name not in new_amount_dict:
+                    removed_ids.append(category.pk)
+                    if name not in removed_names:
+                        removed_names.append(name)
+                elif name in stored_dict:
+                    # Duplicate names are left over from before categories were reconciled
+                    removed_ids.append(category.pk)
+                else:
+                    stored_dict[name] = category
+
+            for name, amount in new_amount_dict.items():
+                category = stored_dict.get(name)
+                if category is None:
+                    added_categories.append(BudgetCategory(category_name=name, budget_amount=amount))
+                elif category.budget_amount != amount:
+                    category.budget_amount = amount
+                    updated_categories.append(category)
+
+            if removed_ids:
+                BudgetCategory.objects.filter(pk__in=removed_ids).delete()
+            if updated_categories:
+                BudgetCategory.objects.bulk_update(updated_categories, ['budget_amount'])
+            if added_categories:
+                self._add_budget_categories(added_categories)
+
+            if removed_ids or updated_categories or added_categories:
+                self._bump_data_version()
+
+        return {'Added': [category.category_name for category in added_categories],
+                'Updated': [category.category_name for category in updated_categories],
+                'Removed': removed_names}
+
+    ##########################################
+    # For remembering the category of an item
+    ##########################################
+    def lookup_item_categories(self, item_list):
+        """
+        Takes a list of (item, location) and returns the remembered category of each
+        or None where the item is new, all in one query
+        The same item at another location is used if the location is new
+        """
+        key_list = [ItemCategoryMemo.get_keys(item, location) for item, location in item_list]
+
+        exact_dict = dict()
+        item_dict = dict()
+        memo_query_set = (self.category_memos.filter(item_key__in=set(key[0] for key in key_list))
+                                             .order_by('updated_timestamp'))
+        for memo in memo_query_set:
+            exact_dict[(memo.item_key, memo.location_key)] = memo.category
+            # Latest category of the item wherever it was bought
+            item_dict[memo.item_key] = memo.category
+
+        category_list = list()
+        for key in key_list:
+            category = exact_dict.get(key)
+            if category is None:
+                category = item_dict.get(key[0])
+            category_list.append(category)
+
+        return category_list
+
+    def remember_item_categories(self, categorized_list):
+        """
+        Takes a list of (item, location, category) and remembers the category of each item
+        """
+        memo_dict = dict()
+        for item, location, category in categorized_list:
+            item_key, location_key = ItemCategoryMemo.get_keys(item, location)
+            if item_key == '':
+                continue
+            memo_dict[(item_key, location_key)] = ItemCategoryMemo(user=self,
+                                                                   item_key=item_key,
+                                                                   location_key=location_key,
+                                                                   category=category)
+
+        if not memo_dict:
+            return
+
+        with db_transaction.atomic():
+            # Replace what was remembered for the same items
+            old_ids = list()
+            memo_query_set = self.category_memos.filter(item_key__in=set(key[0] for key in memo_dict.keys()))
+            for memo in memo_query_set:
+                if (memo.item_key, memo.location_key) in memo_dict:
+                    old_ids.append(memo.pk)
+
+            ItemCategoryMemo.objects.filter(pk__in=old_ids).delete()
+            ItemCategoryMemo.objects.bulk_create(memo_dict.values())
+
+    def learn_item_categories(self):
+        """
+        Remembers the categories of the items in the past transactions of the user
+        Only transactions of categories the user still has are learned from
+        """
+        category_names = self.get_category_names_list()
+        transaction_query_set = (self.transactions.filter(transaction_cat__in=category_names)
+                                                  .order_by('timestamp')
+                                                  .values_list('title', 'transaction_cat'))
+
+        categorized_list = list()
+        for title, category in transaction_query_set.iterator():
+            item, location = ItemCategoryMemo.split_title(title)
+            categorized_list.append((item, location, category))
+
+        self.remember_item_categories(categorized_list)
+
+        return len(categorized_list)
 
     ##############
     # Transactions
@@ -300,69 +560,189 @@ class User(models.Model):
         """
         Adds the transaction to the user
         """
-        self.transactions.add(transaction)
-        self.save()
+        with db_transaction.atomic():
+            transaction.user = self
+            transaction.save()
+            MonthlyCategoryTotal.add_to_total(self, transaction.timestamp,
+                                              transaction.transaction_cat,
+                                              transaction.amount)
+            SpendingCurve.add_transactions(self, [transaction])
+            self._bump_data_version()
 
-    def get_recent_transactions_dict(self, month, category):
+    def add_transactions(self, transactions):
+        """
+        Saves a batch of unsaved transactions and adds them to the user
+        Uses a bulk insert with the rollup update in one db transaction
+        """
+        total_dict = dict()
+        for transaction in transactions:
+            transaction.user = self
+
+            date = timezone.localtime(transaction.timestamp)
+            key = (date.year, date.month, transaction.transaction_cat)
+            total_dict[key] = total_dict.get(key, 0) + transaction.amount
+
+        with db_transaction.atomic():
+            Transaction.objects.bulk_create(transactions)
+            MonthlyCategoryTotal.add_to_totals(self, total_dict)
+            SpendingCurve.add_transactions(self, transactions)
+            self._bump_data_version()
+
+        return transactions
+
+    def get_transactions_in_range(self, start, end, category='All'):
+        """
+        Gets the transactions of the user from start (inclusive) to end (exclusive)
+        """
+        transaction_query_set = self.transactions.filter(timestamp__gte=start, timestamp__lt=end)
+        if category != 'All':
+            transaction_query_set = transaction_query_set.filter(transaction_cat=category)
+
+        return transaction_query_set
+
+    def get_recent_transactions_dict(self, month, category, year=None):
         """
         Gets recent transactions in a list of dict elements
         """
         transaction_list = list()
 
-        # Find all the transactions in that category
+        # Find all the transactions in that category for the month
         # If all, then get all transactions
-        transaction_query_set = self.transactions.all()
+        start, end = Transaction.get_month_range(month, year)
+        transaction_query_set = self.get_transactions_in_range(start, end, category)
 
-        for transaction in transaction_query_set:
+        for transaction in transaction_query_set.order_by('timestamp'):
             date = transaction.timestamp
-            transaction_cat = transaction.transaction_cat
-            if category == 'All':
-                pass
-            elif category != transaction_cat:
-                continue
-            if date.date().month == month:
-                pass
-            else:
-                continue
-
-            title = transaction.title
-            amount = transaction.amount
-            transaction_list.append({'Title': title,
-                                     'Amount': amount,
-                                     'Category': transaction_cat,
+            transaction_list.append({'Title': transaction.title,
+                                     'Amount': transaction.amount,
+                                     'Category': transaction.transaction_cat,
                                      'Date': date.date(),
                                      'DateTime': date})
-        
-        transaction_list.sort(key=lambda x:x['Date'])
 
         return transaction_list
             
-    def get_transactions_total(self, month, category):
+    def get_transactions_total(self, month, category, year=None):
         """
-        Gets recent transactions in a list of dict elements
+        Gets the total spent in the month for a category
         """
-        total = 0
+        total_dict = self.get_transactions_total_by_category(month, year)
 
-        # Find all the transactions in that category
-        # If all, then get all transactions
-        transaction_query_set = self.transactions.all()
+        if category == 'All':
+            return sum(total_dict.values())
 
-        for transaction in transaction_query_set:
-            transaction_cat = transaction.transaction_cat
-            date = transaction.timestamp
-            if category == 'All':
-                pass
-            elif category != transaction_cat:
-                continue
+        return total_dict.get(category, 0)
 
-            if date.date().month == month:
-                pass
-            else:
-                continue
+    def get_transactions_total_by_category(self, month, year=None):
+        """
+        Gets the total spent in each category as a dict of category name to total
+        Read from the monthly rollup instead of the transactions themselves, a month
+        of a category is one row there while SpendingSeries loads every transaction
+        """
+        if year is None:
+            year = timezone.localdate().year
 
-            total += transaction.amount
-        
-        return total
+        totals_query_set = self.monthly_totals.filter(year=year, month=month)
+
+        total_dict = dict()
+        for row in totals_query_set:
+            total_dict[row.category] = row.total
+
+        return total_dict
+
+    # ------------------------
+    # Private helper functions
+    # ------------------------
+
+    def _get_history(self, history_name):
+        return self.conv_msgs.filter(history=history_name)
+
+    def _add_history_msg(self, history_name, conv):
+        """
+        Saves a message to a history, or buffers it while a unit of work is open
+        """
+        conv.user = self
+        conv.history = history_name
+
+        if self._unit_of_work is not None:
+            self._unit_of_work.add_msg(history_name, conv)
+            return
+
+        conv.save()
+
+    def _get_pending_msgs(self, history_name):
+        """
+        Gets the messages of a history buffered by the open unit of work as dicts, oldest first
+        """
+        if self._unit_of_work is None:
+            return []
+
+        return [{'Timestamp': conv_item.timestamp,
+                 'Author': conv_item.author,
+                 'Message': conv_item.message}
+                for conv_item in self._unit_of_work.get_pending_msgs(history_name)]
+
+    def _iter_history(self, history_name):
+        """
+        Yields the messages of a history as dicts, oldest first
+        """
+        # Taken first since the unit of work may be flushed while streaming
+        pending_msgs = self._get_pending_msgs(history_name)
+
+        history_query_set = (self._get_history(history_name).order_by('timestamp')
+                                                            .values('timestamp', 'author', 'message'))
+
+        for conv_item in history_query_set.iterator():
+            yield {'Timestamp': conv_item['timestamp'],
+                   'Author': conv_item['author'],
+                   'Message': conv_item['message']}
+
+        yield from pending_msgs
+
+    def _get_history_list(self, history_name, limit):
+        """
+        Gets the messages of a history as a list of dicts, oldest first
+        If limit is given only the latest limit messages are fetched
+        """
+        if limit is None:
+            return list(self._iter_history(history_name))
+
+        pending_msgs = self._get_pending_msgs(history_name)
+        if len(pending_msgs) >= limit:
+            return pending_msgs[len(pending_msgs) - limit:]
+        limit -= len(pending_msgs)
+
+        history_query_set = (self._get_history(history_name).order_by('-timestamp')
+                                                            .values('timestamp', 'author', 'message'))
+
+        curated_history_list = list()
+        for conv_item in history_query_set[:limit]:
+            curated_history_list.append({'Timestamp': conv_item['timestamp'],
+                                         'Author': conv_item['author'],
+                                         'Message': conv_item['message']})
+
+        # Latest messages were fetched first
+        curated_history_list.reverse()
+
+        return curated_history_list + pending_msgs
+
+    def _add_budget_categories(self, categories):
+        """
+        Saves new categories of the user with a bulk insert
+        """
+        for category in categories:
+            category.user = self
+
+        BudgetCategory.objects.bulk_create(categories)
+
+    def _bump_data_version(self):
+        """
+        Counts a change of the data of the user, should be called in the db transaction
+        making the change
+        """
+        User.objects.filter(pk=self.pk).update(data_version=F('data_version') + 1)
+        self.data_version += 1
+
+        db_transaction.on_commit(lambda: user_data_changed.send(sender=User, user=self))
 
     # -----------------------
     # Static Public functions
@@ -373,9 +753,536 @@ class User(models.Model):
         Tries to find using phone num, returns None if not found
         """
         try:
-            user = User.objects.get(phone_number=phone_num)
-        except:
+            return User.objects.get(phone_number=phone_num)
+        except User.DoesNotExist:
+            return None
+
+    def get_or_register(phone_num):
+        """
+        Gets the user of the phone number, registering a new one if there is none
+        Returns the user and whether it was registered, safe when two messages
+        from a new number arrive at once
+        """
+        user = User.find_user_from_phone(phone_num)
+        if user is not None:
+            return user, False
+
+        # Inserts in a savepoint and falls back to a get if the other message inserted first
+        return User.objects.get_or_create(phone_number=phone_num, defaults={'state': User.REG})
+
+
+class MonthlyCategoryTotal(models.Model):
+    """
+    Class to save the total spent by a user in a category for one month
+    Kept up to date as transactions are added so summaries don't scan the ledger
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_totals')
+    year = models.IntegerField()
+    month = models.IntegerField()
+    category = models.CharField(max_length=100)
+    total = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'year', 'month', 'category'],
+                                    name='monthly_total_per_category'),
+        ]
+
+    # -----------------------
+    # Static Public functions
+    # -----------------------
+
+    def add_to_total(user, timestamp, category, amount):
+        """
+        Adds the amount to the month total of the category at timestamp
+        Should be called in the same db transaction that saves the transaction
+        """
+        date = timezone.localtime(timestamp) if timezone.is_aware(timestamp) else timestamp
+        monthly_total, created = MonthlyCategoryTotal.objects.get_or_create(
+                user=user, year=date.year, month=date.month, category=category,
+                defaults={'total': amount})
+
+        if not created:
+            MonthlyCategoryTotal.objects.filter(pk=monthly_total.pk).update(total=F('total') + amount)
+
+    def add_to_totals(user, total_dict):
+        """
+        Adds a dict of (year, month, category) to amount onto the month totals
+        Existing rows are updated and missing rows are created in bulk
+        """
+        if not total_dict:
+            return
+
+        years = set(year for year, month, category in total_dict.keys())
+        existing_dict = dict()
+        for monthly_total in user.monthly_totals.filter(year__in=years):
+            key = (monthly_total.year, monthly_total.month, monthly_total.category)
+            existing_dict[key] = monthly_total
+
+        new_totals = list()
+        for key, amount in total_dict.items():
+            if key in existing_dict:
+                MonthlyCategoryTotal.objects.filter(pk=existing_dict[key].pk).update(total=F('total') + amount)
+            else:
+                year, month, category = key
+                new_totals.append(MonthlyCategoryTotal(user=user, year=year, month=month,
+                                                       category=category, total=amount))
+
+        MonthlyCategoryTotal.objects.bulk_create(new_totals)
+
+    def rebuild_for_user(user):
+        """
+        Recomputes all the month totals of the user from their transactions
+        """
+        totals_query_set = (user.transactions.annotate(year=ExtractYear('timestamp'),
+                                                       month=ExtractMonth('timestamp'))
+                                             .values('year', 'month', 'transaction_cat')
+                                             .annotate(total=Sum('amount'))
+                                             .order_by())
+
+        monthly_totals = list()
+        for row in totals_query_set:
+            monthly_totals.append(MonthlyCategoryTotal(user=user,
+                                                       year=row['year'],
+                                                       month=row['month'],
+                                                       category=row['transaction_cat'],
+                                                       total=row['total']))
+
+        with db_transaction.atomic():
+            user.monthly_totals.all().delete()
+            MonthlyCategoryTotal.objects.bulk_create(monthly_totals)
+
+        return len(monthly_totals)
+
+
+class SpendingCurve(models.Model):
+    """
+    Class to save how the spending of a user in each category is spread over the days of a month
+    Kept up to date as transactions are added instead of refit from the ledger,
+    used to forecast the spending at the end of the month, see sms_app.forecasting
+    """
+    DAYS = 31
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='spending_curve')
+    # Month indexes of the first transaction and of the month in current, see analytics.to_month_index
+    first_month = models.IntegerField()
+    month = models.IntegerField()
+    # Category name to the month index of its first transaction
+    first_months = models.JSONField(default=dict)
+    # Category name to a list of the cents spent on each day of the month,
+    # summed over the months before month in history and for month in current
+    history = models.JSONField(default=dict)
+    current = models.JSONField(default=dict)
+
+    # -----------------------
+    # Static Public functions
+    # -----------------------
+
+    def get_for_user(user):
+        """
+        Gets the curve of the user, fit from their transactions if they don't have one yet
+        """
+        curve = SpendingCurve.objects.filter(user=user).first()
+        if curve is None:
+            curve = SpendingCurve.rebuild_for_user(user)
+        return curve
+
+    def add_transactions(user, transactions):
+        """
+        Adds saved transactions to the curve of the user
+        Should be called in the same db transaction that saves them
+        """
+        curve = SpendingCurve.objects.select_for_update().filter(user=user).first()
+        if curve is None:
+            # Fit from the whole ledger, which has the new transactions already
+            SpendingCurve.rebuild_for_user(user)
+            return
+
+        for transaction in transactions:
+            timestamp = transaction.timestamp
+            date = timezone.localtime(timestamp) if timezone.is_aware(timestamp) else timestamp
+            month = to_month_index(date.year, date.month)
+
+            if month > curve.month:
+                curve.start_month(month)
+            curve.first_month = min(curve.first_month, month)
+            name = transaction.transaction_cat
+            curve.first_months[name] = min(curve.first_months.get(name, month), month)
+
+            curve_dict = curve.current if month == curve.month else curve.history
+            day_list = curve_dict.setdefault(name, [0] * SpendingCurve.DAYS)
+            day_list[date.day - 1] += int((decimal.Decimal(str(transaction.amount)) * 100).to_integral_value())
+
+        curve.save()
+
+    def rebuild_for_user(user):
+        """
+        Fits the curve of the user from all of their transactions
+        """
+        today = timezone.localdate()
+        month = to_month_index(today.year, today.month)
+        first_month = month
+        history = dict()
+        current = dict()
+        first_months = dict()
+
+        range_dict = user.transactions.aggregate(start=Min('timestamp'), end=Max('timestamp'))
+        if range_dict['start'] is not None:
+            start_date = timezone.localtime(range_dict['start']).date()
+            end_date = timezone.localtime(range_dict['end']).date() + datetime.timedelta(days=1)
+            series = SpendingSeries.load(user, start_date, end_date)
+
+            dates = series.days.astype('datetime64[D]')
+            months = dates.astype('datetime64[M]')
+            month_indexes = months.astype(np.int64)
+            days_of_month = (dates - months.astype('datetime64[D]')).astype(np.int64)
+
+            month = max(month, int(month_indexes.max()))
+            first_month = min(month, int(month_indexes.min()))
+
+            is_current = month_indexes == month
+            num_categories = len(series.categories)
+
+            category_first_months = np.full(num_categories, month, dtype=np.int64)
+            np.minimum.at(category_first_months, series.codes.astype(np.int64), month_indexes)
+            first_months = dict(zip(series.categories, category_first_months.tolist()))
+
+            for curve_dict, mask in ((history, ~is_current), (current, is_current)):
+                index = series.codes[mask].astype(np.int64) * SpendingCurve.DAYS + days_of_month[mask]
+                grid = np.bincount(index, weights=series.cents[mask],
+                                   minlength=num_categories * SpendingCurve.DAYS)
+                grid = np.rint(grid).astype(np.int64).reshape(num_categories, SpendingCurve.DAYS)
+                for name, day_list in zip(series.categories, grid.tolist()):
+                    if any(day_list):
+                        curve_dict[name] = day_list
+
+        curve, created = SpendingCurve.objects.update_or_create(
+                user=user, defaults={'first_month': first_month, 'month': month,
+                                     'first_months': first_months,
+                                     'history': history, 'current': current})
+        return curve
+
+    # -----------------------
+    # Public Instance Methods
+    # -----------------------
+
+    def start_month(self, month):
+        """
+        Moves the spending of the current month into the history and starts a later month
+        """
+        for name, day_list in self.current.items():
+            history_list = self.history.setdefault(name, [0] * SpendingCurve.DAYS)
+            for day, cents in enumerate(day_list):
+                history_list[day] += cents
+
+        self.current = dict()
+        self.month = month
+
+
+class ConvSummary(models.Model):
+    """
+    Class to save a summary of compacted messages of a user
+    """
+    CONVERSATION = 'Conversation'
+    DISCUSSION = 'Discussion'
+
+    # Number of user messages quoted in a summary
+    MAX_EXCERPTS = 10
+    # Length an excerpt is clipped to
+    MAX_EXCERPT_LENGTH = 60
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conv_summaries')
+    history = models.CharField(max_length=20, default=CONVERSATION)
+    summary = models.TextField()
+    num_messages = models.IntegerField()
+    start_timestamp = models.DateTimeField()
+    end_timestamp = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'history', 'end_timestamp'],
+                         name='conv_summary_user_hist_end'),
+        ]
+
+    # -----------------------
+    # Static Public functions
+    # -----------------------
+
+    def summarize(conv_items, user_name):
+        """
+        Makes a short text summary of a chronological list of messages
+        """
+        num_user_msgs = 0
+        num_friday_msgs = 0
+        excerpts = list()
+
+        for conv_item in conv_items:
+            if conv_item.author == ConvMsg.FRIDAY:
+                num_friday_msgs += 1
+                continue
+
+            num_user_msgs += 1
+            if conv_item.msg_type == ConvMsg.MESSAGE:
+                excerpt = ' '.join(conv_item.message.split())
+                if len(excerpt) > ConvSummary.MAX_EXCERPT_LENGTH:
+                    excerpt = excerpt[:ConvSummary.MAX_EXCERPT_LENGTH - 3] + '...'
+                excerpts.append(excerpt)
+
+        start = conv_items[0].timestamp
+        end = conv_items[-1].timestamp
+        summary = ('From %s/%s/%s to %s/%s/%s %s sent %s messages and Friday sent %s.' %
+                   (start.month, start.day, start.year, end.month, end.day, end.year,
+                    user_name, num_user_msgs, num_friday_msgs))
+
+        # Keep the latest things the user talked about
+        excerpts = excerpts[-ConvSummary.MAX_EXCERPTS:]
+        if excerpts:
+            summary += ' %s talked about: %s' % (user_name, ' | '.join(excerpts))
+
+        return summary
+
+
+class ArchivedConvMsg(models.Model):
+    """
+    Class to save a message that was compacted out of the conversation history
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_msgs')
+    history = models.CharField(max_length=20, default=ConvSummary.CONVERSATION)
+    message = models.TextField()
+    msg_type = models.CharField(max_length=20, default=ConvMsg.MESSAGE)
+    author = models.CharField(max_length=50)
+    phone_number = models.CharField(max_length=12)
+    timestamp = models.DateTimeField()
+    conv_id = models.UUIDField(primary_key=True, editable=False)
+
+
+class InboundMsg(models.Model):
+    """
+    Class to save a received sms until a worker processes it
+    Jobs are processed in the order of msg_id for each phone number, several workers
+    can run but only one processes the messages of a phone number at a time
+    """
+    PENDING = 'Pending'
+    PROCESSING = 'Processing'
+    DONE = 'Done'
+    FAILED = 'Failed'
+
+    msg_id = models.BigAutoField(primary_key=True)
+    phone_number = models.CharField(max_length=12)
+    message = models.TextField()
+    status = models.CharField(max_length=20, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    received_timestamp = models.DateTimeField(auto_now_add=True, editable=False)
+    processed_timestamp = models.DateTimeField(null=True, blank=True)
+    # When a worker claimed it, see requeue_interrupted
+    claimed_timestamp = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'phone_number', 'msg_id'],
+                         name='inbound_status_phone_id'),
+        ]
+
+    # -----------------------
+    # Public Instance Methods
+    # -----------------------
+
+    def mark_done(self):
+        self.status = InboundMsg.DONE
+        self.processed_timestamp = timezone.now()
+        self.save(update_fields=['status', 'processed_timestamp'])
+
+    def mark_failed(self, error):
+        self.status = InboundMsg.FAILED
+        self.error = error
+        self.processed_timestamp = timezone.now()
+        self.save(update_fields=['status', 'error', 'processed_timestamp'])
+
+    # -----------------------
+    # Static Public functions
+    # -----------------------
+
+    def enqueue(phone_number, message):
+        """
+        Saves a received message for the worker to process
+        """
+        return InboundMsg.objects.create(phone_number=phone_number, message=message)
+
+    def get_pending_phone_numbers(exclude=(), limit=None):
+        """
+        Gets the phone numbers that have messages waiting, oldest first
+        Phone numbers another worker is processing a message of are left out
+        """
+        phone_query_set = (InboundMsg.objects.filter(status=InboundMsg.PENDING)
+                                             .exclude(phone_number__in=list(exclude))
+                                             .exclude(Exists(InboundMsg._get_processing(OuterRef('phone_number'))))
+                                             .values('phone_number')
+                                             .annotate(first_id=models.Min('msg_id'))
+                                             .order_by('first_id')
+                                             .values_list('phone_number', flat=True))
+        if limit is not None:
+            phone_query_set = phone_query_set[:limit]
+
+        return list(phone_query_set)
+
+    def claim_next(phone_number):
+        """
+        Marks the oldest pending message of the phone number as processing and returns it
+        Returns None if there is none, another worker got it first or another worker
+        is processing a message of the phone number
+        """
+        inbound_msg = (InboundMsg.objects.filter(phone_number=phone_number, status=InboundMsg.PENDING)
+                                         .order_by('msg_id')
+                                         .first())
+        if inbound_msg is None:
             return None
 
-        return user
+        claimed_timestamp = timezone.now()
+        num_claimed = (InboundMsg.objects.filter(pk=inbound_msg.pk, status=InboundMsg.PENDING)
+                                         .exclude(Exists(InboundMsg._get_processing(phone_number)))
+                                         .update(status=InboundMsg.PROCESSING,
+                                                 attempts=F('attempts') + 1,
+                                                 claimed_timestamp=claimed_timestamp))
+        if num_claimed == 0:
+            return None
+
+        inbound_msg.status = InboundMsg.PROCESSING
+        inbound_msg.attempts += 1
+        inbound_msg.claimed_timestamp = claimed_timestamp
+        return inbound_msg
+
+    def requeue_interrupted(lease_seconds):
+        """
+        Puts messages claimed more than lease_seconds ago back in the queue,
+        their worker is taken to have stopped
+        """
+        lease_start = timezone.now() - datetime.timedelta(seconds=lease_seconds)
+        return (InboundMsg.objects.filter(status=InboundMsg.PROCESSING)
+                                  .filter(models.Q(claimed_timestamp__lt=lease_start) |
+                                          models.Q(claimed_timestamp__isnull=True))
+                                  .update(status=InboundMsg.PENDING))
+
+    # ------------------------
+    # Private helper functions
+    # ------------------------
+
+    def _get_processing(phone_number):
+        return InboundMsg.objects.filter(phone_number=phone_number, status=InboundMsg.PROCESSING)
+
 
+class IntentCacheEntry(models.Model):
+    """
+    Class to save the classified intent of a normalized message
+    Shared by all the workers, see gpt3_utilities.intent_cache
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    normalized_text = models.TextField()
+    label = models.CharField(max_length=100)
+    updated_timestamp = models.DateTimeField(auto_now=True, db_index=True)
+
+    # -----------------------
+    # Static Public functions
+    # -----------------------
+
+    def delete_expired(ttl):
+        """
+        Deletes the entries not written in the last ttl seconds, they are no longer read
+        Returns the number of entries deleted
+        """
+        oldest = timezone.now() - datetime.timedelta(seconds=ttl)
+        num_deleted, deleted_dict = IntentCacheEntry.objects.filter(updated_timestamp__lt=oldest).delete()
+        return num_deleted
+
+
+class RenderedChart(models.Model):
+    """
+    Class to save a rendered chart image
+    Keyed by the hash of what was drawn so a chart is only rendered once,
+    see visualizations.charts
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    kind = models.CharField(max_length=20)
+    image = models.BinaryField()
+    content_type = models.CharField(max_length=50, default='image/png')
+    created_timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class UserChart(models.Model):
+    """
+    Class to save which chart shows the data of a user in a month at a data version
+    Written by the background prerender so inquiries are answered from it,
+    see visualizations.prerender
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='charts')
+    data_version = models.PositiveIntegerField()
+    year = models.IntegerField()
+    month = models.IntegerField()
+    kind = models.CharField(max_length=20)
+    chart = models.ForeignKey(RenderedChart, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'data_version', 'year', 'month', 'kind'],
+                                    name='user_chart_per_version'),
+        ]
+
+
+class ItemCategoryMemo(models.Model):
+    """
+    Class to save the category a user's item was classified into
+    Keys are the normalized item and location, '' when unknown
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='category_memos')
+    item_key = models.CharField(max_length=100)
+    location_key = models.CharField(max_length=100)
+    category = models.CharField(max_length=100)
+    updated_timestamp = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'item_key', 'location_key'],
+                                    name='category_memo_per_item'),
+        ]
+
+    # -----------------------
+    # Static Public functions
+    # -----------------------
+
+    def normalize(text):
+        """
+        Folds case, punctuation and whitespace of an item or location
+        """
+        if text is None or text == '?':
+            return ''
+        words = ''.join(char if char.isalnum() else ' ' for char in str(text).casefold()).split()
+        return ' '.join(words)[:100]
+
+    def get_keys(item, location):
+        """
+        Gets the (item, location) keys, the location stands in for an unknown item
+        the same way it does in the transaction title
+        """
+        if item == '?':
+            item, location = location, '?'
+        return ItemCategoryMemo.normalize(item), ItemCategoryMemo.normalize(location)
+
+    def split_title(title):
+        """
+        Splits a transaction title back into its item and location
+        """
+        if ' @ ' in title:
+            item, location = title.split(' @ ', 1)
+            return item, location
+        return title, '?'
+
+    def invalidate_for_categories(user, old_names, new_names):
+        """
+        Forgets remembered categories that may be wrong after the categories change
+        A new category could fit any item better so everything is forgotten,
+        otherwise only the items of removed categories are
+        """
+        if new_names - old_names:
+            user.category_memos.all().delete()
+        elif old_names - new_names:
+            user.category_memos.filter(category__in=old_names - new_names).delete()
@@ -0,0 +1,157 @@
+# System imports
+import collections
+import math
+import re
+import threading
+
+# local imports
+from sms_app.models import User
+from sms_app.gpt3_utilities.intent_cache import normalize_text
+from sms_app.gpt3_utilities.response_utilities import (CONVERSATION_CATEGORY_EXAMPLES,
+                                                       CONVERSATION_CATEGORY_LABELS)
+
+# Amount of money in a message like $12, 12.50 dollars or 20 bucks
+AMOUNT = r'(\$\s?\d|\b\d+(\.\d+)?\s*(dollars|bucks|k)\b)'
+
+# Messages with an amount that aren't new expenses: questions, income, money paid back
+# and corrections of past transactions
+NOT_EXPENSE_PATTERNS = [
+    r'^\s*(how|what|when|where|why|did|can|could|should)\b',
+    r'\b(got paid|paid me|from|back|raise|paycheck|salary|reimburs\w*|refund\w*)\b',
+    r'\b(remove|delete|undo|cancel)\b',
+]
+
+# Each rule is (label, confidence, patterns that must all match, patterns that must not match)
+RULES = [
+    # Transactions are past purchases with an amount
+    (User.TRA, 0.95,
+     [r'\b(spent|bought|purchased|ordered)\b', AMOUNT],
+     NOT_EXPENSE_PATTERNS),
+    # Got and paid are as often income or someone else paying, the remote classifier decides
+    (User.TRA, 0.6,
+     [r'\b(paid|got)\b', AMOUNT],
+     NOT_EXPENSE_PATTERNS),
+    # Inquiries ask about spending or budgets
+    (User.INQ, 0.9,
+     [r'^\s*(how much|what(\'s| is| are| was| were)|show me|list|give me|tell me how much)\b',
+      r'\b(spent|spend|spending|budgets?|left|remaining|transactions?|expenses?|breakdown|categories)\b'],
+     [r'\b(advice|tips?|inspiration|improve)\b']),
+    # Setup changes the budget categories
+    (User.SET, 0.85,
+     [r'\b(set|setup|change|add|make|create|delete|remove|increase|decrease|raise|lower|allocate|adjust|rename)\b',
+      r'\b(budgets?|category|categories)\b'],
+     [r'^\s*(how much|what)\b', r'\b(spent|paid|bought|purchased)\b']),
+]
+
+# Classifier shared by the whole process, trained on first use
+_CLASSIFIER = None
+_CLASSIFIER_LOCK = threading.Lock()
+
+
+class LinearIntentModel(object):
+    """
+    Multinomial naive bayes over unigrams and bigrams of the normalized text,
+    a linear model in log space trained from the classifier examples
+    """
+    def __init__(self, examples, labels, smoothing=1.0):
+        self.labels = list(labels)
+        self.smoothing = smoothing
+
+        label_counts = collections.Counter()
+        self.feature_counts = {label: collections.Counter() for label in self.labels}
+        self.vocabulary = set()
+
+        for text, label in examples:
+            if label not in self.feature_counts:
+                continue
+            label_counts[label] += 1
+            features = LinearIntentModel.get_features(text)
+            self.feature_counts[label].update(features)
+            self.vocabulary.update(features)
+
+        self.vocabulary_size = len(self.vocabulary)
+        num_examples = sum(label_counts.values())
+
+        self.log_priors = dict()
+        self.feature_totals = dict()
+        for label in self.labels:
+            self.log_priors[label] = math.log((label_counts[label] + smoothing) /
+                                              (num_examples + smoothing * len(self.labels)))
+            self.feature_totals[label] = sum(self.feature_counts[label].values())
+
+    def predict(self, text):
+        """
+        Returns the most likely label and its probability
+        The probability is scaled down by how much of the text was never seen in training
+        """
+        features = LinearIntentModel.get_features(text)
+        if not features:
+            return self.labels[0], 0.0
+
+        scores = dict()
+        for label in self.labels:
+            denominator = self.feature_totals[label] + self.smoothing * (self.vocabulary_size + 1)
+            score = self.log_priors[label]
+            for feature in features:
+                score += math.log((self.feature_counts[label][feature] + self.smoothing) / denominator)
+            scores[label] = score
+
+        # Normalize the scores into probabilities
+        best_label = max(scores, key=scores.get)
+        best_score = scores[best_label]
+        total = sum(math.exp(score - best_score) for score in scores.values())
+
+        known = sum(1 for feature in features if feature in self.vocabulary)
+
+        return best_label, (1.0 / total) * (known / len(features))
+
+    def get_features(text):
+        words = normalize_text(text).split()
+        bigrams = ['%s %s' % (words[i], words[i + 1]) for i in range(len(words) - 1)]
+        return words + bigrams
+
+
+class LocalIntentClassifier(object):
+    """
+    Classifies the conversation category without a network call
+    Pattern rules are tried first then the linear model
+    """
+    def __init__(self, examples=CONVERSATION_CATEGORY_EXAMPLES, labels=CONVERSATION_CATEGORY_LABELS):
+        self.rules = list()
+        for label, confidence, required, forbidden in RULES:
+            self.rules.append((label, confidence,
+                               [re.compile(pattern, re.IGNORECASE) for pattern in required],
+                               [re.compile(pattern, re.IGNORECASE) for pattern in forbidden]))
+
+        self.model = LinearIntentModel(examples, labels)
+
+    def classify(self, text):
+        """
+        Returns the label and a confidence between 0 and 1
+        """
+        matches = list()
+        for label, confidence, required, forbidden in self.rules:
+            if (all(pattern.search(text) for pattern in required) and
+                    not any(pattern.search(text) for pattern in forbidden)):
+                matches.append((label, confidence))
+
+        matched_labels = set(label for label, confidence in matches)
+        if len(matched_labels) == 1:
+            return max(matches, key=lambda x:x[1])
+        elif len(matched_labels) > 1:
+            # Rules disagree, let the remote classifier decide
+            return matches[0][0], 0.0
+
+        return self.model.predict(text)
+
+
+def classify_intent(text):
+    """
+    Classifies text with the classifier of the process, trained on first use
+    """
+    global _CLASSIFIER
+    with _CLASSIFIER_LOCK:
+        if _CLASSIFIER is None:
+            _CLASSIFIER = LocalIntentClassifier()
+
+    return _CLASSIFIER.classify(text)
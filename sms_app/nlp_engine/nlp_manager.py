@@ -1,11 +1,21 @@
 # System imports
 import logging
 import datetime
+import concurrent.futures
+import re
+
+# django imports
+from django.conf import settings
 
 # local imports
 from sms_app.nlp_engine.default_responses import *
 from sms_app.models import *
 import sms_app.gpt3_utilities.response_utilities as gpt3
+import sms_app.forecasting as forecasting
+import sms_app.metrics as metrics
+from sms_app.nlp_engine.intent_classifier import classify_intent
+from sms_app.unit_of_work import UnitOfWork
+import sms_app.visualizations.charts as charts
 
 LOGGER = logging.getLogger('friday_logger')
 
@@ -13,6 +23,18 @@ class NLP_Manager(object):
     MESSAGE = 'Message'
     MEDIA = 'Media'
 
+    # Inquiries asking for a picture get charts with the reply
+    VISUAL_PATTERN = re.compile(r'\b(charts?|graphs?|plots?|pie|visual|visuali[sz]e|picture)\b', re.IGNORECASE)
+
+    # Short names of the user states used to tag the metrics
+    STATE_TAGS = {User.REG: 'REG',
+                  User.SET: 'SET',
+                  User.DIS: 'DIS',
+                  User.ABO: 'ABO',
+                  User.INQ: 'INQ',
+                  User.TRA: 'TRA',
+                  User.ASK: 'ASK'}
+
     def __init__(self, user):
         """Constructor"""
         self.user = user
@@ -41,11 +63,28 @@ class NLP_Manager(object):
     def process_message(self, received_msg):
         """
         Main function for decifering a response from the user
+        The messages and user changes of the turn are saved together at the end
+        """
+        with UnitOfWork(self.user):
+            self._process_message(received_msg)
+
+    def get_response(self):
+        """
+        Returns the reply_queue
         """
+        return self.reply_queue
+
+    # ------------------------
+    # Private helper functions
+    # ------------------------
+
+    def _process_message(self, received_msg):
         # if in registration mode
         if self.user.state == User.REG:
+            metrics.set_state(self.STATE_TAGS[User.REG])
             # Try and find name in response
-            name = gpt3.find_name_from_msg(received_msg)
+            with metrics.span('find_name'):
+                name = gpt3.find_name_from_msg(received_msg)
 
             # if message contains no name reprompt
             if name is None or name == 'Friday':
@@ -58,9 +97,8 @@ class NLP_Manager(object):
             # Change to any state, will change after
             self.user.state = User.ABO
             # Setup Budgetting categories
-            self.user.setup_default_categories()
-
-            self.user.save()
+            with metrics.span('setup_user'):
+                self.user.setup_default_categories()
 
             msgs = self._get_onboarding_messages()
             for msg in msgs:
@@ -68,20 +106,30 @@ class NLP_Manager(object):
             return
 
         # Add the user msg to conversation hist
-        self.user.add_conversation_msg(received_msg, self.user.name)
+        with metrics.span('save_message'):
+            self.user.add_conversation_msg(received_msg, self.user.name)
 
         # A classification function that determines the user state
-        self.user.state = gpt3.determine_conversation_category(received_msg)
+        # Obvious messages are classified locally without the remote classifier
+        with metrics.span('classify_local'):
+            state, confidence = classify_intent(received_msg)
+        if confidence < settings.INTENT_LOCAL_THRESHOLD:
+            with metrics.span('classify_remote'):
+                state = gpt3.determine_conversation_category(received_msg)
+        self.user.state = state
+        metrics.set_state(self.STATE_TAGS.get(state, state))
 
         if self.user.state == User.SET:
             LOGGER.info('You are now in setup')
-            msg = self._perform_setup_and_get_response(received_msg)
+            with metrics.span('setup'):
+                msg = self._perform_setup_and_get_response(received_msg)
             self._add_reply_msg(msg)
             return
 
         elif self.user.state == User.DIS:
             LOGGER.info('You are now in discussion')
-            msg = self._get_discussion_response(received_msg)
+            with metrics.span('discussion'):
+                msg = self._get_discussion_response(received_msg)
             self._add_reply_msg(msg)
             return
 
@@ -95,17 +143,24 @@ class NLP_Manager(object):
         elif self.user.state == User.INQ:
             LOGGER.info('You are now in inquiry')
             #Once we're in this category we need to determine whether the user wants a text response or visual response
-            msg = self._get_inquiry_response(received_msg)
+            with metrics.span('inquiry'):
+                msg = self._get_inquiry_response(received_msg)
             self._add_reply_msg(msg)
+            if self.VISUAL_PATTERN.search(received_msg):
+                with metrics.span('charts'):
+                    for media_url in charts.get_user_chart_urls(self.user):
+                        self._add_reply_media(media_url)
             return
         
         elif self.user.state == User.TRA:
             LOGGER.info('You are now in transaction')
             # Once we are in this state we need to determine the category of the transaction that took place.
-            msg, num = self._extract_transaction_info(received_msg)
+            with metrics.span('transaction'):
+                msg, num = self._extract_transaction_info(received_msg)
             self._add_reply_msg(msg)
             if num != 0:
-                msg2 = self._get_inquiry_response('Show me my transaction history')
+                with metrics.span('inquiry'):
+                    msg2 = self._get_inquiry_response('Show me my transaction history')
                 self._add_reply_msg(msg2)
             return
 
@@ -124,16 +179,6 @@ class NLP_Manager(object):
 
         # process response
 
-    def get_response(self):
-        """
-        Returns the reply_queue
-        """
-        return self.reply_queue
-
-    # ------------------------
-    # Private helper functions
-    # ------------------------
-
     #############################
     # Tools modifying reply_queue
     #############################
@@ -142,7 +187,8 @@ class NLP_Manager(object):
         Adds reply message to the reply queue
         """
         self.reply_queue.append((self.MESSAGE, msg))
-        self.user.add_conversation_msg(msg, ConvMsg.FRIDAY)
+        with metrics.span('save_message'):
+            self.user.add_conversation_msg(msg, ConvMsg.FRIDAY)
 
     def _add_reply_media(self, media):
         """
@@ -181,7 +227,8 @@ class NLP_Manager(object):
                 reply = gpt3.get_elaboration_response(msg, self.user.name)
                 return reply
             
-            self.user.modify_categories_from_dict(category_dict['Categories'])
+            change_set = self.user.modify_categories_from_dict(category_dict['Categories'])
+            LOGGER.info('Changed categories: %s' % change_set)
             reply = category_dict['Response']
             return reply
             
@@ -195,25 +242,47 @@ class NLP_Manager(object):
         info = gpt3.determine_transaction_info(msg)
         if info is None:
             reply = "Your transaction was not very clear... please tell me where you spent your money and how much."
-            return reply
+            return reply, 0
+
+        # Determine Bad transactions
         for transaction in info:
+            if ((transaction['Item'] == '?' and transaction['Location'] == '?') or
+                    transaction['Amount'] == '?'):
+                reply = "Your transaction was not very clear... please tell me where you spent your money and how much."
+                return reply, 0
+
+        # Items the user logged before keep their category, only new ones are classified
+        category_names = self.user.get_category_names_list()
+        item_list = [(transaction['Item'], transaction['Location']) for transaction in info]
+        category_list = self.user.lookup_item_categories(item_list)
+
+        # Classify the new items at the same time
+        new_indices = [i for i, category in enumerate(category_list) if category not in category_names]
+        new_items = [info[i]['Item'] for i in new_indices]
+        with metrics.span('classify_items'):
+            new_categories = self._classify_transaction_items(new_items, category_names)
+
+        new_categorized_list = list()
+        for i, category_type in zip(new_indices, new_categories):
+            category_list[i] = category_type
+            new_categorized_list.append((info[i]['Item'], info[i]['Location'], category_type))
+
+        transaction_objs = list()
+        for transaction, category_type in zip(info, category_list):
             item = transaction['Item']
             location = transaction['Location']
             amount = transaction['Amount']
             time = transaction['Date']
-            category_type = gpt3.determine_transaction_type(item, self.user.get_category_names_list())
             transaction['Category'] = category_type
 
-            # Determine Bad transactions
-            if (item == '?' and location == '?') or amount == '?':
-                reply = "Your transaction was not very clear... please tell me where you spent your money and how much."
-                return reply, 0
-
+            transaction_objs.append(Transaction.build_transaction(self.user.phone_number,
+                                                                  item, category_type, amount,
+                                                                  location, time))
 
-            transaction_obj = Transaction.make_transaction(self.user.phone_number,
-                                                           item, category_type, amount,
-                                                           location, time)
-            self.user.add_transaction(transaction_obj)
+        with metrics.span('save_transactions'):
+            self.user.remember_item_categories(new_categorized_list)
+            # Save all the items of the message at once
+            self.user.add_transactions(transaction_objs)
 
         num_transactions = len(info)
         if num_transactions == 1:
@@ -224,6 +293,19 @@ class NLP_Manager(object):
         reply = "Awesome! I've logged %s %s into your expense records." % (num_transactions, keyword)
         return reply, num_transactions
             
+    def _classify_transaction_items(self, items, category_names):
+        """
+        Determines the category of each item, returned in the same order
+        Runs up to LLM_MAX_CONCURRENCY classifications at once
+        """
+        if len(items) <= 1 or settings.LLM_MAX_CONCURRENCY <= 1:
+            return [gpt3.determine_transaction_type(item, category_names) for item in items]
+
+        num_workers = min(len(items), settings.LLM_MAX_CONCURRENCY)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
+            return list(executor.map(lambda item: gpt3.determine_transaction_type(item, category_names),
+                                     items))
+
     #############################
     # Expense Inquiry Tools
     #############################
@@ -245,6 +327,8 @@ class NLP_Manager(object):
         ##
         ##reply = 
         budget_list, total_spent, total_left, total_budget, overall_status = self.user.get_category_info_list(datetime.datetime.now().date().month)
+        with metrics.span('forecast'):
+            forecasting.add_pacing(self.user, budget_list, datetime.datetime.now().date())
         trans_hist = self.user.get_recent_transactions_dict(datetime.datetime.now().date().month, 'All')
         reply = gpt3.get_inquiry_response_alt(self.user.name, msg, budget_list, total_spent, total_left, total_budget, trans_hist, overall_status)
 
@@ -306,9 +390,11 @@ class NLP_Manager(object):
         # NOTE: Don't need
         # self.user.add_discussion_msg(msg, self.user.name)
         # Decode discussion history into dictionary list
-        conversation_list = self.user.get_conversation()
-        # Send past 20 discussion history items to the API
-        response_msg = gpt3.get_discussion_response(conversation_list[-20:], self.user.name)
+        # Only the past 20 discussion history items are sent to the API
+        conversation_list = self.user.get_conversation(limit=20)
+        # Older messages are only available as summaries once compacted
+        summary = self.user.get_conversation_summary()
+        response_msg = gpt3.get_discussion_response(conversation_list, self.user.name, summary)
         # Add friday message to discussion hist
         # NOTE: Don't need
         # self.user.add_discussion_msg(response_msg, ConvMsg.FRIDAY)
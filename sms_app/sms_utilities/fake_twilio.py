@@ -0,0 +1,73 @@
+# System imports
+import http.server
+import json
+import threading
+import time
+import urllib.parse
+import uuid
+
+
+class FakeTwilioServer(object):
+    """
+    Local http server that answers like the Twilio messages API
+    Point TWILIO_API_BASE_URL at url to send messages to it instead of Twilio
+    """
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        self.latency = latency
+        self.messages = list()
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                data = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+                if server.latency:
+                    time.sleep(server.latency)
+
+                message = {'sid': 'SM%s' % uuid.uuid4().hex,
+                           'to': data.get('To', [None])[0],
+                           'from': data.get('From', [None])[0],
+                           'body': data.get('Body', [''])[0],
+                           'media_url': data.get('MediaUrl', [None])[0],
+                           'status': 'queued'}
+                with server._lock:
+                    server.messages.append(message)
+
+                body = json.dumps(message).encode('utf-8')
+                try:
+                    self.send_response(201)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client timed out before the answer, like Twilio it keeps the message
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return 'http://%s:%s' % (host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
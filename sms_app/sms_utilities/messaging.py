@@ -1,17 +1,218 @@
-# twilio imports
-from twilio.rest import Client
+# Django imports
+from django.conf import settings
+from django.utils.module_loading import import_string
 
 # System imports
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
 import urllib.parse
 import os
 
+import requests
+from requests.adapters import HTTPAdapter
+
 # local imports
+import sms_app.metrics as metrics
+
+LOGGER = logging.getLogger('friday_logger')
 
 # Twillio setup
 TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
 TWILIO_NUMBER = os.getenv('TWILIO_NUMBER')
-TWILIO_CLIENT = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+
+# Sender shared by the whole process, made on first use
+_SENDER = None
+_SENDER_LOCK = threading.Lock()
+
+
+class SendError(Exception):
+    """
+    Raised when a message can't be sent
+    retry tells if sending it again could work
+    """
+    def __init__(self, msg, retry=False):
+        super().__init__(msg)
+        self.retry = retry
+
+
+##################
+# Transports
+##################
+class TwilioTransport(object):
+    """
+    Sends messages with the Twilio REST API over a pooled http session
+    base_url can point to a local fake Twilio server for tests and benchmarks
+    """
+    def __init__(self, base_url=None, pool_size=None, timeout=10):
+        if base_url is None:
+            base_url = settings.TWILIO_API_BASE_URL
+        if pool_size is None:
+            pool_size = settings.SMS_SENDER_THREADS
+
+        self.url = '%s/2010-04-01/Accounts/%s/Messages.json' % (base_url.rstrip('/'),
+                                                                 TWILIO_ACCOUNT_SID)
+        self.timeout = timeout
+
+        # Keep connections alive between messages instead of a new handshake each time
+        self.session = requests.Session()
+        self.session.auth = (TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def send(self, msg, phone_num, media_url=None):
+        data = {'Body': msg, 'To': phone_num, 'From': TWILIO_NUMBER}
+        if media_url is not None:
+            data['MediaUrl'] = media_url
+
+        try:
+            response = self.session.post(self.url, data=data, timeout=self.timeout)
+        except (requests.ConnectionError, requests.ConnectTimeout) as e:
+            # Never reached Twilio, safe to send again
+            raise SendError(str(e), retry=True)
+        except requests.RequestException as e:
+            # Twilio may have taken the message before the response timed out,
+            # sending it again could text the user twice
+            raise SendError(str(e))
+
+        if response.status_code == 429 or response.status_code >= 500:
+            raise SendError('Twilio returned %s' % response.status_code, retry=True)
+        if response.status_code >= 400:
+            raise SendError('Twilio returned %s: %s' % (response.status_code, response.text))
+
+    def close(self):
+        self.session.close()
+
+
+class MemoryTransport(object):
+    """
+    Keeps the sent messages in a list instead of sending them
+    """
+    def __init__(self):
+        self.sent = list()
+        self._lock = threading.Lock()
+
+    def send(self, msg, phone_num, media_url=None):
+        with self._lock:
+            self.sent.append({'Body': msg, 'To': phone_num, 'MediaUrl': media_url})
+
+    def close(self):
+        pass
+
+
+##################
+# Sender
+##################
+class OutboundSender(object):
+    """
+    Sends messages on a bounded thread pool with retries
+    Messages to one recipient are sent in the order they were queued,
+    different recipients are sent to concurrently
+    """
+    def __init__(self, transport, max_workers=8, retries=3, backoff=0.5):
+        self.transport = transport
+        self.retries = retries
+        self.backoff = backoff
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        # Recipient to the deque of (msg, media_url, future) waiting to be sent
+        self._queue_dict = dict()
+
+    def send(self, msg, phone_num, media_url=None):
+        """
+        Queues a message, returns a future that is done once it is sent
+        """
+        future = concurrent.futures.Future()
+
+        with self._lock:
+            if phone_num in self._queue_dict:
+                # A thread is already sending to this recipient, it'll pick this up
+                self._queue_dict[phone_num].append((msg, media_url, future))
+            else:
+                self._queue_dict[phone_num] = collections.deque([(msg, media_url, future)])
+                self._executor.submit(self._drain_recipient, phone_num)
+
+        return future
+
+    def flush(self, timeout=None):
+        """
+        Waits for all the queued messages to be sent
+        """
+        with self._lock:
+            futures = [item[2] for queue in self._queue_dict.values() for item in queue]
+        concurrent.futures.wait(futures, timeout=timeout)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.transport.close()
+
+    def _drain_recipient(self, phone_num):
+        """
+        Sends the queued messages of one recipient one after the other
+        """
+        while True:
+            with self._lock:
+                queue = self._queue_dict[phone_num]
+                if not queue:
+                    del self._queue_dict[phone_num]
+                    return
+                msg, media_url, future = queue[0]
+
+            try:
+                self._send_with_retries(msg, phone_num, media_url)
+            except Exception as e:
+                LOGGER.error('Failed to send message to %s: %s' % (phone_num, e))
+                future.set_exception(e)
+            else:
+                future.set_result(True)
+
+            # Only removed once sent so flush waits for it
+            with self._lock:
+                queue.popleft()
+
+    def _send_with_retries(self, msg, phone_num, media_url):
+        attempt = 0
+        while True:
+            try:
+                with metrics.span('sms_send'):
+                    self.transport.send(msg, phone_num, media_url)
+                return
+            except SendError as e:
+                if not e.retry or attempt >= self.retries:
+                    raise
+                LOGGER.warning('Retrying message to %s: %s' % (phone_num, e))
+
+            time.sleep(self.backoff * (2 ** attempt))
+            attempt += 1
+
+
+def get_sender():
+    """
+    Gets the sender of the process, made from the settings on first use
+    """
+    global _SENDER
+    with _SENDER_LOCK:
+        if _SENDER is None:
+            transport = import_string(settings.SMS_TRANSPORT)()
+            _SENDER = OutboundSender(transport,
+                                     max_workers=settings.SMS_SENDER_THREADS,
+                                     retries=settings.SMS_SEND_RETRIES,
+                                     backoff=settings.SMS_SEND_BACKOFF)
+        return _SENDER
+
+def set_sender(sender):
+    """
+    Replaces the sender of the process, used by benchmarks
+    """
+    global _SENDER
+    with _SENDER_LOCK:
+        _SENDER = sender
+
 
 def decode_request(request):
     """
@@ -19,13 +220,16 @@ def decode_request(request):
     """
     return urllib.parse.parse_qs(request.body.decode('utf-8'))
 
-def send_message(msg, phone_num):
+def send_message(msg, phone_num, media_url=None):
+    """
+    Queues a message to be sent to the phone number
+    Returns a future that is done once it is sent
+    """
+    return get_sender().send(msg, phone_num, media_url)
+
+def flush_messages(timeout=None):
     """
-    Constructs a response message json for API to send back
+    Waits for the queued messages to be sent
     """
-    response = TWILIO_CLIENT.messages.create(
-            body=msg,
-            to=phone_num,
-            media_url=None,
-            from_=TWILIO_NUMBER
-            )
+    if _SENDER is not None:
+        _SENDER.flush(timeout)
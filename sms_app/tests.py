@@ -1,3 +1,701 @@
-from django.test import TestCase
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test.utils import CaptureQueriesContext
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
 
-# Create your tests here.
+# System imports
+import collections
+import datetime
+import decimal
+import io
+import time
+
+# local imports
+import sms_app.metrics as metrics
+from sms_app.analytics import SpendingSeries, from_month_index, to_month_index
+from sms_app.forecasting import add_pacing, get_month_forecast
+from sms_app.gpt3_utilities.intent_cache import IntentCache
+from sms_app.gpt3_utilities.prompt_builder import PromptBuilder
+from sms_app.models import ConvMsg, InboundMsg, IntentCacheEntry, MonthlyCategoryTotal, SpendingCurve, User, Transaction, UserChart
+from sms_app.nlp_engine.intent_classifier import LocalIntentClassifier
+from sms_app.sms_utilities.fake_twilio import FakeTwilioServer
+from sms_app.sms_utilities.messaging import MemoryTransport, OutboundSender, SendError, TwilioTransport
+from sms_app.unit_of_work import UnitOfWork
+from sms_app.visualizations.prerender import ChartPrerenderer, get_prerenderer, set_prerenderer
+
+
+class MigrationTestCase(TransactionTestCase):
+    """
+    Migrates back to migrate_from so a test can make rows with the models of then,
+    migrate() then runs the migrations up to migrate_to
+    """
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        self.apps = self._migrate(self.migrate_from)
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate(self):
+        self.apps = self._migrate(self.migrate_to)
+        return self.apps
+
+    def _migrate(self, name):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('sms_app', name)])
+        executor.loader.build_graph()
+        return executor.loader.project_state([('sms_app', name)]).apps
+
+
+class TransactionTests(TestCase):
+    def setUp(self):
+        self.user, created = User.get_or_register('+15550000001')
+
+    def test_make_transaction_adds_to_user(self):
+        transaction = Transaction.make_transaction(self.user, 'Pizza', 'Food', 12, 'Dominos', '?')
+
+        self.assertEqual(transaction.user, self.user)
+        self.assertEqual(self.user.get_transactions_total_by_category(transaction.timestamp.month),
+                         {'Food': 12})
+
+    def test_month_queries_exclude_earlier_years(self):
+        today = timezone.localdate()
+        self.user.reconcile_categories({'Food': 100})
+        for year, amount in ((today.year - 1, 40), (today.year, 12)):
+            timestamp = timezone.make_aware(datetime.datetime(year, today.month, 1, 12))
+            self.user.add_transaction(Transaction(phone_number=self.user.phone_number, title='x',
+                                                  transaction_cat='Food', amount=amount,
+                                                  timestamp=timestamp))
+
+        self.assertEqual(self.user.get_transactions_total(today.month, 'All'), 12)
+        self.assertEqual(self.user.get_transactions_total(today.month, 'Food', today.year - 1), 40)
+        self.assertEqual([item['Amount'] for item in self.user.get_recent_transactions_dict(today.month, 'All')],
+                         [12])
+        budget_list, total_spent, total_left, total_budget, status = \
+                self.user.get_category_info_list(today.month)
+        self.assertEqual([item['Spent'] for item in budget_list if item['Category'] == 'Food'], [12])
+
+
+class MonthlyTotalTests(TestCase):
+    def setUp(self):
+        self.user, created = User.get_or_register('+15550000006')
+        self.january = timezone.make_aware(datetime.datetime(2022, 1, 10))
+        self.february = timezone.make_aware(datetime.datetime(2022, 2, 10))
+
+    def _make_transaction(self, category, amount, timestamp):
+        return Transaction(phone_number=self.user.phone_number, title='x',
+                           transaction_cat=category, amount=amount, timestamp=timestamp)
+
+    def _get_totals(self):
+        return set(self.user.monthly_totals.values_list('year', 'month', 'category', 'total'))
+
+    def test_totals_follow_added_transactions(self):
+        self.user.add_transaction(self._make_transaction('Food', 10, self.january))
+        self.user.add_transactions([self._make_transaction('Food', 5, self.january),
+                                    self._make_transaction('Food', 7, self.february)])
+
+        self.assertEqual(self._get_totals(), {(2022, 1, 'Food', decimal.Decimal('15')),
+                                              (2022, 2, 'Food', decimal.Decimal('7'))})
+        self.assertEqual(self.user.get_transactions_total_by_category(1, 2022), {'Food': 15})
+
+    def test_rebuild_replaces_wrong_totals(self):
+        self.user.add_transactions([self._make_transaction('Food', 5, self.january),
+                                    self._make_transaction('Health', 3, self.january)])
+        self.user.monthly_totals.filter(category='Food').update(total=99)
+        MonthlyCategoryTotal.objects.create(user=self.user, year=2021, month=12, category='Food', total=1)
+
+        self.assertEqual(MonthlyCategoryTotal.rebuild_for_user(self.user), 2)
+        self.assertEqual(self._get_totals(), {(2022, 1, 'Food', decimal.Decimal('5')),
+                                              (2022, 1, 'Health', decimal.Decimal('3'))})
+
+
+class UnitOfWorkTests(TestCase):
+    def setUp(self):
+        self.user, created = User.get_or_register('+15550000005')
+
+    def test_flush_keeps_data_version_of_other_writers(self):
+        # Another worker changed the data of the user meanwhile
+        User.objects.filter(pk=self.user.pk).update(data_version=5)
+
+        with UnitOfWork(self.user):
+            self.user.state = User.INQ
+            self.user.add_conversation_msg('How much did I spend?', 'User')
+
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual((user.state, user.data_version), (User.INQ, 5))
+        self.assertEqual([msg['Message'] for msg in user.get_conversation()], ['How much did I spend?'])
+
+    def test_unchanged_user_is_not_written(self):
+        with self.assertNumQueries(0):
+            with UnitOfWork(self.user):
+                self.user.state = self.user.state
+
+
+class InboundQueueTests(TestCase):
+    def test_messages_are_claimed_in_order_per_phone_number(self):
+        first = InboundMsg.enqueue('+15550000010', 'first')
+        InboundMsg.enqueue('+15550000011', 'other')
+        second = InboundMsg.enqueue('+15550000010', 'second')
+
+        self.assertEqual(InboundMsg.get_pending_phone_numbers(), ['+15550000010', '+15550000011'])
+
+        self.assertEqual(InboundMsg.claim_next('+15550000010').pk, first.pk)
+        # Another worker can't take the next message while the first is processing
+        self.assertIsNone(InboundMsg.claim_next('+15550000010'))
+        self.assertEqual(InboundMsg.get_pending_phone_numbers(), ['+15550000011'])
+
+        InboundMsg.objects.get(pk=first.pk).mark_done()
+        self.assertEqual(InboundMsg.claim_next('+15550000010').pk, second.pk)
+
+    def test_only_expired_claims_are_requeued(self):
+        InboundMsg.enqueue('+15550000012', 'stale')
+        InboundMsg.enqueue('+15550000013', 'live')
+        stale = InboundMsg.claim_next('+15550000012')
+        live = InboundMsg.claim_next('+15550000013')
+        InboundMsg.objects.filter(pk=stale.pk).update(
+                claimed_timestamp=timezone.now() - datetime.timedelta(seconds=600))
+
+        self.assertEqual(InboundMsg.requeue_interrupted(300), 1)
+        self.assertEqual(InboundMsg.objects.get(pk=stale.pk).status, InboundMsg.PENDING)
+        self.assertEqual(InboundMsg.objects.get(pk=live.pk).status, InboundMsg.PROCESSING)
+
+
+class IntentClassifierTests(SimpleTestCase):
+    # Expenses the rules classify without asking the remote classifier
+    EXPENSE_MSGS = [
+        'I spent $12 on pizza',
+        'Bought groceries for 45 dollars',
+        'Ordered takeout for 30 bucks',
+    ]
+    # Income and corrections that mention an amount but aren't new expenses
+    NOT_EXPENSE_MSGS = [
+        'I got paid $500 today',
+        'My boss paid me 300 dollars',
+        'I got a refund of $30 for the shoes',
+        'I got $50 from my mom',
+        'I got a $100 raise',
+        'Got my paycheck of $2000',
+        'I got reimbursed $50',
+        'I got 200 dollars back from taxes',
+        'Mark paid $30 for my dinner',
+        'I paid back $40 I owed Sam',
+        'Remove the $20 I spent on coffee',
+        'Delete the $12 pizza',
+        'Undo the 40 bucks I spent on gas',
+        'Cancel the $15 uber',
+    ]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.classifier = LocalIntentClassifier()
+
+    def test_expenses_are_classified_locally(self):
+        for msg in self.EXPENSE_MSGS:
+            label, confidence = self.classifier.classify(msg)
+            self.assertEqual(label, User.TRA, msg)
+            self.assertGreaterEqual(confidence, settings.INTENT_LOCAL_THRESHOLD, msg)
+
+    def test_income_and_corrections_are_not_confident_expenses(self):
+        for msg in self.NOT_EXPENSE_MSGS:
+            label, confidence = self.classifier.classify(msg)
+            self.assertFalse(label == User.TRA and confidence >= settings.INTENT_LOCAL_THRESHOLD, msg)
+
+
+class MonthlyTotalMigrationTests(MigrationTestCase):
+    migrate_from = '0002_transaction_range_index'
+    migrate_to = '0003_monthly_category_total'
+
+    def test_totals_are_filled_from_existing_transactions(self):
+        User = self.apps.get_model('sms_app', 'User')
+        Transaction = self.apps.get_model('sms_app', 'Transaction')
+
+        user = User.objects.create(name='Bob', phone_number='+15550000002')
+        january = timezone.make_aware(datetime.datetime(2022, 1, 10))
+        february = timezone.make_aware(datetime.datetime(2022, 2, 10))
+        for category, amount, timestamp in [('Food', 10, january), ('Food', 5, january),
+                                            ('Food', 7, february), ('Health', 3, january)]:
+            transaction = Transaction.objects.create(phone_number=user.phone_number, title='x',
+                                                     transaction_cat=category, amount=amount,
+                                                     timestamp=timestamp)
+            user.transactions.add(transaction)
+
+        apps = self.migrate()
+
+        MonthlyCategoryTotal = apps.get_model('sms_app', 'MonthlyCategoryTotal')
+        totals = set(MonthlyCategoryTotal.objects.values_list('user__name', 'year', 'month', 'category', 'total'))
+        self.assertEqual(totals, {('Bob', 2022, 1, 'Food', decimal.Decimal('15')),
+                                  ('Bob', 2022, 2, 'Food', decimal.Decimal('7')),
+                                  ('Bob', 2022, 1, 'Health', decimal.Decimal('3'))})
+
+
+class ChartPrerenderTests(TransactionTestCase):
+    def setUp(self):
+        self.prerenderer = ChartPrerenderer(1)
+        set_prerenderer(self.prerenderer)
+
+    def tearDown(self):
+        self.prerenderer.shutdown()
+        set_prerenderer(None)
+
+    def test_changes_are_rendered_at_their_data_version(self):
+        user, created = User.get_or_register('+15550000003')
+        user.modify_categories_from_dict({'Food': 100, 'Health': 50})
+        user.add_transaction(Transaction(phone_number=user.phone_number, title='Pizza',
+                                         transaction_cat='Food', amount=30, timestamp=timezone.now()))
+        self.prerenderer.flush(timeout=60)
+
+        user.refresh_from_db()
+        self.assertEqual(user.data_version, 2)
+        self.assertEqual(set(UserChart.objects.filter(user=user).values_list('data_version', 'kind')),
+                         {(2, 'Pie'), (2, 'Time'), (2, 'Progress')})
+
+    def test_commands_and_shells_do_not_prerender(self):
+        set_prerenderer(None)
+        user, created = User.get_or_register('+15550000004')
+        user.modify_categories_from_dict({'Food': 100})
+
+        self.assertIsNone(get_prerenderer().schedule(user.pk))
+        self.assertFalse(UserChart.objects.exists())
+
+
+class MergeDuplicateUsersMigrationTests(MigrationTestCase):
+    migrate_from = '0008_item_category_memo'
+    migrate_to = '0009_merge_duplicate_users'
+
+    def test_duplicates_are_merged_into_the_registered_user(self):
+        User = self.apps.get_model('sms_app', 'User')
+        Transaction = self.apps.get_model('sms_app', 'Transaction')
+        BudgetCategory = self.apps.get_model('sms_app', 'BudgetCategory')
+        ConvMsg = self.apps.get_model('sms_app', 'ConvMsg')
+
+        phone_number = '+15550000020'
+        registered = User.objects.create(name='Ann', phone_number=phone_number, state='Account inquiry')
+        duplicate = User.objects.create(phone_number=phone_number, state='Registration')
+        other = User.objects.create(name='Bob', phone_number='+15550000021', state='Account inquiry')
+
+        january = timezone.make_aware(datetime.datetime(2022, 1, 10))
+        for user, amount in ((registered, 10), (duplicate, 5), (other, 7)):
+            transaction = Transaction.objects.create(phone_number=user.phone_number, title='x',
+                                                     transaction_cat='Food', amount=amount,
+                                                     timestamp=january)
+            user.transactions.add(transaction)
+            user.conv_history.add(ConvMsg.objects.create(message='hi', author='User',
+                                                         phone_number=user.phone_number))
+        registered.budget_categories.add(BudgetCategory.objects.create(category_name='Food'))
+        duplicate.budget_categories.add(BudgetCategory.objects.create(category_name='Food'))
+
+        apps = self.migrate()
+
+        User = apps.get_model('sms_app', 'User')
+        MonthlyCategoryTotal = apps.get_model('sms_app', 'MonthlyCategoryTotal')
+        BudgetCategory = apps.get_model('sms_app', 'BudgetCategory')
+
+        self.assertEqual(sorted(User.objects.values_list('name', flat=True)), ['Ann', 'Bob'])
+        user = User.objects.get(phone_number=phone_number)
+        self.assertEqual(sorted(user.transactions.values_list('amount', flat=True)),
+                         [decimal.Decimal('5'), decimal.Decimal('10')])
+        self.assertEqual(user.conv_history.count(), 2)
+        # The duplicate's categories are dropped since the kept user has some
+        self.assertEqual(user.budget_categories.count(), 1)
+        self.assertEqual(BudgetCategory.objects.count(), 1)
+        self.assertEqual(list(MonthlyCategoryTotal.objects.filter(user=user).values_list('total', flat=True)),
+                         [decimal.Decimal('15')])
+
+
+class CopyUserLinksMigrationTests(MigrationTestCase):
+    migrate_from = '0012_add_user_foreign_keys'
+    migrate_to = '0013_copy_user_links'
+
+    def test_links_are_copied_into_foreign_keys(self):
+        User = self.apps.get_model('sms_app', 'User')
+        Transaction = self.apps.get_model('sms_app', 'Transaction')
+        BudgetCategory = self.apps.get_model('sms_app', 'BudgetCategory')
+        ConvMsg = self.apps.get_model('sms_app', 'ConvMsg')
+
+        user = User.objects.create(name='Ann', phone_number='+15550000030')
+        now = timezone.now()
+
+        transaction = Transaction.objects.create(phone_number=user.phone_number, title='x',
+                                                 transaction_cat='Food', amount=10, timestamp=now)
+        orphan = Transaction.objects.create(phone_number=user.phone_number, title='y',
+                                            transaction_cat='Food', amount=3, timestamp=now)
+        category = BudgetCategory.objects.create(category_name='Food')
+        conv_msg = ConvMsg.objects.create(message='hi', author='User', phone_number=user.phone_number)
+        discuss_msg = ConvMsg.objects.create(message='tell me a joke', author='User',
+                                             phone_number=user.phone_number)
+        user.transactions.add(transaction)
+        user.budget_categories.add(category)
+        user.conv_history.add(conv_msg)
+        user.discuss_history.add(discuss_msg)
+
+        apps = self.migrate()
+
+        Transaction = apps.get_model('sms_app', 'Transaction')
+        BudgetCategory = apps.get_model('sms_app', 'BudgetCategory')
+        ConvMsg = apps.get_model('sms_app', 'ConvMsg')
+
+        self.assertEqual(list(Transaction.objects.values_list('pk', 'user_id')), [(transaction.pk, user.pk)])
+        self.assertFalse(Transaction.objects.filter(pk=orphan.pk).exists())
+        self.assertEqual(BudgetCategory.objects.get(pk=category.pk).user_id, user.pk)
+        self.assertEqual(set(ConvMsg.objects.values_list('message', 'user_id', 'history')),
+                         {('hi', user.pk, 'Conversation'), ('tell me a joke', user.pk, 'Discussion')})
+
+
+class FlakyTransport(MemoryTransport):
+    """
+    Fails the first failures sends of each message before sending it
+    """
+    def __init__(self, failures, retry=True):
+        super().__init__()
+        self.failures = failures
+        self.retry = retry
+        self.attempts = collections.Counter()
+
+    def send(self, msg, phone_num, media_url=None):
+        with self._lock:
+            self.attempts[msg] += 1
+            attempt = self.attempts[msg]
+        if attempt <= self.failures.get(msg, 0):
+            raise SendError('Failed %s' % msg, retry=self.retry)
+        super().send(msg, phone_num, media_url)
+
+
+class OutboundSenderTests(SimpleTestCase):
+    def make_sender(self, transport, retries=3, backoff=0.01):
+        sender = OutboundSender(transport, max_workers=4, retries=retries, backoff=backoff)
+        self.addCleanup(sender.close)
+        return sender
+
+    def test_messages_to_a_recipient_are_sent_in_order(self):
+        transport = MemoryTransport()
+        sender = self.make_sender(transport)
+
+        for i in range(20):
+            sender.send('a%s' % i, '+15550000001')
+            sender.send('b%s' % i, '+15550000002')
+        sender.flush()
+
+        for phone_num, prefix in (('+15550000001', 'a'), ('+15550000002', 'b')):
+            self.assertEqual([msg['Body'] for msg in transport.sent if msg['To'] == phone_num],
+                             ['%s%s' % (prefix, i) for i in range(20)])
+
+    def test_failed_sends_are_retried_with_backoff(self):
+        transport = FlakyTransport({'hi': 2})
+        sender = self.make_sender(transport, backoff=0.05)
+
+        start = time.monotonic()
+        self.assertTrue(sender.send('hi', '+15550000001').result(timeout=5))
+
+        # Waited 0.05 then 0.1 seconds between the attempts
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+        self.assertEqual(transport.attempts['hi'], 3)
+        self.assertEqual([msg['Body'] for msg in transport.sent], ['hi'])
+
+    def test_message_is_dropped_after_the_last_retry(self):
+        transport = FlakyTransport({'first': 10})
+        sender = self.make_sender(transport, retries=2)
+
+        first = sender.send('first', '+15550000001')
+        second = sender.send('second', '+15550000001')
+
+        with self.assertLogs('friday_logger', level='ERROR'):
+            with self.assertRaises(SendError):
+                first.result(timeout=5)
+        self.assertTrue(second.result(timeout=5))
+        self.assertEqual(transport.attempts['first'], 3)
+        self.assertEqual([msg['Body'] for msg in transport.sent], ['second'])
+
+    def test_errors_that_can_not_be_retried_are_sent_once(self):
+        transport = FlakyTransport({'hi': 1}, retry=False)
+        sender = self.make_sender(transport)
+
+        with self.assertLogs('friday_logger', level='ERROR'):
+            with self.assertRaises(SendError):
+                sender.send('hi', '+15550000001').result(timeout=5)
+        self.assertEqual(transport.attempts['hi'], 1)
+
+    def test_twilio_read_timeouts_are_not_retried(self):
+        server = FakeTwilioServer(latency=0.5).start()
+        self.addCleanup(server.stop)
+        transport = TwilioTransport(base_url=server.url, pool_size=1, timeout=0.1)
+        self.addCleanup(transport.close)
+
+        with self.assertRaises(SendError) as context:
+            transport.send('hi', '+15550000001')
+        self.assertFalse(context.exception.retry)
+
+    def test_twilio_connection_errors_are_retried(self):
+        server = FakeTwilioServer().start()
+        url = server.url
+        server.stop()
+        transport = TwilioTransport(base_url=url, pool_size=1, timeout=1)
+        self.addCleanup(transport.close)
+
+        with self.assertRaises(SendError) as context:
+            transport.send('hi', '+15550000001')
+        self.assertTrue(context.exception.retry)
+
+
+class PromptBuilderTests(SimpleTestCase):
+    def test_oldest_messages_are_summarized_first(self):
+        builder = PromptBuilder(40)
+        builder.add_text('Header\n')
+        builder.add_items(['message number %s' % i for i in range(10)],
+                          lambda message: 'User:%s\n' % message,
+                          lambda messages: '(%s earlier messages not shown)\n' % len(messages))
+        builder.add_text('Friday:')
+
+        prompt, report = builder.build()
+
+        # Each message is 7 tokens and the summary 10, the text leaves 35 for them
+        self.assertEqual(prompt, 'Header\n(7 earlier messages not shown)\n'
+                                 'User:message number 7\nUser:message number 8\n'
+                                 'User:message number 9\nFriday:')
+        self.assertEqual(report, {'Budget': 40, 'Items kept': 3, 'Items dropped': 7,
+                                  'Tokens trimmed': 39, 'Tokens': 36})
+
+
+class TraceTests(SimpleTestCase):
+    @override_settings(SLOW_MESSAGE_SECONDS=0)
+    def test_slow_message_log_hides_the_phone_number(self):
+        with self.assertLogs('friday_logger', level='WARNING') as logs:
+            with metrics.trace('process_msg', Sender=metrics.hash_id('+15550000001')):
+                metrics.set_state('Idle')
+
+        self.assertNotIn('5550000001', logs.output[0])
+        self.assertIn(metrics.hash_id('+15550000001'), logs.output[0])
+        self.assertNotEqual(metrics.hash_id('+15550000001'), metrics.hash_id('+15550000002'))
+
+
+class ForecastTests(TestCase):
+    def setUp(self):
+        self.user, created = User.get_or_register('+15550000007')
+        self.june = to_month_index(2022, 6)
+
+    def _make_curve(self):
+        def day_list(cents_dict):
+            return [cents_dict.get(day, 0) for day in range(1, SpendingCurve.DAYS + 1)]
+
+        # $10 on the 1st and the 20th for two months of Food, $10 on the 20th for a month of Gym
+        return SpendingCurve.objects.create(
+                user=self.user, first_month=self.june - 2, month=self.june,
+                first_months={'Food': self.june - 2, 'Gym': self.june - 1, 'Fun': self.june},
+                history={'Food': day_list({1: 2000, 20: 2000}), 'Gym': day_list({20: 1000})},
+                current={'Food': day_list({1: 1500}), 'Fun': day_list({4: 1000})})
+
+    def test_mid_month_projection(self):
+        forecast_dict = get_month_forecast(self._make_curve(), datetime.date(2022, 6, 10))
+
+        # Food adds half of its $20 average, Gym its $10 average since it started,
+        # Fun has no history and keeps its pace over the 30 days of June
+        self.assertEqual(forecast_dict, {
+                'Food': {'Spent': decimal.Decimal('15'), 'Projected': decimal.Decimal('25')},
+                'Gym': {'Spent': decimal.Decimal('0'), 'Projected': decimal.Decimal('10')},
+                'Fun': {'Spent': decimal.Decimal('10'), 'Projected': decimal.Decimal('30')}})
+
+    def test_pacing_of_budgeted_categories(self):
+        self._make_curve()
+        budget_list = [{'Category': 'Food', 'Allocated Budget': 20.0},
+                       {'Category': 'Fun', 'Allocated Budget': 50.0},
+                       {'Category': 'Other'}]
+
+        add_pacing(self.user, budget_list, datetime.date(2022, 6, 10))
+
+        self.assertEqual(budget_list[0]['Pacing'], 'On track to overspend Food by $5.00')
+        self.assertEqual(budget_list[1]['Pacing'], 'On track to stay $20.00 under budget')
+        self.assertEqual(budget_list[1]['Projected at month end'], 30.0)
+        self.assertEqual(budget_list[2], {'Category': 'Other'})
+
+    def test_first_transaction_of_a_month_moves_the_current_month_to_history(self):
+        self._make_curve()
+        self.user.add_transaction(Transaction(phone_number=self.user.phone_number, title='x',
+                                              transaction_cat='Fun', amount=5,
+                                              timestamp=timezone.make_aware(datetime.datetime(2022, 7, 3))))
+
+        curve = SpendingCurve.objects.get(user=self.user)
+        self.assertEqual(curve.month, self.june + 1)
+        self.assertEqual(curve.history['Food'][:2], [3500, 0])
+        self.assertEqual(curve.history['Fun'][3], 1000)
+        self.assertEqual(curve.current, {'Fun': [0, 0, 500] + [0] * (SpendingCurve.DAYS - 3)})
+        self.assertEqual(curve.first_months['Fun'], self.june)
+
+
+class SpendingSeriesTests(TestCase):
+    def setUp(self):
+        self.user, created = User.get_or_register('+15550000008')
+
+    @override_settings(TIME_ZONE='America/Toronto')
+    def test_monthly_grid_matches_the_ledger(self):
+        utc = datetime.timezone.utc
+        rows = [('Food', '12.10', datetime.datetime(2022, 1, 3, 15, tzinfo=utc)),
+                ('Food', '0.35', datetime.datetime(2022, 1, 20, 9, tzinfo=utc)),
+                # Still the 31st of January in Toronto
+                ('Health', '40.00', datetime.datetime(2022, 2, 1, 3, tzinfo=utc)),
+                ('Food', '7.99', datetime.datetime(2022, 2, 14, 18, tzinfo=utc)),
+                ('Housing', '900.00', datetime.datetime(2022, 3, 1, 12, tzinfo=utc))]
+        self.user.add_transactions([Transaction(phone_number=self.user.phone_number, title='x',
+                                                transaction_cat=category,
+                                                amount=decimal.Decimal(amount), timestamp=timestamp)
+                                    for category, amount, timestamp in rows])
+
+        ledger_dict = dict()
+        for transaction in self.user.transactions.all():
+            date = timezone.localtime(transaction.timestamp)
+            key = (date.year, date.month, transaction.transaction_cat)
+            ledger_dict[key] = ledger_dict.get(key, 0) + decimal.Decimal(str(transaction.amount))
+
+        series = SpendingSeries.load(self.user, datetime.date(2022, 1, 1), datetime.date(2022, 4, 1))
+        labels, grid = series.get_monthly()
+        grid_dict = dict()
+        for name, cents_list in zip(series.categories, grid.tolist()):
+            for label, cents in zip(labels.tolist(), cents_list):
+                if cents:
+                    grid_dict[from_month_index(label) + (name,)] = decimal.Decimal(cents) / 100
+
+        self.assertEqual(grid_dict, ledger_dict)
+        self.assertEqual(grid_dict[(2022, 1, 'Health')], decimal.Decimal('40'))
+        for year, month, category in ledger_dict:
+            self.assertEqual(self.user.get_transactions_total_by_category(month, year)[category],
+                             ledger_dict[(year, month, category)])
+
+
+class ReconcileCategoriesTests(TestCase):
+    def setUp(self):
+        self.user, created = User.get_or_register('+15550000009')
+
+    def _get_categories(self):
+        return dict((name, (pk, amount)) for name, pk, amount in
+                    self.user.budget_categories.values_list('category_name', 'pk', 'budget_amount'))
+
+    def test_only_changed_categories_are_written(self):
+        result = self.user.reconcile_categories({'Food': 100, 'Fun': 'N/A', 'Rent': 900})
+        self.assertEqual(result, {'Added': ['Food', 'Fun', 'Rent'], 'Updated': [], 'Removed': []})
+        categories = self._get_categories()
+
+        result = self.user.reconcile_categories({'Food': 100, 'Fun': 'N/A', 'Rent': 900})
+        self.assertEqual(result, {'Added': [], 'Updated': [], 'Removed': []})
+        self.assertEqual(self._get_categories(), categories)
+
+        result = self.user.reconcile_categories({'Food': 120, 'Rent': 900, 'Gym': 30})
+        self.assertEqual(result, {'Added': ['Gym'], 'Updated': ['Food'], 'Removed': ['Fun']})
+
+        new_categories = self._get_categories()
+        self.assertEqual(sorted(new_categories), ['Food', 'Gym', 'Rent'])
+        self.assertEqual(new_categories['Food'], (categories['Food'][0], decimal.Decimal('120')))
+        self.assertEqual(new_categories['Rent'], categories['Rent'])
+
+
+class CompactHistoryTests(TestCase):
+    def setUp(self):
+        self.user, created = User.get_or_register('+15550000012')
+        self.user.name = 'Ann'
+        self.user.save()
+
+    def test_old_messages_are_archived_and_summarized(self):
+        for day, message, author in ((1, 'hi', 'Ann'), (2, 'Hello!', ConvMsg.FRIDAY),
+                                     (3, 'I spent $5 on coffee', 'Ann'), (4, 'Got it', ConvMsg.FRIDAY),
+                                     (5, 'how much is left?', 'Ann'), (6, '$95', ConvMsg.FRIDAY),
+                                     (20, 'thanks', 'Ann')):
+            ConvMsg.objects.create(user=self.user, message=message, author=author,
+                                   phone_number=self.user.phone_number,
+                                   timestamp=timezone.make_aware(datetime.datetime(2022, 1, day)))
+
+        num_compacted = self.user.compact_history(timezone.make_aware(datetime.datetime(2022, 1, 10)), keep=2)
+
+        # The 6th is older than the cutoff but one of the latest two
+        self.assertEqual(num_compacted, 5)
+        self.assertEqual([msg['Message'] for msg in self.user.get_conversation()], ['$95', 'thanks'])
+        self.assertEqual(list(self.user.archived_msgs.order_by('timestamp').values_list('message', flat=True)),
+                         ['hi', 'Hello!', 'I spent $5 on coffee', 'Got it', 'how much is left?'])
+        self.assertEqual(self.user.get_conversation_summary(),
+                         'From 1/1/2022 to 1/5/2022 Ann sent 3 messages and Friday sent 2. '
+                         'Ann talked about: hi | I spent $5 on coffee | how much is left?')
+
+
+class CategoryInfoTests(TestCase):
+    def _count_summary_queries(self, phone_number, num_transactions):
+        user, created = User.get_or_register(phone_number)
+        user.reconcile_categories(dict(('Category %s' % i, 100) for i in range(10)))
+        today = timezone.now()
+        user.add_transactions([Transaction(phone_number=phone_number, title='x',
+                                           transaction_cat='Category %s' % (i % 10), amount=1,
+                                           timestamp=today)
+                               for i in range(num_transactions)])
+
+        with CaptureQueriesContext(connection) as context:
+            budget_list, total_spent, total_left, total_budget, status = \
+                    user.get_category_info_list(timezone.localdate().month)
+        self.assertEqual(total_spent, num_transactions)
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_grow_with_transactions(self):
+        self.assertEqual(self._count_summary_queries('+15550000013', 10),
+                         self._count_summary_queries('+15550000014', 1000))
+
+
+class ConversationTests(TestCase):
+    def setUp(self):
+        self.user, created = User.get_or_register('+15550000015')
+        for day in range(1, 6):
+            ConvMsg.objects.create(user=self.user, message='saved %s' % day, author='User',
+                                   phone_number=self.user.phone_number,
+                                   timestamp=timezone.make_aware(datetime.datetime(2022, 1, day)))
+
+    def _get_messages(self, limit):
+        return [msg['Message'] for msg in self.user.get_conversation(limit=limit)]
+
+    def test_limit_gets_the_latest_messages_in_order(self):
+        self.assertEqual(self._get_messages(3), ['saved 3', 'saved 4', 'saved 5'])
+        self.assertEqual(self._get_messages(10), ['saved %s' % day for day in range(1, 6)])
+
+    def test_limit_includes_messages_of_the_unit_of_work(self):
+        with UnitOfWork(self.user):
+            self.user.add_conversation_msg('pending 1', 'User')
+            self.user.add_conversation_msg('pending 2', ConvMsg.FRIDAY)
+
+            self.assertEqual(self._get_messages(4), ['saved 4', 'saved 5', 'pending 1', 'pending 2'])
+            self.assertEqual(self._get_messages(1), ['pending 2'])
+            self.assertEqual([msg['Message'] for msg in self.user.iter_conversation()][-3:],
+                             ['saved 5', 'pending 1', 'pending 2'])
+
+        self.assertEqual(self._get_messages(3), ['saved 5', 'pending 1', 'pending 2'])
+
+
+class IntentCacheTests(TestCase):
+    def setUp(self):
+        self.classified = list()
+
+    def _classify(self, text):
+        self.classified.append(text)
+        return 'TRA'
+
+    def test_rephrasings_hit_the_cache_until_they_expire(self):
+        cache = IntentCache(ttl=60)
+        self.assertEqual(cache.get_or_classify('Spent $12 on pizza', self._classify), 'TRA')
+        self.assertEqual(cache.get_or_classify('spent 30 on PIZZA!', self._classify), 'TRA')
+        # Another worker gets it from the database
+        self.assertEqual(IntentCache(ttl=60).get_or_classify('spent $5 on pizza', self._classify), 'TRA')
+        self.assertEqual(self.classified, ['Spent $12 on pizza'])
+        self.assertEqual(cache.get_stats(), {'Hits': 1, 'DB hits': 0, 'Misses': 1, 'Size': 1})
+
+        IntentCacheEntry.objects.update(updated_timestamp=timezone.now() - datetime.timedelta(seconds=120))
+        self.assertEqual(IntentCache(ttl=60).get_or_classify('spent $5 on pizza', self._classify), 'TRA')
+        self.assertEqual(self.classified, ['Spent $12 on pizza', 'spent $5 on pizza'])
+
+    def test_expired_entries_are_pruned(self):
+        now = timezone.now()
+        for key, age in (('old', 120), ('new', 10)):
+            IntentCacheEntry.objects.create(key=key, normalized_text=key, label='TRA')
+            IntentCacheEntry.objects.filter(key=key).update(
+                    updated_timestamp=now - datetime.timedelta(seconds=age))
+
+        call_command('prune_intent_cache', ttl=60, stdout=io.StringIO())
+
+        self.assertEqual(list(IntentCacheEntry.objects.values_list('key', flat=True)), ['new'])
@@ -0,0 +1,69 @@
+# Django imports
+from django.db import transaction as db_transaction
+
+# local imports
+import sms_app.metrics as metrics
+from sms_app.models import ConvMsg
+
+
+class UnitOfWork(object):
+    """
+    Buffers the writes of one message turn and saves them together at the end
+    While it is open the messages added to the user's histories are kept in memory,
+    the user's history getters include them, and on exit the messages and the
+    user's fields are saved with a bulk insert in one db transaction
+    """
+    # Fields of the user a turn changes, the others are written where they change
+    USER_FIELDS = ['name', 'state']
+
+    def __init__(self, user):
+        self.user = user
+        # List of (history name, ConvMsg) in the order they were added
+        self.pending_msgs = list()
+        self._is_outer = False
+        self._saved_values = self._get_user_values()
+
+    def __enter__(self):
+        # Nested units of work join the outer one
+        if self.user._unit_of_work is None:
+            self.user._unit_of_work = self
+            self._is_outer = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self._is_outer:
+            return False
+
+        # Saved even if the turn failed so the history shows what happened
+        self.user._unit_of_work = None
+        self.flush()
+        return False
+
+    def add_msg(self, history_name, conv):
+        self.pending_msgs.append((history_name, conv))
+
+    def get_pending_msgs(self, history_name):
+        return [conv for name, conv in self.pending_msgs if name == history_name]
+
+    def flush(self):
+        """
+        Saves the buffered writes
+        """
+        msgs = [conv for name, conv in self.pending_msgs]
+        # A full save would write back fields like data_version that are updated in the db
+        values = self._get_user_values()
+        changed_fields = [name for name in self.USER_FIELDS if values[name] != self._saved_values[name]]
+        if not msgs and not changed_fields:
+            return
+
+        with metrics.span('flush_writes'), db_transaction.atomic():
+            if msgs:
+                ConvMsg.objects.bulk_create(msgs)
+            if changed_fields:
+                self.user.save(update_fields=changed_fields)
+
+        self.pending_msgs = list()
+        self._saved_values = values
+
+    def _get_user_values(self):
+        return dict((name, getattr(self.user, name)) for name in self.USER_FIELDS)
@@ -1,5 +1,6 @@
 # Django imports
-from django.shortcuts import render
+from django.conf import settings
+from django.shortcuts import render, get_object_or_404
 from django.http import HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 
@@ -10,7 +11,8 @@ import json
 
 # local imports 
 import sms_app.sms_utilities.messaging as msgutil
-from sms_app.models import User
+import sms_app.metrics as metrics
+from sms_app.models import User, InboundMsg, RenderedChart
 from sms_app.nlp_engine.nlp_manager import NLP_Manager
 
 LOGGER = logging.getLogger('friday_logger')
@@ -23,27 +25,34 @@ def receive_msg(request):
         phone_num = sms['From'][0]
         msg = sms['Body'][0]
 
-        reply = process_msg(msg, phone_num)
+        if settings.SMS_PROCESS_INLINE:
+            process_msg(msg, phone_num)
+        else:
+            # Reply to Twilio right away, the worker sends the replies
+            InboundMsg.enqueue(phone_num, msg)
 
     response = json.dumps([{'Success': 'Message sent successfully!'}])
 
     return HttpResponse(response, content_type='text/json')
 
 def process_msg(received_msg, phone_num):
-    # Find the user
-    user = User.find_user_from_phone(phone_num)
+    # Time each stage, logged if the message is slow, without the phone number
+    with metrics.trace('process_msg', Sender=metrics.hash_id(phone_num)):
+        _process_msg(received_msg, phone_num)
+
+def _process_msg(received_msg, phone_num):
+    # Find the user, new phone numbers get a temp user with temp ID
+    with metrics.span('find_user'):
+        user, is_new = User.get_or_register(phone_num)
 
     # if user can't be found
-    if user is None:
+    if is_new:
+        metrics.set_state(NLP_Manager.STATE_TAGS[User.REG])
         # Prompt for username
         msg = NLP_Manager.get_first_time_greeting_msg()
         send_msg(msg, phone_num)
         msg = NLP_Manager.get_name_prompt_msg()
         send_msg(msg, phone_num)
-
-        # Create temp username with temp ID
-        user = User(phone_number=phone_num, state=User.REG)
-        user.save()
         return
 
     # if phone number is found
@@ -62,13 +71,38 @@ def process_msg(received_msg, phone_num):
             LOGGER.info(reply)
             send_msg(reply, phone_num)
         elif msg_type == NLP_Manager.MEDIA:
-            #TODO: send media
-            pass
+            LOGGER.info(reply)
+            send_media(reply, phone_num)
 
 
 
     #TODO: Integrate with OPENAI
 
+def chart_view(request, key):
+    """
+    Serves a rendered chart, fetched by Twilio for the media of an mms
+    """
+    chart = get_object_or_404(RenderedChart, key=key)
+
+    response = HttpResponse(bytes(chart.image), content_type=chart.content_type)
+    # The key is the hash of the content so it never changes
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response['ETag'] = '"%s"' % chart.key
+    return response
+
+def metrics_view(request):
+    """
+    Latency histograms of this process in the Prometheus text format, local clients only
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponse(status=403)
+
+    return HttpResponse(metrics.get_metrics_text(), content_type='text/plain; version=0.0.4')
+
 def send_msg(msg, phone_num):
-    msgutil.send_message(msg, phone_num)
+    with metrics.span('queue_send'):
+        msgutil.send_message(msg, phone_num)
 
+def send_media(media_url, phone_num):
+    with metrics.span('queue_send'):
+        msgutil.send_message('', phone_num, media_url=media_url)
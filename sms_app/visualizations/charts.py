@@ -0,0 +1,157 @@
+# Django imports
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Sum
+from django.urls import reverse
+from django.utils import timezone
+
+# System imports
+import decimal
+import hashlib
+import json
+import logging
+
+# local imports
+import sms_app.metrics as metrics
+from sms_app.analytics import SpendingSeries, to_dollars
+from sms_app.models import RenderedChart, UserChart
+import sms_app.visualizations.visualization_functions as vis
+
+LOGGER = logging.getLogger('friday_logger')
+
+# Change when the drawing changes so old images aren't served for new charts
+CHART_VERSION = 2
+
+PROGRESS = 'Progress'
+PIE = 'Pie'
+TIME = 'Time'
+
+# Kind of chart to the function drawing it
+RENDERERS = {
+    PROGRESS: vis.expendature_progress,
+    PIE: vis.piechart_visualization,
+    TIME: vis.time_graph_visualization,
+}
+
+# Order the charts of a user are sent in
+KINDS = [PIE, TIME, PROGRESS]
+
+
+def get_chart_key(kind, args):
+    """
+    Hashes the kind and arguments of a chart, the same chart always gets the same key
+    """
+    data = json.dumps({'Kind': kind, 'Args': args, 'Version': CHART_VERSION},
+                      sort_keys=True, default=_to_json)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+def render_chart(kind, *args):
+    """
+    Renders a chart unless one with the same content was rendered before
+    Returns its key
+    """
+    key = get_chart_key(kind, args)
+    if RenderedChart.objects.filter(key=key).exists():
+        return key
+
+    with metrics.span('render_chart'):
+        image = RENDERERS[kind](*args)
+
+    # Another worker may have rendered the same chart meanwhile
+    RenderedChart.objects.bulk_create([RenderedChart(key=key, kind=kind, image=image)],
+                                      ignore_conflicts=True)
+    return key
+
+def get_chart_url(key):
+    """
+    Gets the public url of a rendered chart, fetched by Twilio as the media of an mms
+    """
+    return '%s%s' % (settings.PUBLIC_BASE_URL.rstrip('/'), reverse('chart', args=[key]))
+
+def get_chart_media_url(kind, *args):
+    """
+    Renders a chart if needed and returns its public url
+    """
+    return get_chart_url(render_chart(kind, *args))
+
+def get_user_chart_urls(user):
+    """
+    Gets the public urls of the charts of the user for this month
+    Served from the charts prerendered at the user's data version, rendered now if there are none
+    """
+    today = timezone.localdate()
+    chart_list = list(UserChart.objects.filter(user=user, data_version=user.data_version,
+                                               year=today.year, month=today.month)
+                                       .values_list('kind', 'chart_id'))
+    if not chart_list:
+        chart_list = render_user_charts(user, today.year, today.month)
+
+    chart_list.sort(key=lambda chart: KINDS.index(chart[0]))
+    return [get_chart_url(key) for kind, key in chart_list]
+
+def get_user_chart_args(user, year, month):
+    """
+    Gets a list of the (kind, args) of the charts of the spending of the user in a month
+    """
+    chart_args = list()
+    series = SpendingSeries.load_month(user, year, month)
+
+    spent_dict = dict((name, total) for name, total in series.get_category_totals().items() if total > 0)
+    if spent_dict:
+        chart_args.append((PIE, (spent_dict,)))
+
+        days, daily_cents = series.get_daily()
+        spent_per_day = to_dollars(daily_cents.sum(axis=0)).tolist()
+        chart_args.append((TIME, (len(days), spent_per_day)))
+
+    total_budget = user.budget_categories.aggregate(total=Sum('budget_amount'))['total'] or 0
+    if total_budget > 0:
+        chart_args.append((PROGRESS, (total_budget, series.get_total())))
+
+    return chart_args
+
+def render_user_charts(user, year, month, executor=None):
+    """
+    Renders the charts of the spending of the user in a month that weren't rendered before
+    and saves them as the user's charts at its data version
+    The drawing is done in the executor if one is given
+    Returns a list of the (kind, key) of the charts
+    """
+    data_version = user.data_version
+    chart_args = get_user_chart_args(user, year, month)
+    chart_list = [(kind, get_chart_key(kind, args)) for kind, args in chart_args]
+
+    rendered_keys = set(RenderedChart.objects.filter(key__in=[key for kind, key in chart_list])
+                                             .values_list('key', flat=True))
+
+    image_dict = dict()
+    with metrics.span('render_chart'):
+        for (kind, args), (_, key) in zip(chart_args, chart_list):
+            if key in rendered_keys or key in image_dict:
+                continue
+            if executor is None:
+                image_dict[key] = RENDERERS[kind](*args)
+            else:
+                image_dict[key] = executor.submit(RENDERERS[kind], *args)
+
+        if executor is not None:
+            image_dict = dict((key, future.result()) for key, future in image_dict.items())
+
+    kind_dict = dict((key, kind) for kind, key in chart_list)
+    with db_transaction.atomic():
+        # Another worker may have rendered the same chart meanwhile
+        RenderedChart.objects.bulk_create([RenderedChart(key=key, kind=kind_dict[key], image=image)
+                                           for key, image in image_dict.items()],
+                                          ignore_conflicts=True)
+        UserChart.objects.filter(user=user, data_version__lt=data_version).delete()
+        UserChart.objects.bulk_create([UserChart(user=user, data_version=data_version,
+                                                 year=year, month=month, kind=kind, chart_id=key)
+                                       for kind, key in chart_list],
+                                      ignore_conflicts=True)
+
+    return chart_list
+
+def _to_json(value):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return str(value)
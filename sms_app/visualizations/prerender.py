@@ -0,0 +1,161 @@
+# Django imports
+from django.conf import settings
+from django.db import connection
+from django.dispatch import receiver
+from django.utils import timezone
+
+# System imports
+import atexit
+import concurrent.futures
+import logging
+import multiprocessing
+import threading
+
+# local imports
+import sms_app.metrics as metrics
+from sms_app.models import User, user_data_changed
+import sms_app.visualizations.charts as charts
+
+LOGGER = logging.getLogger('friday_logger')
+
+# Prerenderer of the process, one that does nothing unless start_prerenderer was called
+_PRERENDERER = None
+_PRERENDERER_LOCK = threading.Lock()
+
+
+class ChartPrerenderer(object):
+    """
+    Renders the charts of users in the background when their data changes so
+    inquiries get them from UserChart instead of drawing them while the user waits
+    One thread loads the data and saves the charts, the drawing is done in a pool of
+    processes since matplotlib holds the GIL. Changes to a user made while it waits
+    are rendered together. With 0 processes it does nothing
+    """
+    def __init__(self, max_processes=2):
+        self.max_processes = max_processes
+
+        self._lock = threading.Lock()
+        # Ids of the users waiting to be rendered
+        self._pending_ids = set()
+        self._futures = set()
+        self._is_shut_down = False
+
+        self._thread_pool = None
+        self._process_pool = None
+        if max_processes > 0:
+            self._thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            # Spawned since forking copies the db connections and threads of the server,
+            # the children only import visualization_functions
+            self._process_pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=max_processes, mp_context=multiprocessing.get_context('spawn'))
+
+    def schedule(self, user_id):
+        """
+        Renders the charts of the user in the background, does nothing if disabled
+        """
+        if self._thread_pool is None:
+            return None
+
+        with self._lock:
+            if self._is_shut_down or user_id in self._pending_ids:
+                return None
+            self._pending_ids.add(user_id)
+
+            future = self._thread_pool.submit(self._prerender_user, user_id)
+            self._futures.add(future)
+
+        future.add_done_callback(self._discard_future)
+        return future
+
+    def flush(self, timeout=None):
+        """
+        Waits for the scheduled charts to be rendered
+        """
+        with self._lock:
+            futures = list(self._futures)
+        concurrent.futures.wait(futures, timeout=timeout)
+
+    def shutdown(self, wait=True):
+        """
+        Stops rendering, the charts that weren't rendered yet are rendered when asked for
+        """
+        if self._thread_pool is None:
+            return
+
+        with self._lock:
+            self._is_shut_down = True
+            self._pending_ids.clear()
+
+        self._thread_pool.shutdown(wait=wait, cancel_futures=True)
+        self._process_pool.shutdown(wait=wait, cancel_futures=True)
+
+    # ------------------------
+    # Private helper functions
+    # ------------------------
+
+    def _discard_future(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def _prerender_user(self, user_id):
+        with self._lock:
+            self._pending_ids.discard(user_id)
+            if self._is_shut_down:
+                return
+
+        try:
+            user = User.objects.filter(pk=user_id).first()
+            if user is None:
+                return
+
+            today = timezone.localdate()
+            with metrics.span('prerender_charts'):
+                charts.render_user_charts(user, today.year, today.month, executor=self._process_pool)
+        except concurrent.futures.BrokenExecutor:
+            LOGGER.exception('Prerendering the charts of user %s failed', user_id)
+        except RuntimeError:
+            # The pools no longer take work once the process started exiting
+            LOGGER.info('Skipped prerendering the charts of user %s, the process is exiting', user_id)
+        except Exception:
+            # Inquiries render the charts themselves if these are missing
+            LOGGER.exception('Prerendering the charts of user %s failed', user_id)
+        finally:
+            connection.close()
+
+
+def get_prerenderer():
+    """
+    Gets the prerenderer of the process
+    """
+    global _PRERENDERER
+    with _PRERENDERER_LOCK:
+        if _PRERENDERER is None:
+            _PRERENDERER = ChartPrerenderer(0)
+        return _PRERENDERER
+
+def start_prerenderer():
+    """
+    Starts prerendering with the processes of the settings, called by the long running
+    server and worker processes so management commands and shells don't start a pool
+    The pools are shut down when the process exits
+    """
+    prerenderer = ChartPrerenderer(settings.CHART_PRERENDER_PROCESSES)
+    set_prerenderer(prerenderer)
+    atexit.register(prerenderer.shutdown)
+    return prerenderer
+
+def set_prerenderer(prerenderer):
+    """
+    Replaces the prerenderer of the process, used by benchmarks
+    """
+    global _PRERENDERER
+    with _PRERENDERER_LOCK:
+        _PRERENDERER = prerenderer
+
+
+@receiver(user_data_changed)
+def prerender_user_charts(sender, user, **kwargs):
+    """
+    Rerenders the charts of a user after its transactions or budget categories changed
+    """
+    get_prerenderer().schedule(user.pk)
@@ -1,33 +1,50 @@
-import matplotlib as plt
-import numpy as np
-from datetime import datetime
+import io
+
+# Only the Agg canvas is used, pyplot keeps global state that isn't safe in server threads
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+def _get_png(fig):
+  """
+  Renders a figure into PNG bytes in memory
+  """
+  FigureCanvasAgg(fig)
+  buffer = io.BytesIO()
+  fig.savefig(buffer, format='png', facecolor=fig.get_facecolor())
+  return buffer.getvalue()
+
+###################################################
 
 def expendature_progress(limit, current):
 
   """
-  Note: Requires Matplotlib and Numpy
+  Note: Requires Matplotlib
   Function: Uses a budget and spent value to visualize the amount spent in contrast to limit
+  Returns the chart as PNG bytes
 
   Ex. of use:
   expendature_progress(1000, 200)
   """
-  total = (int(current)/int(limit))*100
-  total_str = str(total) + "%"
-  fig, ax = plt.subplots(figsize=(6, 6))
+  total = (float(current)/float(limit))*100
+  total_str = '%.0f%%' % total
+  fig = Figure(figsize=(6, 6))
+  ax = fig.subplots()
   wedgeprops = {'width':0.3, 'edgecolor':'black', 'linewidth':3}
-  ax.pie([100-total,total], wedgeprops=wedgeprops, startangle=90, colors=['#5DADE2', '#515A5A'])
-  plt.title('Expendature Progress', fontsize=24, loc='center')
-  plt.text(0, 0, total_str, ha='center', va='center', fontsize=42)
-  plt.savefig('/openai_playground/Visualizations/images/Matplotlib_budget_progress_chart.png')
-  plt.show()
+  # Over budget shows a full ring
+  shown = min(max(total, 0), 100)
+  ax.pie([100-shown,shown], wedgeprops=wedgeprops, startangle=90, colors=['#5DADE2', '#515A5A'])
+  ax.set_title('Expendature Progress', fontsize=24, loc='center')
+  ax.text(0, 0, total_str, ha='center', va='center', fontsize=42)
+  return _get_png(fig)
 
 ###################################################
 
 def piechart_visualization(example_dict):
   """
-  Note: Requires Numpy & Matplotlib
+  Note: Requires Matplotlib
   Requires a dictionary with categories as the keys and costs as the values of the dictionary.
   Function: Creates a pie chart for visualizing expendature in each category
+  Returns the chart as PNG bytes
 
   Ex. of dictionary:
 
@@ -38,68 +55,49 @@ def piechart_visualization(example_dict):
 
     piechart_visualization(classify)
   """
-  cost = list(example_dict.values())
+  cost = [float(value) for value in example_dict.values()]
   category = list(example_dict.keys())
 
-  pieplt = np.array(cost)
-
-
-  fig = plt.figure()
+  fig = Figure()
   fig.patch.set_facecolor('black')
+  ax = fig.subplots()
 
-  plt.rcParams['text.color'] = 'white'
-
-  plt.pie(cost, autopct='%1.1f%%')
-  p=plt.gcf()
+  _, _, autotexts = ax.pie(cost, autopct='%1.1f%%')
+  for autotext in autotexts:
+    autotext.set_color('white')
 
-  plt.title("Total Expendature", fontsize=20)
-  p.legend(title = "Total Expendature:", labels=category, loc=4, facecolor="gray")
-  plt.savefig('/openai_playground/Visualizations/images/Matplotlib_pie_chart.png')
+  ax.set_title("Total Expendature", fontsize=20, color='white')
+  legend = fig.legend(title = "Total Expendature:", labels=category, loc=4, facecolor="gray")
+  legend.get_title().set_color('white')
+  for text in legend.get_texts():
+    text.set_color('white')
+  return _get_png(fig)
 
 
 ##########################################################################
 
-def time_graph_visualization(day_of_month, dictionaryOfMoneySpent):
+def time_graph_visualization(day_of_month, spent_per_day):
   """
-  Note: Requires matplotlib and datetime
+  Note: Requires matplotlib
   Function: Illustrates spending habits in a specified amount of time
+  Returns the chart as PNG bytes
 
-  Ex of data required: (dictionary)
+  Ex of data required: (list)
 
-  money_spent_per_day = {"01-23-2022": 40, 
-                  "01-15-2022": 98, 
-                  "01-04-2022": 94, 
-                  "01-18-2022": 87,
-                  "01-12-2022": 100,
-                  "01-06-2022": 19,
-                  "01-26-2022": 56}
+  money_spent_per_day = [0, 0, 0, 94, 0, 19, ...]
 
-  #Key Column represents the day. Value Column represents the money spent
-  #Note: All dates in dictionary must be in the same month
+  #Index i is the money spent on day i + 1 of the month, see analytics.SpendingSeries.get_daily
   time_graph_visualization(30, money_spent_per_day)
   """
-  money_spent = list(dictionaryOfMoneySpent.keys())
-  spent = list(dictionaryOfMoneySpent.values())
-  total_expense = sum(dictionaryOfMoneySpent.values())
-
-  day_list = []
-
-  for s in money_spent:
-    day_classifier = datetime.strptime(s, "%m-%d-%Y")
-    day = day_classifier.day
-    day_list.append(day)
-
-  days = []
-  for i in range(day_of_month + 1):
-    days.append(i)
-  days.remove(0)
-
-  matching = list(set(day_list) & set(days))
-
-  plt.clf()
-  plt.title('\$' + str(total_expense) + " Spent In The Last Month", fontsize=23, color='blue')
-  plt.plot(matching, spent, 'bo-')
-  plt.savefig('/openai_playground/Visualizations/images/Matplotlib_save_plot.png')
-
-
-
+  spent = [float(value) for value in spent_per_day[:day_of_month]]
+  total_expense = sum(spent)
+
+  # Only days with spending are plotted
+  matching = [day + 1 for day, value in enumerate(spent) if value != 0]
+
+  fig = Figure()
+  ax = fig.subplots()
+  ax.set_title('\\$' + ('%.2f' % total_expense) + " Spent In The Last Month", fontsize=23, color='blue')
+  ax.plot(matching, [spent[day - 1] for day in matching], 'bo-')
+  ax.set_xlim(1, day_of_month)
+  return _get_png(fig)